@@ -0,0 +1,346 @@
+import contextlib
+import io
+import json
+import re
+import shlex
+import sys
+import threading
+import time
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import click
+import yaml
+
+from panoptes_cli.forward import LOCAL_COMMANDS, forwardable
+from panoptes_cli.scheduler import fit_to_concurrency
+
+BATCH_CONCURRENCY = 4
+OPERATION_KEYS = ('id', 'command', 'depends_on')
+# e.g. {new_set.output}, which is replaced by that operation's output. {{ is
+# a literal {, so other braces (e.g. in JSON) can be passed through as they
+# are.
+PLACEHOLDER = re.compile(r'\{\{|\{([A-Za-z0-9_-]+)\.output\}')
+
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+class BatchError(Exception):
+    pass
+
+
+class Operation(object):
+    """
+    A command to run as part of a batch. **args** are its arguments, as they
+    would be given to ``panoptes``. It's run after the operations named in
+    **depends_on** (and any it uses the output of) have succeeded.
+    """
+
+    def __init__(self, number, args, name=None, depends_on=()):
+        self.number = number
+        self.args = list(args)
+        self.name = name
+        placeholders = [
+            match.group(1)
+            for arg in self.args
+            for match in PLACEHOLDER.finditer(arg)
+            if match.group(1)
+        ]
+        self.depends_on = list(depends_on)
+        for dependency in placeholders:
+            if dependency not in self.depends_on:
+                self.depends_on.append(dependency)
+
+    def result(self, status, args=None, output='', error='', seconds=0):
+        return {
+            'operation': self.number,
+            'id': self.name,
+            'command': self.args if args is None else args,
+            'status': status,
+            'output': output,
+            'error': error,
+            'seconds': round(seconds, 3),
+        }
+
+
+def read_operations(batch_file):
+    """
+    Reads operations from **batch_file**, which is either a YAML list or
+    JSON lines. Each operation is a mapping with a ``command`` (a list of
+    arguments or a string to be split like a shell would) and optionally an
+    ``id`` and a list of IDs it ``depends_on``, or just a command.
+
+    Raises :py:class:`BatchError` if they aren't valid.
+    """
+
+    text = batch_file.read()
+    try:
+        entries = yaml.safe_load(text)
+    except yaml.YAMLError:
+        entries = None
+    if not isinstance(entries, list):
+        entries = []
+        for line_number, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                entries.append(json.loads(line))
+            except ValueError as e:
+                raise BatchError('Line {}: {}'.format(line_number, e))
+
+    operations = []
+    names = set()
+    for number, entry in enumerate(entries, start=1):
+        operation = parse_operation(number, entry)
+        for dependency in operation.depends_on:
+            if dependency not in names:
+                raise BatchError(
+                    'Operation {} depends on {}, which isn\'t the id of an '
+                    'earlier operation.'.format(number, dependency)
+                )
+        if operation.name is not None:
+            if operation.name in names:
+                raise BatchError(
+                    'Operation {} has the same id as an earlier operation '
+                    '({}).'.format(number, operation.name)
+                )
+            names.add(operation.name)
+        operations.append(operation)
+    return operations
+
+
+def parse_operation(number, entry):
+    if not isinstance(entry, dict):
+        entry = {'command': entry}
+    unknown_keys = set(entry) - set(OPERATION_KEYS)
+    if unknown_keys:
+        raise BatchError('Operation {} has unknown keys: {}'.format(
+            number,
+            ', '.join(sorted(map(str, unknown_keys))),
+        ))
+
+    args = entry.get('command')
+    if isinstance(args, str):
+        args = shlex.split(args)
+    if not isinstance(args, list) or not args:
+        raise BatchError('Operation {} has no command.'.format(number))
+    args = [str(arg) for arg in args]
+    # The same commands as `panoptes serve` runs, except batches themselves
+    if not forwardable(args, LOCAL_COMMANDS + ('batch',)):
+        raise BatchError(
+            'Operation {} can\'t be run in a batch: {}'.format(
+                number,
+                ' '.join(args),
+            )
+        )
+
+    name = entry.get('id')
+    depends_on = entry.get('depends_on') or []
+    if not isinstance(depends_on, list):
+        depends_on = [depends_on]
+    return Operation(
+        number,
+        args,
+        name=None if name is None else str(name),
+        depends_on=[str(dependency) for dependency in depends_on],
+    )
+
+
+class BatchRunner(object):
+    """
+    Runs :py:class:`Operation` instances by calling ``command.main()``
+    (normally on the ``panoptes`` group) in this process, sharing **client**
+    between them. Up to **concurrency** operations run at once, each as soon
+    as the operations it depends on have succeeded. Operations which depend
+    on one which failed are skipped.
+
+    Each operation's output is captured, and placeholders like
+    ``{new_set.output}`` in its arguments are replaced with the output of
+    that operation (minus surrounding whitespace). ``{{`` is replaced with a
+    literal ``{``, and any other braces are left alone. Operations can't read
+    from stdin.
+
+    Example::
+
+        runner = BatchRunner(cli, Panoptes.client(), concurrency=8)
+        for result in runner.run(read_operations(batch_file)):
+            print(result['operation'], result['status'])
+    """
+
+    def __init__(self, command, client, concurrency=BATCH_CONCURRENCY):
+        self.command = command
+        self.client = client
+        self.concurrency = concurrency
+
+    def run(self, operations):
+        """
+        Yields a result dict for each operation, in the order they finish.
+        """
+
+        fit_to_concurrency(self.concurrency, self.client)
+        statuses = {}
+        outputs = {}
+        pending = list(operations)
+        in_flight = {}
+
+        with redirected_streams() as streams, ThreadPoolExecutor(
+            max_workers=self.concurrency,
+        ) as executor:
+            while pending or in_flight:
+                waiting = []
+                for operation in pending:
+                    dependency_statuses = [
+                        statuses[dependency]
+                        for dependency in operation.depends_on
+                        if dependency in statuses
+                    ]
+                    if any(
+                        status != SUCCEEDED for status in dependency_statuses
+                    ):
+                        if operation.name is not None:
+                            statuses[operation.name] = SKIPPED
+                        yield operation.result(
+                            SKIPPED,
+                            error='Skipped because an operation it depends '
+                            'on did not succeed.',
+                        )
+                    elif (
+                        len(dependency_statuses) < len(operation.depends_on)
+                        or len(in_flight) >= self.concurrency
+                    ):
+                        waiting.append(operation)
+                    else:
+                        args = [
+                            substitute_outputs(arg, outputs)
+                            for arg in operation.args
+                        ]
+                        future = executor.submit(
+                            self._run,
+                            streams,
+                            operation,
+                            args,
+                        )
+                        in_flight[future] = operation
+                pending = waiting
+                if not in_flight:
+                    continue
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    operation = in_flight.pop(future)
+                    result = future.result()
+                    if operation.name is not None:
+                        statuses[operation.name] = result['status']
+                        outputs[operation.name] = result['output'].strip()
+                    yield result
+
+    def _run(self, streams, operation, args):
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        status = FAILED
+        start = time.monotonic()
+        with self.client, streams.redirect(stdout, stderr):
+            try:
+                result = self.command.main(
+                    args=args,
+                    prog_name='panoptes',
+                    obj=self.client,
+                    standalone_mode=False,
+                )
+                # Commands return -1 when they fail
+                if result in (None, 0):
+                    status = SUCCEEDED
+            except click.ClickException as e:
+                e.show()
+            except click.Abort:
+                click.echo('Aborted!', err=True)
+            except Exception as e:
+                click.echo('Error: {}'.format(e), err=True)
+        return operation.result(
+            status,
+            args=args,
+            output=stdout.getvalue(),
+            error=stderr.getvalue(),
+            seconds=time.monotonic() - start,
+        )
+
+
+def substitute_outputs(arg, outputs):
+    """
+    Replaces the placeholders in **arg** with the **outputs** of the
+    operations they name, and ``{{`` with ``{``.
+    """
+
+    return PLACEHOLDER.sub(
+        lambda match: outputs[match.group(1)] if match.group(1) else '{',
+        arg,
+    )
+
+
+class ThreadLocalStream(object):
+    """
+    Stands in for a stream (e.g. ``sys.stdout``), passing everything on to
+    the stream set for the current thread by
+    :py:meth:`ThreadStreams.redirect`, or to **default** in other threads.
+    """
+
+    def __init__(self, default):
+        self.default = default
+        self._local = threading.local()
+
+    @property
+    def current(self):
+        return getattr(self._local, 'stream', self.default)
+
+    def __getattr__(self, name):
+        return getattr(self.current, name)
+
+
+class ThreadStreams(object):
+    def __init__(self):
+        self.stdin = ThreadLocalStream(sys.stdin)
+        self.stdout = ThreadLocalStream(sys.stdout)
+        self.stderr = ThreadLocalStream(sys.stderr)
+
+    @contextlib.contextmanager
+    def redirect(self, stdout, stderr):
+        """
+        Sends the current thread's output to **stdout** and **stderr**, and
+        gives it an empty stdin.
+        """
+
+        streams = (
+            (self.stdin, io.StringIO()),
+            (self.stdout, stdout),
+            (self.stderr, stderr),
+        )
+        for stand_in, stream in streams:
+            stand_in._local.stream = stream
+        try:
+            yield
+        finally:
+            for stand_in, _ in streams:
+                del stand_in._local.stream
+
+
+@contextlib.contextmanager
+def redirected_streams():
+    """
+    Replaces ``sys.stdin``, ``sys.stdout`` and ``sys.stderr`` with
+    :py:class:`ThreadLocalStream` stand-ins while in use, and yields the
+    :py:class:`ThreadStreams` which holds them.
+    """
+
+    saved = (sys.stdin, sys.stdout, sys.stderr)
+    streams = ThreadStreams()
+    sys.stdin, sys.stdout, sys.stderr = (
+        streams.stdin,
+        streams.stdout,
+        streams.stderr,
+    )
+    try:
+        yield streams
+    finally:
+        sys.stdin, sys.stdout, sys.stderr = saved
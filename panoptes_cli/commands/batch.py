@@ -0,0 +1,90 @@
+import json
+
+import click
+
+from panoptes_cli.batch import (
+    BATCH_CONCURRENCY,
+    FAILED,
+    SKIPPED,
+    SUCCEEDED,
+    BatchError,
+    BatchRunner,
+    read_operations,
+)
+from panoptes_cli.scripts.panoptes import cli
+from panoptes_client import Panoptes
+
+
+@cli.command()
+@click.argument('batch-file', type=click.File('r'))
+@click.option(
+    '--concurrency',
+    '-c',
+    help=(
+        "Number of operations to run at once. Defaults to {}."
+    ).format(BATCH_CONCURRENCY),
+    type=click.IntRange(min=1),
+    default=BATCH_CONCURRENCY,
+)
+@click.option(
+    '--results-file',
+    '-r',
+    help=(
+        "File to write the result of each operation to, as JSON lines. "
+        "Defaults to stdout."
+    ),
+    type=click.File('w'),
+    default='-',
+)
+@click.pass_context
+def batch(ctx, batch_file, concurrency, results_file):
+    """
+    Runs a file of commands in one process.
+
+    BATCH_FILE is a YAML list (or JSON lines) of operations. Each one has a
+    command, given as it would be to panoptes, and optionally an id. Its
+    output can be used in later commands as {ID.output}, and those commands
+    then wait for it to succeed. Write {{ for a literal { before something
+    which would otherwise be replaced. Use depends_on to wait for other
+    operations too. Everything else runs at the same time, up to
+    --concurrency operations at once.
+
+    \b
+    - id: new_set
+      command: subject-set create --quiet 2797 "Set 1"
+    - command: workflow add-subject-sets 18706 {new_set.output}
+    - command: [subject-set, modify, "{new_set.output}", -n, "Renamed set"]
+
+    Commands can't prompt for input, so use --force where needed. Operations
+    which depend on one which failed are skipped. The result of each
+    operation, including its output, is written to --results-file as it
+    finishes.
+    """
+
+    try:
+        operations = read_operations(batch_file)
+    except BatchError as e:
+        click.echo('Error: {}'.format(e), err=True)
+        return -1
+
+    runner = BatchRunner(
+        ctx.find_root().command,
+        Panoptes.client(),
+        concurrency=concurrency,
+    )
+    counts = {SUCCEEDED: 0, FAILED: 0, SKIPPED: 0}
+    for result in runner.run(operations):
+        counts[result['status']] += 1
+        results_file.write(json.dumps(result) + '\n')
+        results_file.flush()
+
+    click.echo(
+        'Succeeded {}, failed {}, skipped {}.'.format(
+            counts[SUCCEEDED],
+            counts[FAILED],
+            counts[SKIPPED],
+        ),
+        err=True,
+    )
+    if counts[FAILED] or counts[SKIPPED]:
+        return -1
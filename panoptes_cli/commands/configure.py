@@ -2,7 +2,9 @@ import click
 import os
 import yaml
 
+from panoptes_cli.config import DEFAULT_CONFIG, read_config_file
 from panoptes_cli.scripts.panoptes import cli
+from panoptes_cli.token_cache import TOKEN_CACHE_FILE, TokenCache
 
 @cli.command()
 @click.pass_context
@@ -16,13 +18,19 @@ from panoptes_cli.scripts.panoptes import cli
     is_flag=True
 )
 def configure(ctx, edit_all):
-    """Sets default values for configuration options."""
+    """
+    Sets default values for configuration options.
+
+    Only your username and password are asked for, unless --edit-all is
+    given. Options which are left at their defaults aren't saved, so they
+    follow the defaults of later versions.
+    """
 
     if not os.path.isdir(ctx.parent.config_dir):
         os.mkdir(ctx.parent.config_dir)
 
     for opt, value in ctx.parent.config.items():
-        if opt == 'endpoint' and not edit_all:
+        if opt not in ('username', 'password') and not edit_all:
             continue
 
         is_password = opt == 'password'
@@ -39,5 +47,13 @@ def configure(ctx, edit_all):
         )
         return -1
 
+    saved_config = read_config_file(ctx.parent.config_file)
+    for opt, value in ctx.parent.config.items():
+        if opt in saved_config or value != DEFAULT_CONFIG.get(opt):
+            saved_config[opt] = value
+
     with open(ctx.parent.config_file, 'w') as conf_f:
-        yaml.dump(ctx.parent.config, conf_f, default_flow_style=False)
+        yaml.dump(saved_config, conf_f, default_flow_style=False)
+
+    # Tokens for the old login shouldn't be used any more
+    TokenCache(os.path.join(ctx.parent.config_dir, TOKEN_CACHE_FILE)).clear()
@@ -0,0 +1,227 @@
+import csv
+import io
+
+import click
+
+from panoptes_cli.convert import (
+    CONVERT_BATCH_ROWS,
+    CONVERT_FORMATS,
+    ConvertError,
+    convert_export,
+)
+from panoptes_cli.download import (
+    Downloader,
+    get_export_url,
+    show_progress,
+)
+from panoptes_cli.export_filter import decompressed
+from panoptes_cli.export_store import ClassificationStore, ExportStoreError
+from panoptes_cli.resource_cache import cached_find
+from panoptes_cli.scripts.panoptes import cli
+from panoptes_client import Project, SubjectSet, Workflow
+
+
+@cli.group()
+def export():
+    """Contains commands for working with data exports."""
+    pass
+
+
+@export.command()
+@click.argument('store-file', required=True, type=click.Path(dir_okay=False))
+@click.option(
+    '--project-id',
+    '-p',
+    help="Sync the classifications export for the given project.",
+    type=int,
+)
+@click.option(
+    '--workflow-id',
+    '-w',
+    help="Sync the classifications export for the given workflow.",
+    type=int,
+)
+@click.option(
+    '--subject-set-id',
+    '-s',
+    help="Sync the classifications export for the given subject set.",
+    type=int,
+)
+@click.option(
+    '--generate',
+    '-g',
+    help="Generates a new export before downloading.",
+    is_flag=True
+)
+@click.option(
+    '--generate-timeout',
+    '-T',
+    help=(
+        "Time in seconds to wait for new export to be ready. Defaults to "
+        "unlimited. Has no effect unless --generate is given."
+    ),
+    required=False,
+    type=int,
+)
+def sync(
+    store_file,
+    project_id,
+    workflow_id,
+    subject_set_id,
+    generate,
+    generate_timeout,
+):
+    """
+    Adds new classifications from an export to a local SQLite database.
+
+    STORE_FILE is created if it doesn't exist. Each time you run this, only
+    classifications which are newer than the last sync (by classification ID)
+    are added, so a store can be kept up to date with a daily export:
+
+    $ panoptes export sync --workflow-id 18706 --generate classifications.db
+
+    Classifications from several projects, workflows and subject sets can be
+    kept in the same store. Each classification is only stored once, in the
+    "classifications" table, which has a column for each column of the
+    export.
+    """
+
+    sources = [
+        (Project, 'project', project_id),
+        (Workflow, 'workflow', workflow_id),
+        (SubjectSet, 'subject set', subject_set_id),
+    ]
+    sources = [source for source in sources if source[2]]
+    if len(sources) != 1:
+        click.echo(
+            'Error: Give exactly one of --project-id, --workflow-id and '
+            '--subject-set-id.',
+            err=True,
+        )
+        return -1
+    exportable_class, source_type, source_id = sources[0]
+    source = '{} {}'.format(source_type, source_id)
+
+    exportable = cached_find(exportable_class, source_id)
+    if generate:
+        click.echo("Generating new export...", err=True)
+    downloader = Downloader(get_export_url(
+        exportable,
+        'classifications',
+        generate=generate,
+        wait_timeout=generate_timeout,
+    ))
+    downloader.probe()
+
+    store = ClassificationStore(store_file)
+    bad_rows = []
+    try:
+        with show_progress(downloader), downloader.open() as stream:
+            reader = csv.reader(io.TextIOWrapper(
+                decompressed(stream, downloader.buffer_size),
+                encoding='utf-8',
+                newline='',
+            ))
+            added = store.sync(
+                source,
+                reader,
+                on_bad_row=lambda row_number, row: bad_rows.append(
+                    str(row_number)
+                ),
+            )
+    except ExportStoreError as e:
+        click.echo('Error: {}'.format(e), err=True)
+        return -1
+    finally:
+        store.close()
+
+    if bad_rows:
+        click.echo(
+            'Warning: {} rows of the export did not match its header, so '
+            'they were padded, truncated or (without a classification ID) '
+            'skipped: {}'.format(len(bad_rows), ', '.join(bad_rows)),
+            err=True,
+        )
+    click.echo(
+        'Added {} new classifications from {}.'.format(added, source),
+        err=True,
+    )
+
+
+@export.command()
+@click.argument(
+    'input-file',
+    required=True,
+    type=click.Path(exists=True, dir_okay=False, allow_dash=True),
+)
+@click.argument('output-file', required=True, type=click.Path(dir_okay=False))
+@click.option(
+    '--format',
+    '-f',
+    'output_format',
+    help="Format of the output file. Defaults to parquet.",
+    type=click.Choice(CONVERT_FORMATS),
+    default=CONVERT_FORMATS[0],
+)
+@click.option(
+    '--annotations-file',
+    '-a',
+    help=(
+        "Also write a file with a row for each annotation (classification "
+        "ID, task, task label and value)."
+    ),
+    type=click.Path(dir_okay=False),
+)
+@click.option(
+    '--batch-size',
+    '-b',
+    help=(
+        "Number of rows to convert at a time. Larger batches are faster but "
+        "use more memory. Defaults to {}."
+    ).format(CONVERT_BATCH_ROWS),
+    type=click.IntRange(min=1),
+    default=CONVERT_BATCH_ROWS,
+)
+def convert(
+    input_file,
+    output_file,
+    output_format,
+    annotations_file,
+    batch_size,
+):
+    """
+    Converts a classifications export to a columnar file.
+
+    INPUT_FILE is a CSV classifications export (which may be gzipped), or -
+    to read from stdin. It is read a batch of rows at a time, so exports of
+    any size can be converted.
+
+    The metadata, annotations and subject_data columns are kept as JSON, and
+    the most useful parts of them are also split out into typed columns,
+    such as metadata.started_at and subject_data.subject_id. Use
+    --annotations-file to get a separate table of annotations as well:
+
+    $ panoptes export convert -a annotations.parquet export.csv export.parquet
+
+    This requires pyarrow, which can be installed with:
+
+    $ pip install panoptescli[convert]
+    """
+
+    try:
+        with click.open_file(input_file, 'rb') as source:
+            converted = convert_export(
+                decompressed(source),
+                output_file,
+                output_format=output_format,
+                annotations_path=annotations_file,
+                batch_rows=batch_size,
+            )
+    except ConvertError as e:
+        click.echo('Error: {}'.format(e), err=True)
+        return -1
+
+    click.echo(
+        'Converted {} classifications.'.format(converted),
+        err=True,
+    )
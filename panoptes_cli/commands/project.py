@@ -1,7 +1,14 @@
-import yaml
-
 import click
 
+from panoptes_cli.deletion import delete_options, delete_resources
+from panoptes_cli.download import (
+    DOWNLOAD_BUFFER_SIZE,
+    DOWNLOAD_CONNECTIONS,
+    download_export,
+)
+from panoptes_cli.export_filter import ExportFilterError, filter_options
+from panoptes_cli.output import echo_raw, get_emitter
+from panoptes_cli.resource_cache import cached_find, invalidate_cached
 from panoptes_cli.scripts.panoptes import cli
 from panoptes_client import Project
 
@@ -65,7 +72,12 @@ def ls(project_id, display_name, launch_approved, slug, quiet, search):
         search=" ".join(search)
     )
 
-    if quiet:
+    emitter = get_emitter()
+    if emitter:
+        emitter.emit_all(
+            {'id': p.id} if quiet else project_record(p) for p in projects
+        )
+    elif quiet:
         click.echo(" ".join([p.id for p in projects]))
     else:
         for project in projects:
@@ -75,8 +87,8 @@ def ls(project_id, display_name, launch_approved, slug, quiet, search):
 @project.command()
 @click.argument('project-id', required=True)
 def info(project_id):
-    project = Project.find(project_id)
-    click.echo(yaml.dump(project.raw))
+    project = cached_find(Project, project_id)
+    echo_raw(project.raw)
 
 
 @project.command()
@@ -162,11 +174,16 @@ def modify(project_id, display_name, description, primary_language, public):
     if public is not None:
         project.private = not public
     project.save()
+    invalidate_cached(project)
     echo_project(project)
 
 @project.command()
 @click.argument('project-id', required=True, type=int)
-@click.argument('output-file', required=True, type=click.File('wb'))
+@click.argument(
+    'output-file',
+    required=True,
+    type=click.Path(dir_okay=False, allow_dash=True),
+)
 @click.option(
     '--generate',
     '-g',
@@ -194,55 +211,89 @@ def modify(project_id, display_name, description, primary_language, public):
         'talk_tags']),
     default='classifications'
 )
-def download(project_id, output_file, generate, generate_timeout, data_type):
+@click.option(
+    '--connections',
+    '-c',
+    help=(
+        "Number of connections to download the export over. Defaults to "
+        "{}."
+    ).format(DOWNLOAD_CONNECTIONS),
+    type=click.IntRange(min=1),
+    default=DOWNLOAD_CONNECTIONS,
+)
+@click.option(
+    '--buffer-size',
+    '-b',
+    help=(
+        "Size of the buffer used by each connection, in KiB. Defaults to {}."
+    ).format(DOWNLOAD_BUFFER_SIZE // 1024),
+    type=click.IntRange(min=1),
+    default=DOWNLOAD_BUFFER_SIZE // 1024,
+)
+@filter_options
+def download(
+    project_id,
+    output_file,
+    generate,
+    generate_timeout,
+    data_type,
+    connections,
+    buffer_size,
+    export_filter,
+):
     """
     Downloads project-level data exports.
 
     OUTPUT_FILE will be overwritten if it already exists. Set OUTPUT_FILE to -
     to output to stdout.
-    """
 
-    project = Project.find(project_id)
+    Exports are downloaded over several connections at once. If a download is
+    interrupted, run the same command again to resume it.
 
-    if generate:
-        click.echo("Generating new export...", err=True)
+    Use the filter options to only save some of the rows and columns of a CSV
+    export. The export is then filtered as it downloads, over a single
+    connection:
 
-    export = project.get_export(
-        data_type,
-        generate=generate,
-        wait_timeout=generate_timeout
-    )
+    $ panoptes project download --created-after 2024-01-01 2797 out.csv
+    """
 
-    with click.progressbar(
-        export.iter_content(chunk_size=1024),
-        label='Downloading',
-        length=(int(export.headers.get('content-length')) / 1024 + 1),
-        file=click.get_text_stream('stderr'),
-    ) as chunks:
-        for chunk in chunks:
-            output_file.write(chunk)
+    project = cached_find(Project, project_id)
+    try:
+        download_export(
+            project,
+            data_type,
+            output_file,
+            generate=generate,
+            generate_timeout=generate_timeout,
+            connections=connections,
+            buffer_size=buffer_size * 1024,
+            export_filter=export_filter,
+        )
+    except ExportFilterError as e:
+        click.echo('Error: {}'.format(e), err=True)
+        return -1
 
 
 @project.command()
-@click.option(
-    '--force',
-    '-f',
-    is_flag=True,
-    help='Delete without asking for confirmation.',
-)
-@click.argument('project-ids', required=True, nargs=-1, type=int)
-def delete(force, project_ids):
-    for project_id in project_ids:
-        project = Project.find(project_id)
-        if not force:
-            click.confirm(
-                'Delete project {} ({})?'.format(
-                    project_id,
-                    project.display_name,
-                ),
-                abort=True,
-            )
-        project.delete()
+@delete_options
+@click.argument('project-ids', nargs=-1, type=int)
+def delete(force, id_file, concurrency, report_file, project_ids):
+    """
+    Deletes projects.
+
+    Deletes are made --concurrency at a time. Unless --force is given, each
+    project is shown and must be confirmed first.
+    """
+
+    return delete_resources(
+        Project,
+        project_ids,
+        id_file,
+        force,
+        concurrency,
+        report_file,
+        describe_with='display_name',
+    )
 
 
 def echo_project(project):
@@ -253,3 +304,12 @@ def echo_project(project):
             project.slug,
             project.display_name)
     )
+
+
+def project_record(project):
+    return {
+        'id': project.id,
+        'slug': project.slug,
+        'display_name': project.display_name,
+        'private': project.private,
+    }
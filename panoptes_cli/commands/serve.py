@@ -0,0 +1,66 @@
+import os
+import signal
+
+import click
+
+from panoptes_cli.forward import SERVE_SOCKET
+from panoptes_cli.scripts.panoptes import cli
+from panoptes_cli.server import CommandServer, ServeError
+from panoptes_client import Panoptes
+
+
+@cli.command()
+@click.option(
+    '--idle-timeout',
+    '-t',
+    help=(
+        "Stops after this many seconds without a command. Defaults to "
+        "running until stopped."
+    ),
+    type=click.IntRange(min=0),
+    default=0,
+)
+@click.pass_context
+def serve(ctx, idle_timeout):
+    """
+    Runs other panoptes commands, so they start faster.
+
+    While this is running, panoptes commands started by the same user are
+    passed to it to run, instead of starting from scratch. It stays logged in
+    and keeps its connections to the API open, so each command starts in
+    milliseconds rather than seconds. Commands are run one at a time.
+
+    configure, and commands which set global options other than --format and
+    --no-cache, still run on their own. Restart this after running configure.
+
+    $ panoptes serve --idle-timeout 600 &
+    """
+
+    root = ctx.find_root()
+    if not os.path.isdir(root.config_dir):
+        os.mkdir(root.config_dir)
+
+    server = CommandServer(
+        os.path.join(root.config_dir, SERVE_SOCKET),
+        root.command,
+        Panoptes.client(),
+        idle_timeout=idle_timeout,
+    )
+    try:
+        server.listen()
+    except ServeError as e:
+        click.echo('Error: {}'.format(e), err=True)
+        return -1
+    click.echo('Serving commands on {}'.format(server.path), err=True)
+
+    # Stop serving, rather than just interrupting the current command
+    def stop(signum, frame):
+        server.stopping = True
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
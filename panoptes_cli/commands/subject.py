@@ -1,8 +1,26 @@
+import collections
 import csv
-import yaml
+import os
 
 import click
 
+from panoptes_cli.deletion import delete_options, delete_resources
+from panoptes_cli.listing import (
+    LIST_CONCURRENCY,
+    LIST_PAGE_SIZE,
+    find_many,
+    list_pages,
+    read_ids,
+)
+from panoptes_cli.metadata import (
+    FAILED,
+    MISSING,
+    SAVE_CONCURRENCY,
+    UNCHANGED,
+    UPDATED,
+    MetadataUpdater,
+)
+from panoptes_cli.output import echo_raw, get_emitter
 from panoptes_cli.scripts.panoptes import cli
 from panoptes_client import Subject
 
@@ -28,49 +46,141 @@ def subject():
     is_flag=True,
     help="Only print subject IDs (omit media URLs).",
 )
+@click.option(
+    "--page-size",
+    help=(
+        "Number of subjects to fetch in each request. Defaults to {}."
+    ).format(LIST_PAGE_SIZE),
+    type=click.IntRange(min=1),
+    default=LIST_PAGE_SIZE,
+)
+@click.option(
+    "--concurrency",
+    "-c",
+    help=(
+        "Number of pages to fetch at once. Defaults to {}."
+    ).format(LIST_CONCURRENCY),
+    type=click.IntRange(min=1),
+    default=LIST_CONCURRENCY,
+)
+@click.option(
+    "--id-file",
+    help="List the subjects with IDs in the given file, one ID per line.",
+    type=click.File("r"),
+)
 @click.argument("subject-ids", type=int, required=False, nargs=-1)
-def ls(subject_set_id, quiet, subject_ids):
+def ls(subject_set_id, quiet, page_size, concurrency, id_file, subject_ids):
     """
     Lists subject IDs and their media URLs.
+
+    Subjects in a subject set are fetched several pages at a time, and
+    printed in order as they arrive. Subjects given by ID (as arguments or
+    with --id-file) are looked up in batches of --page-size, and printed in
+    the order they were given.
     """
 
-    if subject_ids:
-        for subject_id in subject_ids:
-            subject = Subject.find(subject_id)
-            if quiet:
+    emitter = get_emitter()
+
+    if subject_ids or id_file:
+        missing = []
+        for subject in found_subjects(
+            read_ids(subject_ids, id_file),
+            missing,
+            chunk_size=page_size,
+            concurrency=concurrency,
+        ):
+            if emitter:
+                emitter.emit(
+                    {'id': subject.id} if quiet else subject_record(subject)
+                )
+            elif quiet:
                 click.echo(subject.id)
             else:
                 echo_subject(subject)
+        if missing:
+            return -1
+        return
+
+    pages = list_pages(
+        Subject,
+        page_size=page_size,
+        concurrency=concurrency,
+        subject_set_id=subject_set_id,
+    )
+    if emitter:
+        for page in pages:
+            emitter.emit_all(
+                {'id': s.id} if quiet else subject_record(s) for s in page
+            )
         return
 
-    subjects = Subject.where(subject_set_id=subject_set_id)
+    separator = ""
+    for page in pages:
+        if quiet:
+            if page:
+                click.echo(separator + " ".join(s.id for s in page), nl=False)
+                separator = " "
+        else:
+            for subject in page:
+                echo_subject(subject)
     if quiet:
-        click.echo(" ".join([s.id for s in subjects]))
-    else:
-        for subject in subjects:
-            echo_subject(subject)
+        click.echo()
 
 
 @subject.command()
-@click.argument("subject-id", required=True)
-def info(subject_id):
-    subject = Subject.find(subject_id)
-    click.echo(yaml.dump(subject.raw))
+@click.option(
+    "--id-file",
+    help="Show the subjects with IDs in the given file, one ID per line.",
+    type=click.File("r"),
+)
+@click.argument("subject-ids", type=int, required=False, nargs=-1)
+def info(id_file, subject_ids):
+    """
+    Shows everything about the given subjects.
+
+    Subjects are looked up in batches, and shown in the order they were
+    given.
+    """
+
+    if not subject_ids and not id_file:
+        raise click.UsageError("Give at least one subject ID, or --id-file.")
+
+    missing = []
+    emitter = get_emitter()
+    separator = False
+    for subject in found_subjects(read_ids(subject_ids, id_file), missing):
+        if emitter:
+            emitter.emit(subject.raw)
+            continue
+        if separator:
+            click.echo("---")
+        echo_raw(subject.raw)
+        separator = True
+    if missing:
+        return -1
 
 
 @subject.command()
-@click.option(
-    "--force",
-    "-f",
-    is_flag=True,
-    help="Delete without asking for confirmation.",
-)
-@click.argument("subject-ids", required=True, nargs=-1, type=int)
-def delete(force, subject_ids):
-    for subject_id in subject_ids:
-        if not force:
-            click.confirm("Delete subject {}?".format(subject_id), abort=True)
-        Subject.find(subject_id).delete()
+@delete_options
+@click.argument("subject-ids", nargs=-1, type=int)
+def delete(force, id_file, concurrency, report_file, subject_ids):
+    """
+    Deletes subjects.
+
+    Deletes are made --concurrency at a time. To delete many subjects, list
+    their IDs in a file (or pipe them in) and skip the confirmations:
+
+    $ panoptes subject delete --force --id-file - < subject-ids.txt
+    """
+
+    return delete_resources(
+        Subject,
+        subject_ids,
+        id_file,
+        force,
+        concurrency,
+        report_file,
+    )
 
 
 @subject.command()
@@ -80,36 +190,132 @@ def delete(force, subject_ids):
     is_flag=True,
     help="Replace all existing metadata rather than merging.",
 )
+@click.option(
+    "--concurrency",
+    "-c",
+    help=(
+        "Number of subjects to save at once. Defaults to {}."
+    ).format(SAVE_CONCURRENCY),
+    type=click.IntRange(min=1),
+    default=SAVE_CONCURRENCY,
+)
+@click.option(
+    "--failures-file",
+    "-F",
+    help=(
+        "Where to write the rows which couldn't be updated. Defaults to the "
+        "name of the metadata file with -failed added."
+    ),
+    type=click.Path(dir_okay=False),
+)
 @click.argument("metadata-file", required=True, nargs=1)
-def update_metadata(replace, metadata_file):
+def update_metadata(replace, concurrency, failures_file, metadata_file):
     """
     Updates subject metadata from a CSV file.
 
     The CSV file should contain a "subject_id" column listing subject IDs.
     All other column names are taken to be metadata keys.
+
+    Subjects are fetched in batches and saved several at a time. Subjects
+    whose metadata wouldn't change aren't saved. Any rows which fail are
+    written to a failures file, in the same format, so that they can be
+    retried by running this again with that file.
     """
-    with open(metadata_file, "r") as metadata_f:
-        total_tows = len(metadata_f.readlines())
-        metadata_f.seek(0)
+
+    if not failures_file:
+        name, extension = os.path.splitext(metadata_file)
+        failures_file = "{}-failed{}".format(name, extension or ".csv")
+    if os.path.abspath(failures_file) == os.path.abspath(metadata_file):
+        click.echo(
+            "Error: The failures file can't be the metadata file.",
+            err=True,
+        )
+        return -1
+
+    counts = collections.Counter()
+    failures_f = None
+    failures = None
+    with open(metadata_file, "r", newline="") as metadata_f:
         metadata_rows = csv.DictReader(metadata_f)
-        with click.progressbar(
-            metadata_rows,
-            length=total_tows,
-            label="Update subject metadata",
-        ) as _metadata_rows:
-            for metadata in _metadata_rows:
-                subject_id = metadata.pop("subject_id")
-                try:
-                    subject = Subject.find(subject_id)
-                    if replace:
-                        subject.metadata = dict(metadata)
-                    else:
-                        subject.metadata.update(metadata)
-                    subject.save()
-                except Exception as e:
-                    click.echo(f"Failed to update subject {subject_id}: {e}", err=True)
+        if "subject_id" not in (metadata_rows.fieldnames or []):
+            click.echo(
+                'Error: The CSV file has no "subject_id" column.',
+                err=True,
+            )
+            return -1
+
+        updater = MetadataUpdater(replace=replace, concurrency=concurrency)
+        try:
+            with click.progressbar(
+                updater.update(metadata_rows),
+                label="Update subject metadata",
+            ) as results:
+                for row, status, error in results:
+                    counts[status] += 1
+                    if status == MISSING:
+                        error = "Subject not found"
+                    if status not in (MISSING, FAILED):
+                        continue
+                    click.echo(
+                        "Failed to update subject {}: {}".format(
+                            row["subject_id"],
+                            error,
+                        ),
+                        err=True,
+                    )
+                    if failures is None:
+                        failures_f = open(failures_file, "w", newline="")
+                        failures = csv.DictWriter(
+                            failures_f,
+                            fieldnames=metadata_rows.fieldnames,
+                        )
+                        failures.writeheader()
+                    failures.writerow(row)
+        finally:
+            if failures_f:
+                failures_f.close()
+
+    click.echo(
+        "Updated {}, unchanged {}, failed {}.".format(
+            counts[UPDATED],
+            counts[UNCHANGED],
+            counts[MISSING] + counts[FAILED],
+        ),
+        err=True,
+    )
+    if failures:
+        click.echo(
+            "Rows which failed were written to {}".format(failures_file),
+            err=True,
+        )
+        return -1
 
 
 def echo_subject(subject):
     m = map(lambda l: list(l.values())[0], subject.locations)
     click.echo("{} {}".format(subject.id, " ".join(m)))
+
+
+def subject_record(subject):
+    return {
+        "id": subject.id,
+        "locations": [list(l.values())[0] for l in subject.locations],
+    }
+
+
+def found_subjects(subject_ids, missing, **kwargs):
+    """
+    Looks up **subject_ids** with :py:func:`find_many` and yields the
+    subjects which exist. Any which don't are reported, and added to
+    **missing**.
+    """
+
+    for subject_id, subject in find_many(Subject, subject_ids, **kwargs):
+        if subject is None:
+            click.echo(
+                "Error: Subject {} not found.".format(subject_id),
+                err=True,
+            )
+            missing.append(subject_id)
+        else:
+            yield subject
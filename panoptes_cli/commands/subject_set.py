@@ -1,24 +1,40 @@
-import csv
-import copy
+import itertools
 import os
 import re
 import sys
-import time
 import yaml
 
 import click
-import humanize
-
-from pathvalidate import is_valid_filename, sanitize_filename
 
+from panoptes_cli.deletion import delete_options, delete_resources
+from panoptes_cli.download import (
+    DOWNLOAD_BUFFER_SIZE,
+    DOWNLOAD_CONNECTIONS,
+    download_export,
+)
+from panoptes_cli.journal import JOURNAL_EXTENSION, UploadJournal
+from panoptes_cli.linking import (
+    LINK_CONCURRENCY,
+    SubjectLinker,
+    find_linked_subjects,
+)
+from panoptes_cli.manifest import ManifestError, ManifestReader
+from panoptes_cli.media_cache import MEDIA_CACHE_FILE, MediaCache
+from panoptes_cli.output import echo_raw, get_emitter
+from panoptes_cli.resource_cache import cached_find, invalidate_cached
+from panoptes_cli.scheduler import fit_to_concurrency
 from panoptes_cli.scripts.panoptes import cli
-from panoptes_client import SubjectSet
+from panoptes_cli.upload import (
+    DEFAULT_CONCURRENCY,
+    UploadEngine,
+    UploadTracker,
+)
+from panoptes_client import Panoptes, SubjectSet
 from panoptes_client.panoptes import PanoptesAPIException
 
-LINK_BATCH_SIZE = 10
-MAX_PENDING_SUBJECTS = 50
-MAX_UPLOAD_FILE_SIZE = 1024 * 1024
-CURRENT_STATE_VERSION = 1
+PENDING_SUBJECTS_PER_WORKER = 10
+CURRENT_STATE_VERSION = 3
+RESUME_EXTENSIONS = (JOURNAL_EXTENSION, '.yaml')
 
 @cli.group(name='subject-set')
 def subject_set():
@@ -52,8 +68,14 @@ def ls(subject_set_id, project_id, workflow_id, quiet):
     """Lists subject set IDs and names"""
 
     if subject_set_id and not project_id and not workflow_id:
-        subject_set = SubjectSet.find(subject_set_id)
-        if quiet:
+        subject_set = cached_find(SubjectSet, subject_set_id)
+        emitter = get_emitter()
+        if emitter:
+            emitter.emit(
+                {'id': subject_set.id} if quiet
+                else subject_set_record(subject_set)
+            )
+        elif quiet:
             click.echo(subject_set.id)
         else:
             echo_subject_set(subject_set)
@@ -69,7 +91,13 @@ def ls(subject_set_id, project_id, workflow_id, quiet):
 
     subject_sets = SubjectSet.where(**args)
 
-    if quiet:
+    emitter = get_emitter()
+    if emitter:
+        emitter.emit_all(
+            {'id': s.id} if quiet else subject_set_record(s)
+            for s in subject_sets
+        )
+    elif quiet:
         click.echo(" ".join([s.id for s in subject_sets]))
     else:
         for subject_set in subject_sets:
@@ -79,8 +107,8 @@ def ls(subject_set_id, project_id, workflow_id, quiet):
 @subject_set.command()
 @click.argument('subject-set-id', required=True)
 def info(subject_set_id):
-    subject_set = SubjectSet.find(subject_set_id)
-    click.echo(yaml.dump(subject_set.raw))
+    subject_set = cached_find(SubjectSet, subject_set_id)
+    echo_raw(subject_set.raw)
 
 
 @subject_set.command()
@@ -128,6 +156,7 @@ def modify(subject_set_id, display_name):
     if display_name:
         subject_set.display_name = display_name
     subject_set.save()
+    invalidate_cached(subject_set)
     echo_subject_set(subject_set)
 
 
@@ -177,13 +206,60 @@ def modify(subject_set_id, display_name):
     type=int,
     required=False,
 )
+@click.option(
+    '--concurrency',
+    '-c',
+    help=(
+        "Number of subjects to create at once. Defaults to {}."
+    ).format(DEFAULT_CONCURRENCY),
+    type=click.IntRange(min=1),
+    default=DEFAULT_CONCURRENCY,
+)
+@click.option(
+    '--media-concurrency',
+    '-C',
+    help=(
+        "Number of media files to upload at once. Defaults to twice "
+        "--concurrency."
+    ),
+    type=click.IntRange(min=1),
+    required=False,
+)
+@click.option(
+    '--journal',
+    '-j',
+    'journal_file',
+    help=(
+        "File to record upload progress in, so a failed upload can be "
+        "resumed. Defaults to panoptes-upload-SUBJECT_SET_ID.journal. The "
+        "file is removed when the upload finishes."
+    ),
+    type=click.Path(dir_okay=False),
+    required=False,
+)
+@click.option(
+    '--skip-existing',
+    '-S',
+    help=(
+        "Don't upload rows whose media has already been uploaded to this "
+        "project from this computer. The existing subjects are linked to the "
+        "subject set instead."
+    ),
+    is_flag=True,
+)
+@click.pass_context
 def upload_subjects(
+    ctx,
     subject_set_id,
     manifest_files,
     allow_missing,
     remote_location,
     mime_type,
     file_column,
+    concurrency,
+    media_concurrency,
+    journal_file,
+    skip_existing,
 ):
     """
     Uploads subjects from each of the given MANIFEST_FILES.
@@ -203,67 +279,92 @@ def upload_subjects(
     $ panoptes subject-set upload-subjects -r 1 -r 2 4667 manifest.csv
 
     Any local files will still be detected and uploaded.
+
+    Subjects are created and their media uploaded in parallel. Use
+    --concurrency and --media-concurrency to tune this for your connection:
+
+    $ panoptes subject-set upload-subjects -c 10 -C 40 4667 manifest.csv
+
+    Progress is recorded in a journal file as the upload runs. If the upload
+    fails, give the journal in place of the manifests to resume it:
+
+    $ panoptes subject-set upload-subjects 4667 panoptes-upload-4667.journal
+
+    Subjects are recorded in a cache in ~/.panoptes/ along with a hash of
+    their media. If your manifests overlap ones you've uploaded before, use
+    --skip-existing to reuse the subjects which were created then (their
+    metadata is not updated):
+
+    $ panoptes subject-set upload-subjects -S 4667 manifest.csv
     """
-    if (
-        len(manifest_files) > 1
-        and any(map(lambda m: m.endswith('.yaml'), manifest_files))
+    if len(manifest_files) > 1 and any(
+        map(lambda m: m.endswith(RESUME_EXTENSIONS), manifest_files)
     ):
         click.echo(
-            'Error: YAML manifests must be processed one at a time.',
+            'Error: Journals and YAML manifests must be processed one at a '
+            'time.',
             err=True,
         )
         return -1
+
+    journal = None
+    if manifest_files[0].endswith(JOURNAL_EXTENSION):
+        journal = UploadJournal.open(manifest_files[0])
+        upload_state = journal.state
     elif manifest_files[0].endswith('.yaml'):
         with open(manifest_files[0], 'r') as yaml_manifest:
             upload_state = yaml.load(yaml_manifest, Loader=yaml.FullLoader)
-        if upload_state['state_version'] > CURRENT_STATE_VERSION:
-            click.echo(
-                'Error: {} was generated by a newer version of the Panoptes '
-                'CLI and is not compatible with this version.'.format(
-                    manifest_files[0],
-                ),
-                err=True,
-            )
-            return -1
-        if upload_state['subject_set_id'] != subject_set_id:
-            click.echo(
-                'Warning: You specified subject set {} but this YAML '
-                'manifest is for subject set {}.'.format(
-                    subject_set_id,
-                    upload_state['subject_set_id'],
-                ),
-                err=True,
-            )
-            click.confirm(
-                'Upload {} to subject set {} ({})?'.format(
-                    manifest_files[0],
-                    subject_set_id,
-                    SubjectSet.find(subject_set_id).display_name,
-                ),
-                abort=True
-            )
-            upload_state['subject_set_id'] = subject_set_id
-        resumed_upload = True
     else:
         upload_state = {
             'state_version': CURRENT_STATE_VERSION,
             'subject_set_id': subject_set_id,
-            'manifest_files': manifest_files,
+            'manifest_files': [
+                os.path.abspath(manifest_file)
+                for manifest_file in manifest_files
+            ],
             'allow_missing': allow_missing,
             'remote_location': remote_location,
             'mime_type': mime_type,
             'file_column': file_column,
-            'waiting_to_upload': [],
-            'waiting_to_link': {},
+            'skip_existing': skip_existing,
+            'next_row': 0,
         }
-        resumed_upload = False
 
+    if upload_state['state_version'] > CURRENT_STATE_VERSION:
+        click.echo(
+            'Error: {} was generated by a newer version of the Panoptes '
+            'CLI and is not compatible with this version.'.format(
+                manifest_files[0],
+            ),
+            err=True,
+        )
+        return -1
+    subject_set = None
+    if upload_state['subject_set_id'] != subject_set_id:
+        click.echo(
+            'Warning: You specified subject set {} but this upload is for '
+            'subject set {}.'.format(
+                subject_set_id,
+                upload_state['subject_set_id'],
+            ),
+            err=True,
+        )
+        subject_set = SubjectSet.find(subject_set_id)
+        click.confirm(
+            'Upload {} to subject set {} ({})?'.format(
+                manifest_files[0],
+                subject_set_id,
+                subject_set.display_name,
+            ),
+            abort=True
+        )
+        upload_state['subject_set_id'] = subject_set_id
+
+    mime_type = upload_state['mime_type']
     remote_location_count = len(upload_state['remote_location'])
-    mime_type_count = len(upload_state['mime_type'])
+    mime_type_count = len(mime_type)
     if remote_location_count > 1 and mime_type_count == 1:
-        upload_state['mime_type'] = (
-            upload_state['mime_type'] * remote_location_count
-        )
+        mime_type = mime_type * remote_location_count
     elif remote_location_count > 0 and mime_type_count != remote_location_count:
         click.echo(
             'Error: The number of MIME types given must be either 1 or equal '
@@ -272,222 +373,214 @@ def upload_subjects(
         )
         return -1
 
-    def validate_file(file_path):
-        if not os.path.isfile(file_path):
-            click.echo(
-                'Error: File "{}" could not be found.'.format(
-                    file_path,
-                ),
-                err=True,
-            )
-            return False
+    if subject_set is None:
+        subject_set = SubjectSet.find(upload_state['subject_set_id'])
 
-        file_size = os.path.getsize(file_path)
-        if file_size == 0:
-            click.echo(
-                'Error: File "{}" is empty.'.format(
-                    file_path,
-                ),
-                err=True,
+    if journal:
+        journal.update_state(subject_set_id=upload_state['subject_set_id'])
+    else:
+        if not journal_file:
+            journal_file = 'panoptes-upload-{}{}'.format(
+                subject_set_id,
+                JOURNAL_EXTENSION,
             )
-            return False
-        elif file_size > MAX_UPLOAD_FILE_SIZE:
+        try:
+            if 'waiting_to_upload' in upload_state:
+                journal = journal_from_upload_state(journal_file, upload_state)
+            else:
+                journal = UploadJournal.create(journal_file, upload_state)
+        except FileExistsError:
             click.echo(
-                'Error: File "{}" is {}, larger than the maximum {}.'.format(
-                    file_path,
-                    humanize.naturalsize(file_size),
-                    humanize.naturalsize(MAX_UPLOAD_FILE_SIZE),
+                'Error: Journal file {} already exists. To resume that '
+                'upload, run:\n\n'
+                '$ panoptes subject-set upload-subjects {} {}\n\n'
+                'or use --journal to choose a different file.'.format(
+                    journal_file,
+                    subject_set_id,
+                    journal_file,
                 ),
                 err=True,
             )
-            return False
-        return True
-
-    def get_index_fields(headers):
-        index_fields = [header.lstrip('%') for header in headers if header.startswith('%')]
-        return ",".join(str(field) for field in index_fields)
-
-    subject_set = SubjectSet.find(upload_state['subject_set_id'])
-    if not resumed_upload:
-        subject_rows = []
-        for manifest_file in upload_state['manifest_files']:
-            with open(manifest_file) as manifest_f:
-                file_root = os.path.dirname(manifest_file)
-                r = csv.reader(manifest_f, skipinitialspace=True)
-                headers = next(r)
-                # update set metadata for indexed sets
-                index_fields = get_index_fields(headers)
-                if index_fields:
-                    subject_set.metadata['indexFields'] = index_fields
-                    subject_set.save()
-                # remove leading % from subject metadata headings
-                cleaned_headers = [header.lstrip('%') for header in headers]
-                for row in r:
-                    metadata = dict(zip(cleaned_headers, row))
-                    files = []
-                    if not upload_state['file_column']:
-                        upload_state['file_column'] = []
-                        for field_number, col in enumerate(row, start=1):
-                            file_path = os.path.join(file_root, col)
-                            if os.path.exists(file_path):
-                                upload_state['file_column'].append(
-                                    field_number,
-                                )
-                                if validate_file(file_path):
-                                    files.append(file_path)
-                                elif not upload_state['allow_missing']:
-                                    return -1
-                    else:
-                        for field_number in upload_state['file_column']:
-                            file_path = os.path.join(
-                                file_root,
-                                row[field_number - 1]
-                            )
-                            if validate_file(file_path):
-                                files.append(file_path)
-                            elif not upload_state['allow_missing']:
-                                return -1
-
-                    for field_number, _mime_type in zip(
-                        upload_state['remote_location'],
-                        upload_state['mime_type'],
-                    ):
-                        files.append({_mime_type: row[field_number - 1]})
-
-                    if len(files) == 0:
-                        click.echo(
-                            'Could not find any files in row:',
-                            err=True,
-                        )
-                        click.echo(','.join(row), err=True)
-                        if not upload_state['allow_missing']:
-                            return -1
-                        else:
-                            continue
-                    subject_rows.append((files, metadata))
-
-                if not subject_rows:
-                    click.echo(
-                        'File {} did not contain any rows.'.format(
-                            manifest_file,
-                        ),
-                        err=True,
-                    )
-                    return -1
+            return -1
+        upload_state = journal.state
+
+    skip_existing = skip_existing or upload_state.get('skip_existing', False)
+    config_dir = ctx.find_root().config_dir
+    if not os.path.isdir(config_dir):
+        os.mkdir(config_dir)
+    media_cache = MediaCache(
+        os.path.join(config_dir, MEDIA_CACHE_FILE),
+        ctx.find_root().config['endpoint'],
+    )
 
-        subject_rows = list(enumerate(subject_rows))
-        upload_state['waiting_to_upload'] = copy.deepcopy(subject_rows)
+    def save_index_fields(index_fields):
+        # update set metadata for indexed sets
+        subject_set.metadata['indexFields'] = index_fields
+        subject_set.save()
+
+    # Subjects which were created before an earlier attempt failed might not
+    # have been saved after all, or might have been linked without the
+    # journal being updated.
+    waiting_to_link = journal.waiting_to_link()
+    if waiting_to_link:
+        existing, linked = find_linked_subjects(
+            subject_set.id,
+            waiting_to_link,
+        )
+        journal.linked(linked)
+        missing = [
+            subject_id for subject_id in waiting_to_link
+            if subject_id not in existing
+        ]
+        journal.not_created(missing)
+        # Otherwise --skip-existing would find these again when they're
+        # re-uploaded
+        media_cache.remove(missing)
+
+    # Upload state from version 1 lists every remaining row up front, so
+    # there is nothing left to read from the manifests.
+    start_row = upload_state['next_row']
+    resumed_rows = journal.waiting_to_upload(before=start_row)
+    if start_row is None:
+        manifest_files = []
+        start_row = 0
     else:
-        for subject_id, subject_row in upload_state['waiting_to_link'].items():
-            try:
-                subject = Subject.find(subject_id)
-            except PanoptesAPIException:
-                upload_state['waiting_to_upload'].append(subject_row)
-                del upload_state['waiting_to_link'][subject_id]
-        subject_rows = copy.deepcopy(upload_state['waiting_to_upload'])
+        manifest_files = upload_state['manifest_files']
+
+    reader = ManifestReader(
+        manifest_files,
+        file_column=upload_state['file_column'],
+        remote_location=upload_state['remote_location'],
+        mime_type=mime_type,
+        allow_missing=upload_state['allow_missing'],
+        start=start_row,
+        on_index_fields=save_index_fields,
+    )
+
+    def manifest_rows():
+        for subject_row in reader:
+            journal.row_read(subject_row, reader.position)
+            yield subject_row
+
+    pending_subjects = UploadTracker()
+    max_pending_subjects = concurrency * PENDING_SUBJECTS_PER_WORKER
 
-    pending_subjects = []
+    def subject_created(subject_id, subject_row):
+        journal.created(subject_row[0], subject_id)
+        # Reused subjects might already be linked, but only the API knows for
+        # sure (they could have been removed since), and the linker copes
+        linker.submit([subject_id])
 
     def move_created(limit):
-        while len(pending_subjects) > limit:
-            for subject, subject_row in pending_subjects:
-                if subject.async_save_result:
-                    pending_subjects.remove((subject, subject_row))
-                    upload_state['waiting_to_upload'].remove(subject_row)
-                    upload_state['waiting_to_link'][subject.id] = subject_row
-            time.sleep(0.5)
-
-    def link_subjects(limit):
-        if len(upload_state['waiting_to_link']) > limit:
-            subject_set.add(list(upload_state['waiting_to_link'].keys()))
-            upload_state['waiting_to_link'].clear()
+        for subject_id, subject_row in pending_subjects.wait(limit):
+            subject_created(subject_id, subject_row)
 
+    linker = SubjectLinker(
+        subject_set,
+        Panoptes.client(),
+        on_linked=journal.linked,
+    )
+    fit_to_concurrency(concurrency + LINK_CONCURRENCY)
+
+    completed = False
     with click.progressbar(
-        subject_rows,
-        length=len(subject_rows),
+        itertools.chain(resumed_rows, manifest_rows()),
         label='Uploading subjects',
+        show_pos=True,
     ) as _subject_rows:
         try:
-            with Subject.async_saves():
+            linker.submit(journal.waiting_to_link())
+            with UploadEngine(
+                Panoptes.client(),
+                subject_set.raw['links']['project'],
+                concurrency=concurrency,
+                media_concurrency=media_concurrency,
+                media_cache=media_cache,
+                skip_existing=skip_existing,
+            ) as engine:
                 for subject_row in _subject_rows:
-                    count, (files, metadata) = subject_row
-                    subject = Subject()
-                    subject.links.project = subject_set.links.project
-                    for media_file in files:
-                        subject.add_location(media_file)
-                    subject.metadata.update(metadata)
-                    subject.save()
+                    pending_subjects.add(
+                        engine.submit(subject_row),
+                        subject_row,
+                    )
+                    move_created(max_pending_subjects)
+
+                move_created(0)
+            linker.close()
+            if linker.failed:
+                # Don't reuse these next time, in case they can't be linked
+                # because they no longer exist
+                media_cache.remove(linker.failed)
+                raise PanoptesAPIException(
+                    'Could not link subjects: {}'.format(
+                        ', '.join(linker.failed),
+                    )
+                )
+            completed = True
+        except ManifestError as e:
+            click.echo('Error: {}'.format(e), err=True)
+            move_created(0)
+            return -1
+        finally:
+            linker.close()
 
-                    pending_subjects.append((subject, subject_row))
+            # Record subjects which finished saving after a failure, so they
+            # aren't uploaded a second time when the upload is resumed.
+            for subject_id, subject_row in pending_subjects.drain():
+                journal.created(subject_row[0], subject_id)
+            media_cache.close()
+            invalidate_cached(subject_set)
 
-                    move_created(MAX_PENDING_SUBJECTS)
-                    link_subjects(LINK_BATCH_SIZE)
+            if reader.position > start_row:
+                click.echo(reader.summary(), err=True)
 
-            move_created(0)
-            link_subjects(0)
-        finally:
-            if (
-                len(pending_subjects) > 0
-                or len(upload_state['waiting_to_link']) > 0
+            if journal.remaining() == 0 and (
+                completed or reader.position == start_row
             ):
-                click.echo('Error: Upload failed.', err=True)
-                if click.confirm(
-                    'Would you like to save the upload state to resume the '
-                    'upload later?',
-                    default=True,
-                ):
-                    while True:
-                        state_file_name = 'panoptes-upload-{}.yaml'.format(
-                            subject_set_id,
-                        )
-                        state_file_name = click.prompt(
-                            'Enter filename to save to',
-                            default=state_file_name,
-                        )
-
-                        if not state_file_name.endswith('.yaml'):
-                            click.echo(
-                                'Error: File name must end in ".yaml".',
-                                err=True,
-                            )
-                            if click.confirm(
-                                'Save to {}.yaml?'.format(state_file_name),
-                                default=True,
-                            ):
-                                state_file_name += '.yaml'
-                            else:
-                                continue
-                        if not is_valid_filename(state_file_name):
-                            click.echo(
-                                'Error: {} is not a valid file name'.format(
-                                    state_file_name,
-                                ),
-                                err=True,
-                            )
-                            sanitized_filename = sanitize_filename(
-                                state_file_name,
-                            )
-                            if click.confirm(
-                                'Save to {}?'.format(
-                                    sanitized_filename,
-                                ),
-                                default=True,
-                            ):
-                                state_file_name = sanitized_filename
-                            else:
-                                continue
-                        if os.path.exists(state_file_name):
-                            if not click.confirm(
-                                'File {} already exists. Overwrite?'.format(
-                                    state_file_name,
-                                ),
-                                default=False,
-                            ):
-                                continue
-                        break
-
-                    with open(state_file_name, 'w') as state_file:
-                        yaml.dump(upload_state, state_file)
+                journal.remove()
+            else:
+                journal.close()
+                click.echo(
+                    'Error: Upload failed. Progress has been saved to {}. '
+                    'To resume the upload, run:\n\n'
+                    '$ panoptes subject-set upload-subjects {} {}'.format(
+                        journal.path,
+                        subject_set_id,
+                        journal.path,
+                    ),
+                    err=True,
+                )
+
+
+def journal_from_upload_state(journal_file, upload_state):
+    """
+    Converts the upload state from a YAML file saved by an older version of
+    the CLI into an upload journal.
+    """
+
+    journal = UploadJournal.create(journal_file, {
+        'state_version': CURRENT_STATE_VERSION,
+        'subject_set_id': upload_state['subject_set_id'],
+        'manifest_files': list(upload_state['manifest_files']),
+        'allow_missing': upload_state['allow_missing'],
+        'remote_location': list(upload_state['remote_location']),
+        'mime_type': list(upload_state['mime_type']),
+        'file_column': list(upload_state['file_column'] or []),
+        'next_row': upload_state.get('next_row'),
+    })
+    journal.add_rows(
+        (row_number, subject_data, None)
+        for row_number, subject_data in dict(
+            upload_state['waiting_to_upload']
+        ).items()
+    )
+    journal.add_rows(
+        (row_number, subject_data, subject_id)
+        for subject_id, (row_number, subject_data) in (
+            upload_state['waiting_to_link'].items()
+        )
+    )
+    return journal
 
 
 @subject_set.command(name='add-subjects')
@@ -511,10 +604,7 @@ def add_subjects(subject_set_id, subject_ids, id_file):
     See the upload-subjects command to create new subjects in a subject set.
     """
     s = SubjectSet.find(subject_set_id)
-    if id_file:
-        s.add([l.strip() for l in id_file.readlines()])
-    if subject_ids:
-        s.add(subject_ids)
+    return link_subject_ids(s, subject_ids, id_file)
 
 
 @subject_set.command(name='remove-subjects')
@@ -537,37 +627,38 @@ def remove_subjects(subject_set_id, subject_ids, id_file):
     """
 
     s = SubjectSet.find(subject_set_id)
-    if id_file:
-        s.remove([l.strip() for l in id_file.readlines()])
-    if subject_ids:
-        s.remove(subject_ids)
+    return link_subject_ids(s, subject_ids, id_file, remove=True)
 
 
 @subject_set.command()
-@click.option(
-    '--force',
-    '-f',
-    is_flag=True,
-    help='Delete without asking for confirmation.',
-)
-@click.argument('subject-set-ids', required=True, nargs=-1, type=int)
-def delete(force, subject_set_ids):
-    for subject_set_id in subject_set_ids:
-        subject_set = SubjectSet.find(subject_set_id)
-        if not force:
-            click.confirm(
-                'Delete subject set {} ({})?'.format(
-                    subject_set_id,
-                    subject_set.display_name,
-                ),
-                abort=True,
-            )
-        subject_set.delete()
+@delete_options
+@click.argument('subject-set-ids', nargs=-1, type=int)
+def delete(force, id_file, concurrency, report_file, subject_set_ids):
+    """
+    Deletes subject sets.
+
+    Deletes are made --concurrency at a time. Unless --force is given, each
+    subject set is shown and must be confirmed first.
+    """
+
+    return delete_resources(
+        SubjectSet,
+        subject_set_ids,
+        id_file,
+        force,
+        concurrency,
+        report_file,
+        describe_with='display_name',
+    )
 
 
 @subject_set.command(name="download-classifications")
 @click.argument('subject-set-id', required=True, type=int)
-@click.argument('output-file', required=True, type=click.File('wb'))
+@click.argument(
+    'output-file',
+    required=True,
+    type=click.Path(dir_okay=False, allow_dash=True),
+)
 @click.option(
     '--generate',
     '-g',
@@ -584,38 +675,78 @@ def delete(force, subject_set_ids):
     required=False,
     type=int,
 )
+@click.option(
+    '--connections',
+    '-c',
+    help=(
+        "Number of connections to download the export over. Defaults to "
+        "{}."
+    ).format(DOWNLOAD_CONNECTIONS),
+    type=click.IntRange(min=1),
+    default=DOWNLOAD_CONNECTIONS,
+)
+@click.option(
+    '--buffer-size',
+    '-b',
+    help=(
+        "Size of the buffer used by each connection, in KiB. Defaults to {}."
+    ).format(DOWNLOAD_BUFFER_SIZE // 1024),
+    type=click.IntRange(min=1),
+    default=DOWNLOAD_BUFFER_SIZE // 1024,
+)
 def download_classifications(
     subject_set_id,
     output_file,
     generate,
-    generate_timeout
+    generate_timeout,
+    connections,
+    buffer_size,
 ):
     """
     Downloads a subject-set specific classifications export for the given subject set.
 
     OUTPUT_FILE will be overwritten if it already exists. Set OUTPUT_FILE to -
     to output to stdout.
-    """
-
-    subject_set = SubjectSet.find(subject_set_id)
 
-    if generate:
-        click.echo("Generating new export...", err=True)
+    Exports are downloaded over several connections at once. If a download is
+    interrupted, run the same command again to resume it.
+    """
 
-    export = subject_set.get_export(
+    subject_set = cached_find(SubjectSet, subject_set_id)
+    download_export(
+        subject_set,
         'classifications',
+        output_file,
         generate=generate,
-        wait_timeout=generate_timeout
+        generate_timeout=generate_timeout,
+        connections=connections,
+        buffer_size=buffer_size * 1024,
     )
 
-    with click.progressbar(
-        export.iter_content(chunk_size=1024),
-        label='Downloading',
-        length=(int(export.headers.get('content-length')) / 1024 + 1),
-        file=click.get_text_stream('stderr'),
-    ) as chunks:
-        for chunk in chunks:
-            output_file.write(chunk)
+
+def link_subject_ids(subject_set, subject_ids, id_file, remove=False):
+    with SubjectLinker(
+        subject_set,
+        Panoptes.client(),
+        remove=remove,
+    ) as linker:
+        if id_file:
+            for line in id_file:
+                subject_id = line.strip()
+                if subject_id:
+                    linker.submit([subject_id])
+        linker.submit(subject_ids)
+    invalidate_cached(subject_set)
+
+    if linker.failed:
+        click.echo(
+            'Error: Could not {} subjects: {}'.format(
+                'unlink' if remove else 'link',
+                ', '.join(linker.failed),
+            ),
+            err=True,
+        )
+        return -1
 
 
 def echo_subject_set(subject_set):
@@ -627,4 +758,5 @@ def echo_subject_set(subject_set):
     )
 
 
-from panoptes_client import Subject
+def subject_set_record(subject_set):
+    return {'id': subject_set.id, 'display_name': subject_set.display_name}
@@ -0,0 +1,147 @@
+import io
+import unittest
+
+import click
+
+from unittest import mock
+
+from panoptes_cli.batch import (
+    FAILED,
+    SKIPPED,
+    SUCCEEDED,
+    BatchError,
+    BatchRunner,
+    read_operations,
+)
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.argument('name')
+def create(name):
+    click.echo(name.upper())
+
+
+@cli.command()
+@click.argument('value')
+def fail(value):
+    click.echo('Error: {} failed'.format(value), err=True)
+    return -1
+
+
+@cli.command()
+def confirm():
+    click.confirm('Are you sure?', abort=True)
+
+
+def run(text, concurrency=2):
+    runner = BatchRunner(cli, mock.MagicMock(), concurrency=concurrency)
+    results = runner.run(read_operations(io.StringIO(text)))
+    return sorted(results, key=lambda result: result['operation'])
+
+
+class TestReadOperations(unittest.TestCase):
+    def test_yaml(self):
+        operations = read_operations(io.StringIO(
+            '- id: first\n'
+            '  command: create "one two"\n'
+            '- command: [create, "{first.output}"]\n'
+            '- create three\n'
+        ))
+        self.assertEqual(
+            [operation.args for operation in operations],
+            [
+                ['create', 'one two'],
+                ['create', '{first.output}'],
+                ['create', 'three'],
+            ],
+        )
+        self.assertEqual(operations[1].depends_on, ['first'])
+        self.assertEqual(operations[2].depends_on, [])
+
+    def test_literal_braces(self):
+        operations = read_operations(io.StringIO(
+            '- command: [create, \'{"a": {"b": "{c}"}}\']\n'
+            '- command: [create, "{{first.output}"]\n'
+        ))
+        self.assertEqual(
+            [operation.depends_on for operation in operations],
+            [[], []],
+        )
+
+    def test_jsonl(self):
+        operations = read_operations(io.StringIO(
+            '{"id": "first", "command": ["create", "one"]}\n'
+            '\n'
+            '{"command": ["create", "two"], "depends_on": ["first"]}\n'
+        ))
+        self.assertEqual(len(operations), 2)
+        self.assertEqual(operations[1].depends_on, ['first'])
+
+    def test_invalid(self):
+        for text in (
+            '- command: create {later.output}\n'
+            '- id: later\n  command: create one\n',
+            '- id: one\n  command: create one\n'
+            '- id: one\n  command: create two\n',
+            '- command: create one\n  retries: 3\n',
+            '- command: batch other.yml\n',
+            '- command: --endpoint https://example.com create one\n',
+            '{"command": ["create", "one"]}\nnot json\n',
+        ):
+            with self.assertRaises(BatchError):
+                read_operations(io.StringIO(text))
+
+
+class TestBatchRunner(unittest.TestCase):
+    def test_placeholders(self):
+        results = run(
+            '- id: first\n'
+            '  command: create one\n'
+            '- command: create "{first.output} two"\n'
+            '- command:\n'
+            '  - create\n'
+            '  - \'{"a": "{first}", "b": "{{first.output}"}\'\n'
+        )
+        self.assertEqual(
+            [result['status'] for result in results],
+            [SUCCEEDED, SUCCEEDED, SUCCEEDED],
+        )
+        self.assertEqual(results[1]['command'], ['create', 'ONE two'])
+        self.assertEqual(results[1]['output'], 'ONE TWO\n')
+        self.assertEqual(
+            results[2]['command'],
+            ['create', '{"a": "{first}", "b": "{first.output}"}'],
+        )
+
+    def test_failures(self):
+        results = run(
+            '- id: first\n'
+            '  command: fail one\n'
+            '- id: second\n'
+            '  command: create "{first.output}"\n'
+            '- command: create three\n'
+            '  depends_on: second\n'
+            '- command: confirm\n'
+            '- command: create four\n'
+        )
+        self.assertEqual(
+            [result['status'] for result in results],
+            [FAILED, SKIPPED, SKIPPED, FAILED, SUCCEEDED],
+        )
+        self.assertEqual(results[0]['error'], 'Error: one failed\n')
+        self.assertIn('Aborted!', results[3]['error'])
+
+    def test_concurrency(self):
+        results = run(
+            '\n'.join('- create {}'.format(i) for i in range(20)),
+            concurrency=4,
+        )
+        self.assertEqual(
+            [result['output'] for result in results],
+            ['{}\n'.format(i) for i in range(20)],
+        )
@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import yaml
+
+from click.testing import CliRunner
+
+from panoptes_cli.scripts.panoptes import cli
+
+
+class TestConfigure(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.config_file = os.path.join(
+            self.tmp_dir,
+            '.panoptes',
+            'config.yml',
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def configure(self, args, answers):
+        result = CliRunner().invoke(
+            cli,
+            args,
+            input=''.join(answer + '\n' for answer in answers),
+            env={'HOME': self.tmp_dir},
+        )
+        self.assertEqual(result.exit_code, 0, result.output)
+        with open(self.config_file) as conf_f:
+            return yaml.safe_load(conf_f)
+
+    def test_saves_only_changed_options(self):
+        config = self.configure(['configure'], ['someone', 'secret'])
+        self.assertEqual(config, {'username': 'someone', 'password': 'secret'})
+
+        # endpoint, username, password, rate_limit, request_concurrency,
+        # pool_size, pool_block, keep_alive
+        config = self.configure(
+            ['configure', '--edit-all'],
+            ['', '', '', '5', '', '', '', ''],
+        )
+        self.assertEqual(
+            config,
+            {'username': 'someone', 'password': 'secret', 'rate_limit': 5.0},
+        )
+
+    def test_keeps_saved_defaults(self):
+        os.mkdir(os.path.dirname(self.config_file))
+        with open(self.config_file, 'w') as conf_f:
+            conf_f.write('keep_alive: 60\n')
+        config = self.configure(['configure'], ['someone', 'secret'])
+        self.assertEqual(config['keep_alive'], 60)
@@ -0,0 +1,106 @@
+import csv
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from panoptes_cli.convert import (
+    ConvertError,
+    convert_export,
+    parse_batch,
+    parse_json_batch,
+)
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+EXPORT = (
+    'classification_id,user_id,created_at,metadata,annotations,subject_data\n'
+    '1,10,2024-01-01 10:00:00 UTC,'
+    '"{""started_at"":""2024-01-01T09:59:00.000Z"",""user_language"":""en""}",'
+    '"[{""task"":""T0"",""task_label"":""Animal?"",""value"":""Yes""},'
+    '{""task"":""T1"",""value"":[1,2]}]",'
+    '"{""100"":{""retired"":null,""name"":""a""}}"\n'
+    '2,,2024-01-02 10:00:00 UTC,{},[],"{""101"":{""retired"":{""id"":5}}}"\n'
+)
+
+
+def read_export():
+    reader = csv.reader(io.StringIO(EXPORT))
+    header = next(reader)
+    return header, list(reader)
+
+
+class TestParse(unittest.TestCase):
+    def test_parse_json_batch(self):
+        self.assertEqual(
+            parse_json_batch(['{"a": 1}', '', '[2]']),
+            [{'a': 1}, None, [2]],
+        )
+        self.assertEqual(
+            parse_json_batch(['{"a": 1}', 'not json']),
+            [{'a': 1}, None],
+        )
+        self.assertEqual(
+            parse_json_batch(['1,2', '{"a": 1}']),
+            [None, {'a': 1}],
+        )
+
+    def test_parse_batch(self):
+        columns, annotations = parse_batch(*read_export())
+        self.assertEqual(columns['classification_id'], [1, 2])
+        self.assertEqual(columns['user_id'], [10, None])
+        self.assertEqual(
+            columns['metadata.started_at'],
+            ['2024-01-01T09:59:00.000Z', None],
+        )
+        self.assertEqual(columns['metadata.user_language'], ['en', None])
+        self.assertEqual(columns['subject_data.subject_id'], [100, 101])
+        self.assertEqual(columns['subject_data.retired'], [False, True])
+        self.assertEqual(annotations['classification_id'], [1, 1])
+        self.assertEqual(annotations['task'], ['T0', 'T1'])
+        self.assertEqual(annotations['task_label'], ['Animal?', None])
+        self.assertEqual(annotations['value'], ['"Yes"', '[1, 2]'])
+
+
+class TestConvertExport(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'export.parquet')
+        self.annotations_path = os.path.join(self.tmp_dir, 'annotations')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def convert(self, **kwargs):
+        return convert_export(
+            io.BytesIO(EXPORT.encode('utf-8')),
+            self.path,
+            annotations_path=self.annotations_path,
+            **kwargs
+        )
+
+    @unittest.skipIf(pyarrow, 'pyarrow is installed')
+    def test_without_pyarrow(self):
+        with self.assertRaises(ConvertError):
+            self.convert()
+
+    @unittest.skipUnless(pyarrow, 'pyarrow is not installed')
+    def test_parquet(self):
+        self.assertEqual(self.convert(batch_rows=1), 2)
+        table = pyarrow.parquet.read_table(self.path)
+        self.assertEqual(table.num_rows, 2)
+        self.assertEqual(
+            table.column('subject_data.subject_id').to_pylist(),
+            [100, 101],
+        )
+        self.assertEqual(
+            str(table.schema.field('created_at').type),
+            'timestamp[s]',
+        )
+        annotations = pyarrow.parquet.read_table(self.annotations_path)
+        self.assertEqual(annotations.num_rows, 2)
@@ -0,0 +1,162 @@
+import json
+import threading
+import unittest
+
+from unittest import mock
+
+from click.testing import CliRunner
+
+from panoptes_cli.deletion import delete_by_id, delete_many
+from panoptes_cli.scripts.panoptes import cli
+from panoptes_client import Panoptes, Subject, Workflow
+from panoptes_client.panoptes import PanoptesAPIException
+
+
+class FakeResource(object):
+    deleted = []
+    lock = threading.Lock()
+
+    def __init__(self, resource_id):
+        self.id = resource_id
+        self.etag = 'W/"{}"'.format(resource_id)
+
+    @classmethod
+    def http_delete(cls, resource_id, etag=None, retry=False):
+        if resource_id == '3':
+            raise PanoptesAPIException('Not allowed')
+        with cls.lock:
+            cls.deleted.append((resource_id, etag))
+
+
+class TestDeleteMany(unittest.TestCase):
+    def test_instances(self):
+        FakeResource.deleted = deleted = []
+        items = [FakeResource(str(i)) for i in range(10)]
+        with mock.patch(
+            'panoptes_cli.listing.Panoptes.client',
+            return_value=mock.MagicMock(),
+        ):
+            results = list(delete_many(FakeResource, items, concurrency=4))
+
+        self.assertEqual(
+            [resource_id for resource_id, _ in results],
+            [str(i) for i in range(10)],
+        )
+        errors = [error for _, error in results]
+        self.assertIsInstance(errors[3], PanoptesAPIException)
+        self.assertEqual(errors.count(None), 9)
+        self.assertEqual(sorted(deleted, key=lambda d: int(d[0])), [
+            (str(i), 'W/"{}"'.format(i)) for i in range(10) if i != 3
+        ])
+
+    def test_ids(self):
+        with mock.patch(
+            'panoptes_cli.deletion.delete_by_id',
+        ) as delete, mock.patch(
+            'panoptes_cli.listing.Panoptes.client',
+            return_value=mock.MagicMock(),
+        ):
+            results = list(delete_many(Subject, [1, 2], concurrency=2))
+
+        self.assertEqual(results, [('1', None), ('2', None)])
+        self.assertEqual(
+            sorted(call.args for call in delete.call_args_list),
+            [(Subject, '1'), (Subject, '2')],
+        )
+
+
+class TestDeleteById(unittest.TestCase):
+    def setUp(self):
+        # A real client, so requests go through its own headers and auth
+        self.client = Panoptes(
+            endpoint='https://panoptes.example.com',
+            username='',
+            password='',
+        )
+        self.client.session = mock.MagicMock()
+        self.responses = {}
+        self.client.session.request.side_effect = (
+            lambda method, url, **kwargs: self.responses[method]
+        )
+        patcher = mock.patch.object(
+            Panoptes,
+            'client',
+            return_value=self.client,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def respond(self, method, status_code, body=None, etag=None):
+        response = mock.MagicMock(status_code=status_code)
+        response.headers = {'ETag': etag} if etag else {}
+        response.text = json.dumps(body) if body else ''
+        response.json.return_value = body
+        self.responses[method] = response
+
+    def test_sends_etag(self):
+        self.respond('GET', 200, {'subjects': [{'id': '5'}]}, 'W/"abc"')
+        self.respond('DELETE', 204)
+        delete_by_id(Subject, '5')
+
+        requests = self.client.session.request.call_args_list
+        self.assertEqual(
+            [call.args for call in requests],
+            [
+                ('GET', 'https://panoptes.example.com/api/subjects/5'),
+                ('DELETE', 'https://panoptes.example.com/api/subjects/5'),
+            ],
+        )
+        self.assertEqual(requests[1].kwargs['headers']['If-Match'], 'W/"abc"')
+
+    def test_missing(self):
+        self.respond('GET', 404, {'errors': [{'message': 'Not found'}]})
+        with self.assertRaises(PanoptesAPIException):
+            delete_by_id(Subject, '5')
+        self.assertEqual(self.client.session.request.call_count, 1)
+
+    def test_delete_many(self):
+        self.respond('GET', 200, {'subjects': [{'id': '5'}]}, 'W/"abc"')
+        self.respond('DELETE', 204)
+        self.assertEqual(
+            list(delete_many(Subject, ['5', '6'], concurrency=2)),
+            [('5', None), ('6', None)],
+        )
+        self.assertEqual(self.client.session.request.call_count, 4)
+
+
+class TestDeleteCommands(unittest.TestCase):
+    def invoke(self, args, **kwargs):
+        return CliRunner().invoke(
+            cli,
+            ['--no-cache'] + args,
+            obj=mock.MagicMock(),
+            **kwargs
+        )
+
+    def test_no_ids(self):
+        result = self.invoke(['subject', 'delete', '--force'])
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn('Give at least one subject ID', result.output)
+
+    def test_confirmed_resource_reused(self):
+        workflow = Workflow({'id': '5', 'display_name': 'Old'}, etag='W/"a"')
+        client = mock.MagicMock()
+        with mock.patch.object(
+            Workflow,
+            'find',
+            return_value=workflow,
+        ) as find, mock.patch.object(
+            Workflow,
+            'http_delete',
+        ) as http_delete, mock.patch.object(
+            Panoptes,
+            'client',
+            return_value=client,
+        ):
+            result = self.invoke(['workflow', 'delete', '5'], input='y\n')
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Delete workflow 5 (Old)?', result.output)
+        find.assert_called_once_with(5)
+        http_delete.assert_called_once_with('5', etag='W/"a"', retry=True)
+        client.get.assert_not_called()
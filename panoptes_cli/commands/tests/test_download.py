@@ -0,0 +1,178 @@
+import gzip
+import os
+import re
+import shutil
+import tempfile
+import threading
+import unittest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from panoptes_cli.download import (
+    Downloader,
+    STATE_EXTENSION,
+    show_progress,
+)
+
+CONTENT = bytes(range(256)) * 1000
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    ranged = True
+    send_length = True
+    content = CONTENT
+    content_encoding = None
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.headers.get('Range'))
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        content = self.content
+        if self.ranged and match and not content:
+            body = b''
+            self.send_response(416)
+            self.send_header('Content-Range', 'bytes */0')
+        elif self.ranged and match:
+            start = int(match.group(1))
+            end = int(match.group(2) or len(content) - 1)
+            body = content[start:end + 1]
+            self.send_response(206)
+            self.send_header(
+                'Content-Range',
+                'bytes {}-{}/{}'.format(start, end, len(content)),
+            )
+        else:
+            body = content
+            self.send_response(200)
+        if self.send_length:
+            self.send_header('Content-Length', str(len(body)))
+        if self.content_encoding:
+            self.send_header('Content-Encoding', self.content_encoding)
+        self.send_header('ETag', '"abc"')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestDownloader(unittest.TestCase):
+    def setUp(self):
+        RangeHandler.ranged = True
+        RangeHandler.send_length = True
+        RangeHandler.content = CONTENT
+        RangeHandler.content_encoding = None
+        RangeHandler.requests = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:{}/export.csv'.format(
+            self.server.server_port,
+        )
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'export.csv')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp_dir)
+
+    def read_output(self):
+        with open(self.path, 'rb') as output_file:
+            return output_file.read()
+
+    def test_ranged(self):
+        progress = []
+        downloader = Downloader(
+            self.url,
+            connections=3,
+            chunk_size=10000,
+            on_progress=progress.append,
+        )
+        downloader.to_path(self.path)
+        self.assertEqual(self.read_output(), CONTENT)
+        self.assertEqual(sum(progress), len(CONTENT))
+        # One probe plus one request per chunk
+        self.assertEqual(len(RangeHandler.requests), 1 + 26)
+        self.assertEqual(os.listdir(self.tmp_dir), ['export.csv'])
+
+    def test_resume(self):
+        downloader = Downloader(self.url, chunk_size=10000)
+        downloader.probe()
+        with open(self.path + '.part', 'wb') as partial_file:
+            partial_file.write(CONTENT[:20000])
+            partial_file.truncate(len(CONTENT))
+        downloader._save_state(self.path + STATE_EXTENSION, {
+            'size': len(CONTENT),
+            'validator': '"abc"',
+            'chunk_size': 10000,
+            'done': [0, 1],
+        })
+        RangeHandler.requests = []
+        downloader.to_path(self.path)
+        self.assertEqual(self.read_output(), CONTENT)
+        self.assertNotIn('bytes=0-9999', RangeHandler.requests)
+        self.assertEqual(len(RangeHandler.requests), 24)
+
+    def test_not_ranged(self):
+        RangeHandler.ranged = False
+        downloader = Downloader(self.url, chunk_size=10000)
+        downloader.to_path(self.path)
+        self.assertEqual(self.read_output(), CONTENT)
+        self.assertFalse(downloader.ranged)
+        self.assertEqual(len(RangeHandler.requests), 2)
+
+    def test_no_length(self):
+        RangeHandler.ranged = False
+        RangeHandler.send_length = False
+        progress = []
+        downloader = Downloader(
+            self.url,
+            buffer_size=4096,
+            on_progress=progress.append,
+        )
+        downloader.to_path(self.path)
+        self.assertIsNone(downloader.size)
+        self.assertEqual(self.read_output(), CONTENT)
+        self.assertEqual(sum(progress), len(CONTENT))
+        self.assertLessEqual(max(progress), 4096)
+
+        with show_progress(downloader) as bar:
+            downloader.on_progress(len(CONTENT))
+        self.assertEqual(bar.current_item, len(CONTENT))
+
+    def test_gzip_encoding(self):
+        RangeHandler.content = gzip.compress(CONTENT)
+        RangeHandler.content_encoding = 'gzip'
+        progress = []
+        downloader = Downloader(
+            self.url,
+            chunk_size=10000,
+            on_progress=progress.append,
+        )
+        downloader.to_path(self.path)
+        self.assertEqual(self.read_output(), CONTENT)
+        self.assertEqual(sum(progress), len(RangeHandler.content))
+        self.assertEqual(os.listdir(self.tmp_dir), ['export.csv'])
+
+        RangeHandler.ranged = False
+        Downloader(self.url).to_path(self.path)
+        self.assertEqual(self.read_output(), CONTENT)
+
+    def test_empty(self):
+        RangeHandler.content = b''
+        with open(self.path, 'wb') as output_file:
+            output_file.write(b'old')
+        downloader = Downloader(self.url)
+        downloader.to_path(self.path)
+        self.assertEqual(downloader.size, 0)
+        self.assertEqual(self.read_output(), b'')
+        self.assertEqual(RangeHandler.requests, ['bytes=0-0'])
+
+    def test_progress(self):
+        downloader = Downloader(self.url)
+        downloader.size = len(CONTENT)
+        with show_progress(downloader) as bar:
+            downloader.on_progress(1000)
+            downloader.on_progress(2000)
+            self.assertEqual(bar.pos, 3000)
+            self.assertEqual(bar.current_item, 3000)
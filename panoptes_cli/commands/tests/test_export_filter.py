@@ -0,0 +1,82 @@
+import datetime
+import gzip
+import io
+import unittest
+
+from panoptes_cli.export_filter import (
+    ExportFilter,
+    ExportFilterError,
+    decompressed,
+)
+
+EXPORT = (
+    'classification_id,workflow_version,created_at,subject_ids,annotations\n'
+    '1,12.1,2024-01-01 10:00:00 UTC,100,"[{""task"": ""T0""}]"\n'
+    '2,12.5,2024-01-02 10:00:00 UTC,101;102,"[{""task"":\n""T0""}]"\n'
+    '3,13.1,2024-01-03 10:00:00 UTC,103,[]\n'
+)
+
+
+class TestExportFilter(unittest.TestCase):
+    def run_filter(self, export_filter, export=EXPORT):
+        output = io.StringIO()
+        export_filter.copy(io.BytesIO(export.encode('utf-8')), output)
+        return output.getvalue().splitlines()
+
+    def ids(self, export_filter):
+        return [
+            line.split(',')[0]
+            for line in self.run_filter(export_filter)[1:]
+            if line[:1].isdigit()
+        ]
+
+    def test_no_filter(self):
+        self.assertFalse(ExportFilter())
+        self.assertEqual(
+            '\n'.join(self.run_filter(ExportFilter())) + '\n',
+            EXPORT,
+        )
+
+    def test_columns(self):
+        self.assertEqual(
+            self.run_filter(ExportFilter(
+                columns=['subject_ids', 'classification_id'],
+            )),
+            ['subject_ids,classification_id', '100,1', '101;102,2', '103,3'],
+        )
+
+    def test_workflow_versions(self):
+        self.assertEqual(self.ids(ExportFilter(workflow_versions=['12'])), [
+            '1', '2',
+        ])
+        self.assertEqual(
+            self.ids(ExportFilter(workflow_versions=['12.5', '13.1'])),
+            ['2', '3'],
+        )
+
+    def test_created_at(self):
+        self.assertEqual(self.ids(ExportFilter(
+            created_after=datetime.datetime(2024, 1, 2, 10),
+            created_before=datetime.datetime(2024, 1, 3),
+        )), ['2'])
+
+    def test_subject_ids(self):
+        self.assertEqual(
+            self.ids(ExportFilter(subject_ids=[102, '103'])),
+            ['2', '3'],
+        )
+
+    def test_missing_column(self):
+        with self.assertRaises(ExportFilterError):
+            self.run_filter(
+                ExportFilter(workflow_versions=['1']),
+                export='classification_id\n1\n',
+            )
+
+    def test_decompressed(self):
+        data = EXPORT.encode('utf-8')
+        self.assertEqual(
+            decompressed(io.BytesIO(gzip.compress(data))).read(),
+            data,
+        )
+        self.assertEqual(decompressed(io.BytesIO(data)).read(), data)
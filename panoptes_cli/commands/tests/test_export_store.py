@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from unittest import mock
+
+from panoptes_cli.export_store import ClassificationStore, ExportStoreError
+
+HEADER = ['classification_id', 'user_id', 'subject_ids']
+
+
+class TestClassificationStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'classifications.db')
+        self.store = ClassificationStore(self.path)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_incremental(self):
+        rows = [HEADER, ['1', '10', '100'], ['2', '11', '101']]
+        self.assertEqual(self.store.sync('workflow 1', rows), 2)
+        self.assertEqual(self.store.high_water_mark('workflow 1'), 2)
+
+        rows.append(['3', '10', '102'])
+        self.assertEqual(self.store.sync('workflow 1', rows), 1)
+        self.assertEqual(self.store.high_water_mark('workflow 1'), 3)
+        self.assertEqual(self.store.sync('workflow 1', rows), 0)
+        self.assertEqual(self.store.count(), 3)
+
+    def test_overlapping_sources(self):
+        self.store.sync('workflow 1', [HEADER, ['1', '10', '100']])
+        added = self.store.sync(
+            'project 1',
+            [HEADER, ['1', '10', '100'], ['2', '11', '101']],
+        )
+        self.assertEqual(added, 1)
+        self.assertEqual(self.store.count(), 2)
+        self.assertIsNone(self.store.high_water_mark('workflow 2'))
+
+    def test_new_columns(self):
+        self.store.sync('workflow 1', [HEADER, ['1', '10', '100']])
+        self.store.sync(
+            'workflow 1',
+            [HEADER + ['gold_standard'], ['2', '11', '101', 'true']],
+        )
+        self.store.close()
+        self.store = ClassificationStore(self.path)
+        self.assertEqual(
+            self.store._db.execute(
+                'SELECT classification_id, gold_standard '
+                'FROM classifications ORDER BY classification_id'
+            ).fetchall(),
+            [(1, None), (2, 'true')],
+        )
+
+    def test_missing_id_column(self):
+        with self.assertRaises(ExportStoreError):
+            self.store.sync('workflow 1', [['user_id'], ['1']])
+
+    def test_interrupted(self):
+        rows = [
+            HEADER,
+            ['5', '10', '100'],
+            ['6', '10', '100'],
+            ['2', '11', '101'],
+            ['3', '11', '101'],
+        ]
+
+        def interrupted():
+            yield from rows[:4]
+            raise KeyboardInterrupt()
+
+        with mock.patch('panoptes_cli.export_store.STORE_BATCH_SIZE', 2):
+            with self.assertRaises(KeyboardInterrupt):
+                self.store.sync('workflow 1', interrupted())
+        # The rows read so far are kept, but lower IDs which weren't read
+        # yet aren't skipped next time
+        self.assertEqual(self.store.count(), 2)
+        self.assertIsNone(self.store.high_water_mark('workflow 1'))
+
+        self.assertEqual(self.store.sync('workflow 1', rows), 2)
+        self.assertEqual(self.store.count(), 4)
+        self.assertEqual(self.store.high_water_mark('workflow 1'), 6)
+
+    def test_bad_rows(self):
+        bad_rows = []
+        added = self.store.sync(
+            'workflow 1',
+            [
+                HEADER,
+                ['1', '10'],
+                [],
+                ['', '11', '101'],
+                ['2', '11', '101', 'extra'],
+                ['3', '12', '102'],
+            ],
+            on_bad_row=lambda row_number, row: bad_rows.append(row_number),
+        )
+        self.assertEqual(added, 3)
+        self.assertEqual(bad_rows, [2, 4, 5])
+        self.assertEqual(
+            self.store._db.execute(
+                'SELECT classification_id, user_id, subject_ids '
+                'FROM classifications ORDER BY classification_id'
+            ).fetchall(),
+            [(1, '10', None), (2, '11', '101'), (3, '12', '102')],
+        )
@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from panoptes_cli.journal import UploadJournal
+
+
+class TestUploadJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'upload.journal')
+        self.journal = UploadJournal.create(
+            self.path,
+            {'subject_set_id': 1, 'next_row': 0},
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def reopen(self):
+        self.journal.close()
+        self.journal = UploadJournal.open(self.path)
+
+    def test_create_existing(self):
+        with self.assertRaises(FileExistsError):
+            UploadJournal.create(self.path, {})
+
+    def test_transitions(self):
+        for row_number in range(3):
+            self.journal.row_read(
+                (row_number, (['{}.png'.format(row_number)], {})),
+                row_number + 1,
+            )
+        self.journal.created(0, 100)
+        self.journal.created(1, 101)
+        self.journal.linked(['100'])
+        self.reopen()
+
+        self.assertEqual(self.journal.state['next_row'], 3)
+        self.assertEqual(
+            list(self.journal.waiting_to_upload()),
+            [(2, (['2.png'], {}))],
+        )
+        self.assertEqual(self.journal.waiting_to_link(), ['101'])
+        self.assertEqual(self.journal.remaining(), 2)
+
+    def test_waiting_to_upload_before(self):
+        self.journal.add_rows(
+            (row_number, ([], {}), None) for row_number in range(5)
+        )
+        self.assertEqual(
+            [row_number for row_number, _ in
+             self.journal.waiting_to_upload(before=3)],
+            [0, 1, 2],
+        )
+
+    def test_not_created(self):
+        self.journal.add_rows([(0, ([], {}), 100)])
+        self.journal.not_created(['100'])
+        self.assertEqual(self.journal.waiting_to_link(), [])
+        self.assertEqual(len(list(self.journal.waiting_to_upload())), 1)
+
+    def test_remove(self):
+        self.journal.remove()
+        self.assertFalse(os.path.exists(self.path))
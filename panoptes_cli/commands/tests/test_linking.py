@@ -0,0 +1,85 @@
+import contextlib
+import unittest
+
+from unittest import mock
+
+from panoptes_cli.linking import SubjectLinker, find_linked_subjects
+from panoptes_client.panoptes import PanoptesAPIException
+
+
+class TestSubjectLinker(unittest.TestCase):
+    def setUp(self):
+        self.subject_set = mock.Mock()
+        self.subject_set.id = '1'
+        self.linked = []
+
+        def http_post(path, json, retry):
+            if 'bad' in json['subjects']:
+                raise PanoptesAPIException('Invalid subject')
+            self.linked.extend(json['subjects'])
+
+        def links_add(subject_ids):
+            if 'bad' in subject_ids:
+                raise PanoptesAPIException('Invalid subject')
+            self.linked.extend(subject_ids)
+
+        self.subject_set.http_post.side_effect = http_post
+        self.subject_set.links.subjects.add.side_effect = links_add
+
+    def linker(self, **kwargs):
+        return SubjectLinker(
+            self.subject_set,
+            contextlib.nullcontext(),
+            **kwargs
+        )
+
+    def test_links_in_batches(self):
+        with self.linker() as linker:
+            linker.submit(range(100))
+        self.assertEqual(sorted(self.linked), sorted(map(str, range(100))))
+        self.assertLess(self.subject_set.http_post.call_count, 100)
+        self.assertEqual(linker.linked_count, 100)
+        self.assertEqual(linker.failed, [])
+
+    def test_isolates_failures(self):
+        with self.linker(concurrency=1) as linker:
+            linker.submit(['1', '2', 'bad', '3'])
+        self.assertEqual(sorted(self.linked), ['1', '2', '3'])
+        self.assertEqual(linker.failed, ['bad'])
+
+    def test_on_linked(self):
+        linked = []
+        with self.linker(on_linked=linked.extend) as linker:
+            linker.submit([1, 2, 3])
+        self.assertEqual(sorted(linked), ['1', '2', '3'])
+
+    def test_remove(self):
+        with self.linker(remove=True, concurrency=1) as linker:
+            linker.submit([1, 2])
+        self.subject_set.http_delete.assert_called_once_with(
+            '1/links/subjects/1,2',
+            retry=True,
+        )
+
+
+class TestFindLinkedSubjects(unittest.TestCase):
+    @mock.patch('panoptes_cli.linking.Subject')
+    def test_find_linked_subjects(self, subject_cls):
+        def where(id, page_size):
+            found = []
+            for subject_id in id.split(','):
+                if subject_id == '3':
+                    continue
+                subject = mock.Mock()
+                subject.id = subject_id
+                subject.raw = {'links': {
+                    'subject_sets': ['1'] if subject_id == '1' else ['9'],
+                }}
+                found.append(subject)
+            return iter(found)
+
+        subject_cls.where.side_effect = where
+        existing, linked = find_linked_subjects(1, [1, 2, 3])
+        self.assertEqual(existing, {'1', '2'})
+        self.assertEqual(linked, {'1'})
+        subject_cls.where.assert_called_once_with(id='1,2,3', page_size=3)
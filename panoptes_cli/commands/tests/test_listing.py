@@ -0,0 +1,102 @@
+import threading
+import unittest
+
+from unittest import mock
+
+from panoptes_cli.listing import find_many, list_pages
+from panoptes_client import Subject
+
+
+def fake_http_get(total, calls):
+    lock = threading.Lock()
+
+    def http_get(path, params={}):
+        with lock:
+            calls.append(dict(params))
+        page = params['page']
+        page_size = params['page_size']
+        ids = range((page - 1) * page_size, min(page * page_size, total))
+        page_count = (total + page_size - 1) // page_size
+        return {
+            'subjects': [{'id': str(i)} for i in ids],
+            'meta': {'subjects': {'page': page, 'page_count': page_count}},
+        }, 'etag'
+
+    return http_get
+
+
+class TestListPages(unittest.TestCase):
+    def list_ids(self, total, **kwargs):
+        calls = []
+        with mock.patch.object(
+            Subject,
+            'http_get',
+            side_effect=fake_http_get(total, calls),
+        ), mock.patch(
+            'panoptes_cli.listing.Panoptes.client',
+            return_value=mock.MagicMock(),
+        ):
+            pages = list(list_pages(Subject, **kwargs))
+        return [[s.id for s in page] for page in pages], calls
+
+    def test_in_order(self):
+        pages, calls = self.list_ids(
+            95,
+            page_size=10,
+            concurrency=3,
+            subject_set_id=5,
+        )
+        self.assertEqual(len(pages), 10)
+        self.assertEqual(sum(pages, []), [str(i) for i in range(95)])
+        self.assertEqual(sorted(c['page'] for c in calls), list(range(1, 11)))
+        self.assertTrue(all(c['subject_set_id'] == 5 for c in calls))
+
+    def test_single_page(self):
+        pages, calls = self.list_ids(3, subject_set_id=None)
+        self.assertEqual(pages, [['0', '1', '2']])
+        self.assertEqual(len(calls), 1)
+        self.assertNotIn('subject_set_id', calls[0])
+
+
+class TestFindMany(unittest.TestCase):
+    def test_in_order_with_missing(self):
+        calls = []
+        lock = threading.Lock()
+
+        def http_get(path, params={}):
+            with lock:
+                calls.append(dict(params))
+            ids = params['id'].split(',')
+            return {
+                # Returned in a different order, without odd IDs over 50
+                'subjects': [
+                    {'id': i} for i in sorted(ids, reverse=True)
+                    if int(i) <= 50 or int(i) % 2 == 0
+                ],
+                'meta': {'subjects': {'page': 1, 'page_count': 1}},
+            }, 'etag'
+
+        ids = [i * 7 % 100 for i in range(100)]
+        with mock.patch.object(
+            Subject,
+            'http_get',
+            side_effect=http_get,
+        ), mock.patch(
+            'panoptes_cli.listing.Panoptes.client',
+            return_value=mock.MagicMock(),
+        ):
+            results = list(find_many(
+                Subject,
+                iter(ids),
+                chunk_size=8,
+                concurrency=3,
+            ))
+
+        self.assertEqual([r[0] for r in results], [str(i) for i in ids])
+        for object_id, subject in results:
+            if int(object_id) <= 50 or int(object_id) % 2 == 0:
+                self.assertEqual(subject.id, object_id)
+            else:
+                self.assertIsNone(subject)
+        self.assertEqual(len(calls), 13)
+        self.assertTrue(all(c['page_size'] <= 8 for c in calls))
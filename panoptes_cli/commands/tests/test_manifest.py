@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from unittest import mock
+
+from panoptes_cli.manifest import ManifestError, ManifestReader
+
+
+class TestManifestReader(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        for name in ('a.png', 'b.png', 'c.png'):
+            with open(os.path.join(self.tmp_dir, name), 'wb') as f:
+                f.write(b'data')
+        self.manifest = os.path.join(self.tmp_dir, 'manifest.csv')
+        with open(self.manifest, 'w') as f:
+            f.write('file,%name\na.png,one\nb.png,two\nc.png,three\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_reads_rows_lazily(self):
+        reader = ManifestReader([self.manifest])
+        rows = iter(reader)
+        row_number, (files, metadata) = next(rows)
+        self.assertEqual(row_number, 0)
+        self.assertEqual(files, [os.path.join(self.tmp_dir, 'a.png')])
+        self.assertEqual(metadata, {'file': 'a.png', 'name': 'one'})
+        self.assertEqual(reader.position, 1)
+        self.assertEqual(reader.file_column, [1])
+
+    def test_start(self):
+        reader = ManifestReader([self.manifest], start=2)
+        self.assertEqual(
+            [row_number for row_number, _ in reader],
+            [2],
+        )
+
+    def test_index_fields(self):
+        index_fields = []
+        list(ManifestReader(
+            [self.manifest],
+            on_index_fields=index_fields.append,
+        ))
+        self.assertEqual(index_fields, ['name'])
+
+    def test_missing_file(self):
+        os.remove(os.path.join(self.tmp_dir, 'b.png'))
+        reader = ManifestReader([self.manifest], file_column=[1])
+        with self.assertRaises(ManifestError):
+            list(reader)
+        self.assertEqual(reader.position, 1)
+
+    def test_missing_file_allowed(self):
+        os.remove(os.path.join(self.tmp_dir, 'b.png'))
+        reader = ManifestReader(
+            [self.manifest],
+            file_column=[1],
+            allow_missing=True,
+        )
+        self.assertEqual([row_number for row_number, _ in reader], [0, 2])
+        self.assertEqual(reader.position, 3)
+
+    def test_detects_file_columns_once(self):
+        reader = ManifestReader([self.manifest])
+        with mock.patch('panoptes_cli.manifest.os.stat', wraps=os.stat) as st:
+            rows = list(reader)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(reader.file_column, [1])
+        # Each distinct value is only checked once
+        self.assertEqual(st.call_count, 6)
+
+    def test_detects_file_columns_per_manifest(self):
+        other_manifest = os.path.join(self.tmp_dir, 'other.csv')
+        with open(other_manifest, 'w') as f:
+            f.write('name,file\nfour,c.png\nfive,a.png\n')
+        reader = ManifestReader([self.manifest, other_manifest])
+        rows = list(reader)
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(
+            [files for _, (files, _) in rows[3:]],
+            [
+                [os.path.join(self.tmp_dir, 'c.png')],
+                [os.path.join(self.tmp_dir, 'a.png')],
+            ],
+        )
+        self.assertEqual(reader.file_column, [2])
+
+    def test_summary(self):
+        with open(os.path.join(self.tmp_dir, 'b.png'), 'wb'):
+            pass
+        reader = ManifestReader(
+            [self.manifest],
+            file_column=[1],
+            allow_missing=True,
+        )
+        list(reader)
+        self.assertEqual(reader.stats['files'], 2)
+        self.assertEqual(reader.stats['empty'], 1)
+        self.assertEqual(
+            reader.summary(),
+            'Checked 2 files (8 Bytes). Skipped 1 empty.',
+        )
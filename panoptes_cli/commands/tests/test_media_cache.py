@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from panoptes_cli.media_cache import MediaCache, media_hash
+
+
+class TestMediaHash(unittest.TestCase):
+    def test_content(self):
+        self.assertEqual(
+            media_hash(['image/png'], [b'one']),
+            media_hash(['image/png'], [b'one']),
+        )
+        self.assertNotEqual(
+            media_hash(['image/png'], [b'one']),
+            media_hash(['image/png'], [b'two']),
+        )
+
+    def test_remote(self):
+        location = {'image/png': 'https://example.com/1.png'}
+        self.assertEqual(
+            media_hash([location], [None]),
+            media_hash([dict(location)], [None]),
+        )
+        self.assertNotEqual(
+            media_hash([location], [None]),
+            media_hash([{'image/png': 'https://example.com/2.png'}], [None]),
+        )
+
+    def test_order(self):
+        self.assertNotEqual(
+            media_hash(['image/png', 'image/png'], [b'one', b'two']),
+            media_hash(['image/png', 'image/png'], [b'two', b'one']),
+        )
+
+
+class TestMediaCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'media-cache.db')
+        self.cache = MediaCache(self.path, 'https://www.zooniverse.org')
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_find(self):
+        self.assertIsNone(self.cache.find(1, 'abc'))
+        self.cache.add(1, 'abc', 100)
+        self.assertEqual(self.cache.find(1, 'abc'), '100')
+        self.assertEqual(self.cache.find('1', 'abc'), '100')
+        self.assertIsNone(self.cache.find(2, 'abc'))
+
+    def test_endpoint(self):
+        self.cache.add(1, 'abc', 100)
+        other = MediaCache(
+            self.path,
+            'https://panoptes-staging.zooniverse.org',
+        )
+        try:
+            self.assertIsNone(other.find(1, 'abc'))
+        finally:
+            other.close()
+
+    def test_remove(self):
+        self.cache.add(1, 'abc', 100)
+        self.cache.add(1, 'def', 101)
+        self.cache.remove([100])
+        self.assertIsNone(self.cache.find(1, 'abc'))
+        self.assertEqual(self.cache.find(1, 'def'), '101')
+
+    def test_rollback(self):
+        def subject_ids():
+            yield 100
+            raise ValueError('Bad ID')
+
+        self.cache.add(1, 'abc', 100)
+        with self.assertRaises(ValueError):
+            self.cache.remove(subject_ids())
+        self.assertEqual(self.cache.find(1, 'abc'), '100')
+        # The failed transaction isn't left open
+        self.cache.remove([100])
+        self.assertIsNone(self.cache.find(1, 'abc'))
@@ -0,0 +1,172 @@
+import threading
+import unittest
+
+from unittest import mock
+
+import requests
+
+from panoptes_cli.metadata import (
+    FAILED,
+    MISSING,
+    UNCHANGED,
+    UPDATED,
+    MetadataUpdater,
+)
+from panoptes_client import Subject
+from panoptes_client.panoptes import PanoptesAPIException
+
+SUBJECTS = {
+    '1': {'colour': 'red'},
+    '2': {'colour': 'blue', 'size': 'big'},
+    '3': {'colour': 'green'},
+}
+
+
+def http_get(path, params={}):
+    # find() asks for /subjects/<id>, and find_many() for /subjects?id=...
+    ids = params['id'].split(',') if 'id' in params else [str(path)]
+    return {
+        'subjects': [
+            {'id': i, 'metadata': dict(SUBJECTS[i]), 'locations': []}
+            for i in ids if i in SUBJECTS
+        ],
+        'meta': {'subjects': {'page': 1, 'page_count': 1}},
+    }, 'etag'
+
+
+class TestMetadataUpdater(unittest.TestCase):
+    def update(self, rows, save, **kwargs):
+        with mock.patch.object(
+            Subject,
+            'http_get',
+            side_effect=http_get,
+        ), mock.patch.object(
+            Subject,
+            'save',
+            autospec=True,
+            side_effect=save,
+        ), mock.patch(
+            'panoptes_cli.metadata.Panoptes.client',
+            return_value=mock.MagicMock(),
+        ), mock.patch(
+            'panoptes_cli.listing.Panoptes.client',
+            return_value=mock.MagicMock(),
+        ), mock.patch('panoptes_cli.metadata.time.sleep'):
+            return list(MetadataUpdater(**kwargs).update(iter(rows)))
+
+    def test_update(self):
+        saved = {}
+        lock = threading.Lock()
+
+        def save(subject, client=None):
+            with lock:
+                saved[subject.id] = subject.metadata
+
+        rows = [
+            {'subject_id': '1', 'colour': 'red'},
+            {'subject_id': '2', 'colour': 'yellow'},
+            {'subject_id': '4', 'colour': 'red'},
+            {'subject_id': '3', 'colour': 'green'},
+        ]
+        results = self.update(rows, save, chunk_size=2, concurrency=2)
+
+        self.assertEqual(
+            [(row, status) for row, status, error in results],
+            [
+                (rows[0], UNCHANGED),
+                (rows[1], UPDATED),
+                (rows[2], MISSING),
+                (rows[3], UNCHANGED),
+            ],
+        )
+        self.assertEqual(saved, {'2': {'colour': 'yellow', 'size': 'big'}})
+
+    def test_replace(self):
+        saved = {}
+
+        def save(subject, client=None):
+            saved[subject.id] = subject.metadata
+
+        self.update(
+            [{'subject_id': '2', 'colour': 'blue'}],
+            save,
+            replace=True,
+        )
+        self.assertEqual(saved, {'2': {'colour': 'blue'}})
+
+    def test_retries_then_fails(self):
+        attempts = []
+
+        def save(subject, client=None):
+            attempts.append(subject.id)
+            raise requests.exceptions.ConnectionError()
+
+        results = self.update([{'subject_id': '1', 'colour': 'pink'}], save)
+        self.assertEqual(results[0][1], FAILED)
+        self.assertIsInstance(
+            results[0][2],
+            requests.exceptions.ConnectionError,
+        )
+        self.assertEqual(len(attempts), 5)
+
+    def test_duplicate_rows(self):
+        saving = set()
+        lock = threading.Lock()
+
+        def save(subject, client=None):
+            with lock:
+                self.assertNotIn(subject.id, saving)
+                saving.add(subject.id)
+            # Wait (without time.sleep(), which is patched out) so that
+            # another save of the same subject would overlap with this one
+            threading.Event().wait(0.02)
+            with lock:
+                SUBJECTS[subject.id] = dict(subject.metadata)
+                saving.remove(subject.id)
+
+        rows = [
+            {'subject_id': '1', 'size': 'small'},
+            {'subject_id': '1', 'shape': 'round'},
+            {'subject_id': '2', 'colour': 'yellow'},
+            {'subject_id': '1', 'colour': 'pink'},
+        ]
+        with mock.patch.dict(SUBJECTS):
+            results = self.update(rows, save, concurrency=4)
+            self.assertEqual(
+                [status for row, status, error in results],
+                [UPDATED] * 4,
+            )
+            self.assertEqual(SUBJECTS['1'], {
+                'colour': 'pink',
+                'size': 'small',
+                'shape': 'round',
+            })
+
+    def test_reloads_after_api_error(self):
+        attempts = []
+
+        def save(subject, client=None):
+            attempts.append(dict(subject.metadata))
+            if len(attempts) == 1:
+                # Changed by someone else since it was fetched
+                SUBJECTS['2'] = {'colour': 'blue', 'size': 'small'}
+                raise PanoptesAPIException('Precondition failed')
+
+        with mock.patch.dict(SUBJECTS):
+            results = self.update(
+                [{'subject_id': '2', 'colour': 'yellow'}],
+                save,
+            )
+        self.assertEqual(results[0][1], UPDATED)
+        self.assertEqual(
+            attempts[-1],
+            {'colour': 'yellow', 'size': 'small'},
+        )
+
+    def test_api_error_after_reload(self):
+        def save(subject, client=None):
+            raise PanoptesAPIException('Not allowed')
+
+        results = self.update([{'subject_id': '2', 'colour': 'red'}], save)
+        self.assertEqual(results[0][1], FAILED)
+        self.assertIsInstance(results[0][2], PanoptesAPIException)
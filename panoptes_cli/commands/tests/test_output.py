@@ -0,0 +1,82 @@
+import json
+import unittest
+
+from unittest import mock
+
+import click
+
+from click.testing import CliRunner
+
+from panoptes_cli.output import Emitter
+from panoptes_cli.scripts.panoptes import cli
+
+RECORDS = [
+    {'id': '1', 'display_name': 'First', 'locations': ['a.png', 'b.png']},
+    {'id': '2', 'display_name': 'Tab\tseparated', 'locations': None},
+]
+
+
+def emit(output_format, records, columns=None):
+    @click.command()
+    def command():
+        Emitter(output_format, columns).emit_all(records)
+
+    result = CliRunner().invoke(command)
+    if result.exception:
+        raise result.exception
+    return result.output
+
+
+class TestEmitter(unittest.TestCase):
+    def test_jsonl(self):
+        lines = emit('jsonl', RECORDS).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], RECORDS)
+
+    def test_csv(self):
+        self.assertEqual(
+            emit('csv', RECORDS),
+            'id,display_name,locations\n'
+            '1,First,"[""a.png"", ""b.png""]"\n'
+            '2,Tab\tseparated,\n',
+        )
+
+    def test_tsv_columns(self):
+        self.assertEqual(
+            emit('tsv', RECORDS, columns=['display_name', 'id']),
+            'display_name\tid\n'
+            'First\t1\n'
+            '"Tab\tseparated"\t2\n',
+        )
+
+    def test_no_records(self):
+        self.assertEqual(emit('csv', []), '')
+
+
+class TestSubjectInfo(unittest.TestCase):
+    def info(self, args):
+        subjects = [
+            mock.MagicMock(raw={'id': str(i), 'metadata': {}})
+            for i in (1, 2)
+        ]
+        with mock.patch(
+            'panoptes_cli.commands.subject.found_subjects',
+            return_value=iter(subjects),
+        ):
+            return CliRunner().invoke(cli, args, obj=mock.MagicMock())
+
+    def test_csv(self):
+        result = self.info(['--format', 'csv', 'subject', 'info', '1', '2'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(result.output, 'id,metadata\n1,{}\n2,{}\n')
+
+    def test_text(self):
+        result = self.info(['subject', 'info', '1', '2'])
+        self.assertEqual(
+            result.output,
+            'id: \'1\'\nmetadata: {}\n\n---\nid: \'2\'\nmetadata: {}\n\n',
+        )
+
+    def test_no_ids(self):
+        result = self.info(['subject', 'info'])
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn('Give at least one subject ID', result.output)
@@ -0,0 +1,159 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import click
+
+from panoptes_cli.resource_cache import (
+    ResourceCache,
+    cached_find,
+    invalidate_cached,
+)
+from panoptes_client.panoptes import PanoptesAPIException
+
+
+class FakeProject(object):
+    _api_slug = 'projects'
+
+    def __init__(self, raw, etag=None):
+        self.raw = raw
+        self.id = raw['id']
+        self.etag = etag
+
+    @classmethod
+    def http_get(cls, path, params={}, headers={}):
+        cls.requests.append(dict(headers))
+        return cls.responses.pop(0)
+
+    @classmethod
+    def find(cls, _id):
+        cls.requests.append(None)
+        return cls({'id': str(_id)})
+
+
+class TestResourceCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = ResourceCache(
+            os.path.join(self.tmp_dir, 'resources.db'),
+            'https://www.zooniverse.org someone',
+        )
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_get(self):
+        self.assertIsNone(self.cache.get('projects', 1))
+        self.cache.put('projects', 1, {'id': '1'}, 'W/"abc"')
+        entry = self.cache.get('projects', '1')
+        self.assertEqual(entry.raw, {'id': '1'})
+        self.assertEqual(entry.etag, 'W/"abc"')
+        self.assertTrue(entry.fresh)
+
+    def test_ttl(self):
+        self.cache.ttls = {'projects': 0}
+        self.cache.put('projects', 1, {'id': '1'}, 'W/"abc"')
+        self.assertFalse(self.cache.get('projects', 1).fresh)
+        self.cache.ttls = {'projects': 60}
+        self.cache.revalidated('projects', 1)
+        self.assertTrue(self.cache.get('projects', 1).fresh)
+
+    def test_scope(self):
+        self.cache.put('projects', 1, {'id': '1'}, None)
+        other = ResourceCache(self.cache.path, 'https://example.com someone')
+        try:
+            self.assertIsNone(other.get('projects', 1))
+        finally:
+            other.close()
+
+    def test_evict(self):
+        self.cache.max_size = 35
+        for resource_id in (1, 2, 3):
+            self.cache.put('workflows', resource_id, {'id': 'x'}, None)
+        self.cache.get('workflows', 1)
+        self.cache.put('workflows', 4, {'id': 'x'}, None)
+        self.assertIsNotNone(self.cache.get('workflows', 1))
+        self.assertIsNone(self.cache.get('workflows', 2))
+        self.assertIsNotNone(self.cache.get('workflows', 4))
+
+
+class TestCachedFind(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        FakeProject.requests = []
+        FakeProject.responses = []
+        self.ctx = click.Context(click.Command('panoptes'))
+        self.ctx.no_cache = False
+        self.ctx.config_dir = self.tmp_dir
+        self.ctx.config = {
+            'endpoint': 'https://www.zooniverse.org',
+            'username': 'someone',
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_cached(self):
+        FakeProject.responses = [({'projects': [{'id': '1'}]}, 'W/"abc"')]
+        with self.ctx:
+            cached_find(FakeProject, 1)
+            project = cached_find(FakeProject, 1)
+        self.assertEqual(project.raw, {'id': '1'})
+        self.assertEqual(project.etag, 'W/"abc"')
+        self.assertEqual(FakeProject.requests, [{}])
+
+    def test_revalidate(self):
+        FakeProject.responses = [
+            ({'projects': [{'id': '1'}]}, 'W/"abc"'),
+            (None, 'W/"abc"'),
+        ]
+        with self.ctx:
+            cached_find(FakeProject, 1)
+            self.ctx.resource_cache.ttls = {'projects': 0}
+            project = cached_find(FakeProject, 1)
+        self.assertEqual(project.raw, {'id': '1'})
+        self.assertEqual(
+            FakeProject.requests,
+            [{}, {'If-None-Match': 'W/"abc"'}],
+        )
+
+    def test_invalidate(self):
+        FakeProject.responses = [
+            ({'projects': [{'id': '1'}]}, 'W/"abc"'),
+            ({'projects': []}, None),
+        ]
+        with self.ctx:
+            invalidate_cached(cached_find(FakeProject, 1))
+            with self.assertRaises(PanoptesAPIException):
+                cached_find(FakeProject, 1)
+
+    def test_admin_scope(self):
+        FakeProject.responses = [
+            ({'projects': [{'id': '1'}]}, 'W/"abc"'),
+            ({'projects': [{'id': '1', 'private': True}]}, 'W/"def"'),
+        ]
+        with self.ctx:
+            cached_find(FakeProject, 1)
+        admin_ctx = click.Context(click.Command('panoptes'))
+        admin_ctx.no_cache = False
+        admin_ctx.admin = True
+        admin_ctx.config_dir = self.ctx.config_dir
+        admin_ctx.config = self.ctx.config
+        with admin_ctx:
+            project = cached_find(FakeProject, 1)
+            self.assertEqual(project.raw, {'id': '1', 'private': True})
+            self.assertEqual(
+                admin_ctx.resource_cache.scope,
+                'https://www.zooniverse.org someone admin',
+            )
+        self.assertEqual(FakeProject.requests, [{}, {}])
+
+    def test_no_cache(self):
+        self.ctx.no_cache = True
+        with self.ctx:
+            cached_find(FakeProject, 1)
+            cached_find(FakeProject, 1)
+        self.assertEqual(FakeProject.requests, [None, None])
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, 'cache')))
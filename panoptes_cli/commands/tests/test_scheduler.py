@@ -0,0 +1,138 @@
+import threading
+import time
+import unittest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import requests
+
+from panoptes_cli.scheduler import (
+    SchedulingAdapter,
+    TokenBucket,
+    retry_after,
+)
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+    # Statuses to respond with, in order, before responding with 200
+    statuses = []
+    requests = []
+
+    def respond(self):
+        self.requests.append(self.command)
+        status = self.statuses.pop(0) if self.statuses else 200
+        self.send_response(status)
+        if status == 429:
+            self.send_header('Retry-After', '0')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    do_GET = do_POST = respond
+
+    def log_message(self, *args):
+        pass
+
+
+class TestSchedulingAdapter(unittest.TestCase):
+    def setUp(self):
+        StatusHandler.requests = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StatusHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:{}/'.format(self.server.server_port)
+        self.session = requests.Session()
+        self.session.mount('http://', SchedulingAdapter(rate=0))
+
+    def tearDown(self):
+        self.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_retries_too_many_requests(self):
+        StatusHandler.statuses = [429, 429]
+        response = self.session.post(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(StatusHandler.requests, ['POST'] * 3)
+
+    def test_server_errors_only_retried_when_idempotent(self):
+        StatusHandler.statuses = [502]
+        with mock.patch('panoptes_cli.scheduler.time.sleep'):
+            self.assertEqual(self.session.get(self.url).status_code, 200)
+        StatusHandler.statuses = [502]
+        self.assertEqual(self.session.post(self.url).status_code, 502)
+        self.assertEqual(StatusHandler.requests, ['GET', 'GET', 'POST'])
+
+    def test_gives_up(self):
+        StatusHandler.statuses = [503] * 10
+        with mock.patch('panoptes_cli.scheduler.time.sleep'):
+            self.assertEqual(self.session.get(self.url).status_code, 503)
+        self.assertEqual(len(StatusHandler.requests), 5)
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_rate(self):
+        bucket = TokenBucket(rate=100, capacity=5)
+        start = time.monotonic()
+        for _ in range(25):
+            bucket.acquire()
+        # 5 straight away, then 20 at 100 per second
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+
+    def test_retry_after(self):
+        response = requests.Response()
+        response.headers['Retry-After'] = '7'
+        self.assertEqual(retry_after(response), 7)
+        response.headers['Retry-After'] = 'Wed, 21 Oct 2015 07:28:00 GMT'
+        self.assertEqual(retry_after(response), 0)
+        response.headers['Retry-After'] = 'soon'
+        self.assertIsNone(retry_after(response))
+
+
+class TestFit(unittest.TestCase):
+    def test_grows_pool_with_concurrency(self):
+        adapter = SchedulingAdapter(concurrency=4)
+        self.assertEqual(adapter.pool_size, 4)
+        adapter.fit(10)
+        self.assertEqual(adapter.concurrency, 4)
+        self.assertEqual(adapter.pool_size, 10)
+        adapter.fit(2)
+        self.assertEqual(adapter.pool_size, 10)
+
+    def test_given_pool_size_kept(self):
+        adapter = SchedulingAdapter(concurrency=4, pool_maxsize=2)
+        adapter.fit(10)
+        self.assertEqual(adapter.pool_size, 2)
+
+    def test_concurrency_is_a_ceiling(self):
+        adapter = SchedulingAdapter(rate=0, concurrency=2)
+        adapter.fit(6)
+        lock = threading.Lock()
+        in_flight = []
+        max_in_flight = []
+
+        def send(request, **kwargs):
+            with lock:
+                in_flight.append(request)
+                max_in_flight.append(len(in_flight))
+            time.sleep(0.05)
+            with lock:
+                in_flight.remove(request)
+            return mock.MagicMock(status_code=200)
+
+        with mock.patch(
+            'panoptes_cli.scheduler.PooledAdapter.send',
+            side_effect=send,
+        ):
+            threads = [
+                threading.Thread(
+                    target=adapter.send,
+                    args=(mock.MagicMock(),),
+                )
+                for _ in range(6)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(max_in_flight), 6)
+        self.assertEqual(max(max_in_flight), 2)
@@ -0,0 +1,115 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from panoptes_cli.forward import forward, forwardable
+
+# Serves a few commands which show what they were run with
+SERVER_SCRIPT = '''
+import os, sys
+import click
+from panoptes_cli.server import CommandServer
+
+@click.group()
+def cli():
+    pass
+
+@cli.command()
+@click.argument('name')
+@click.pass_obj
+def hello(obj, name):
+    click.echo('Hello {} from {} in {}'.format(name, obj, os.getcwd()))
+
+@cli.command()
+def upper():
+    click.echo(sys.stdin.read().upper(), nl=False)
+
+@cli.command()
+def fail():
+    raise click.ClickException('Something went wrong')
+
+server = CommandServer(sys.argv[1], cli, 'server', idle_timeout=30)
+server.listen()
+print('ready', flush=True)
+server.serve_forever()
+'''
+
+CLIENT_SCRIPT = '''
+import sys
+from panoptes_cli.forward import forward
+exit_code = forward(sys.argv[2:], sys.argv[1])
+sys.exit(99 if exit_code is None else exit_code)
+'''
+
+
+class TestForwardable(unittest.TestCase):
+    def test_commands(self):
+        self.assertTrue(forwardable(['project', 'ls']))
+        self.assertTrue(forwardable(['--format', 'jsonl', 'project', 'ls']))
+        self.assertTrue(forwardable(['--format=csv', '--no-cache', 'user']))
+
+    def test_local(self):
+        self.assertFalse(forwardable([]))
+        self.assertFalse(forwardable(['--help']))
+        self.assertFalse(forwardable(['configure']))
+        self.assertFalse(forwardable(['serve']))
+        self.assertFalse(forwardable(['--admin', 'project', 'delete', '1']))
+        self.assertFalse(forwardable(['-e', 'https://example.com', 'user']))
+
+
+class TestServe(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.tmp_dir, 'serve.sock')
+        self.server = subprocess.Popen(
+            [sys.executable, '-c', SERVER_SCRIPT, self.socket_path],
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        self.assertEqual(self.server.stdout.readline(), 'ready\n')
+
+    def tearDown(self):
+        self.server.terminate()
+        self.server.wait()
+        self.server.stdout.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def forward(self, *args, **kwargs):
+        return subprocess.run(
+            [sys.executable, '-c', CLIENT_SCRIPT, self.socket_path]
+            + list(args),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            **kwargs
+        )
+
+    def test_output(self):
+        result = self.forward('hello', 'world', cwd=self.tmp_dir)
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(
+            result.stdout,
+            'Hello world from server in {}\n'.format(
+                os.path.realpath(self.tmp_dir),
+            ),
+        )
+
+    def test_stdin(self):
+        result = self.forward('upper', input='one\ntwo\n')
+        self.assertEqual(result.stdout, 'ONE\nTWO\n')
+
+    def test_error(self):
+        result = self.forward('fail')
+        self.assertEqual(result.returncode, 1)
+        self.assertEqual(result.stderr, 'Error: Something went wrong\n')
+
+    def test_socket_permissions(self):
+        self.assertEqual(os.stat(self.socket_path).st_mode & 0o777, 0o600)
+
+    def test_not_running(self):
+        self.assertIsNone(
+            forward(['hello', 'world'], os.path.join(self.tmp_dir, 'none')),
+        )
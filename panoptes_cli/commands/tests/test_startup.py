@@ -0,0 +1,79 @@
+import importlib
+import json
+import subprocess
+import sys
+import unittest
+
+from panoptes_cli.scripts.panoptes import COMMANDS, cli
+
+# Runs the CLI in a fresh interpreter, and prints which of the slow modules
+# were imported and whether it connected to the API
+STARTUP_SCRIPT = '''
+import json, sys
+from click.testing import CliRunner
+from panoptes_cli.scripts.panoptes import cli
+result = CliRunner().invoke(cli, sys.argv[1:])
+client = sys.modules.get('panoptes_client.panoptes')
+print(json.dumps({
+    'exit_code': result.exit_code,
+    'modules': sorted(m for m in sys.modules if m.startswith(
+        ('panoptes_client', 'panoptes_cli.commands.', 'humanize', 'requests')
+    )),
+    'connected': bool(client and getattr(
+        client.Panoptes._local, 'panoptes_client', None
+    )),
+}))
+'''
+
+
+def startup(*args):
+    output = subprocess.check_output(
+        [sys.executable, '-c', STARTUP_SCRIPT] + list(args),
+    )
+    return json.loads(output)
+
+
+class TestLazyCommands(unittest.TestCase):
+    def test_registry_matches_commands(self):
+        for name, (module, short_help) in COMMANDS.items():
+            importlib.import_module(module)
+            self.assertIn(name, cli.commands)
+            self.assertEqual(
+                cli.commands[name].get_short_help_str(limit=1000),
+                short_help,
+            )
+
+    def test_help_imports_nothing(self):
+        result = startup('--help')
+        self.assertEqual(result['exit_code'], 0)
+        self.assertEqual(result['modules'], [])
+
+    def test_subcommand_help_imports_only_its_module(self):
+        result = startup('project', 'ls', '--help')
+        self.assertEqual(result['exit_code'], 0)
+        self.assertFalse(result['connected'])
+        commands = [
+            m for m in result['modules']
+            if m.startswith('panoptes_cli.commands.')
+        ]
+        self.assertEqual(commands, ['panoptes_cli.commands.project'])
+        self.assertNotIn('humanize', result['modules'])
+
+    def test_forwarding_imports_nothing(self):
+        output = subprocess.check_output([
+            sys.executable,
+            '-c',
+            'import sys, panoptes_cli.forward; '
+            'print(sorted(m for m in ("click", "yaml", "requests") '
+            'if m in sys.modules))',
+        ])
+        self.assertEqual(output.strip(), b'[]')
+
+    def test_root_command_imports_no_yaml(self):
+        output = subprocess.check_output([
+            sys.executable,
+            '-c',
+            'import sys, panoptes_cli.scripts.panoptes; '
+            'print("yaml" in sys.modules)',
+        ])
+        self.assertEqual(output.strip(), b'False')
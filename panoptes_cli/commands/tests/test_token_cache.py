@@ -0,0 +1,132 @@
+import datetime
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from unittest import mock
+
+from click.testing import CliRunner
+
+from panoptes_cli.scripts.panoptes import cli
+from panoptes_cli.token_cache import TokenCache
+from panoptes_client import Panoptes
+
+
+class FakeClient(object):
+    def __init__(self, username='someone', refresh_works=True):
+        self.endpoint = 'https://www.zooniverse.org'
+        self.username = username
+        self.logged_in = False
+        self.logged_in_user_id = None
+        self.bearer_token = None
+        self.refresh_token = None
+        self.bearer_expires = None
+        self.refresh_works = refresh_works
+        self.refreshed = False
+
+    def log_in(self, expires_in=7200):
+        self.logged_in = True
+        self.logged_in_user_id = 42
+        self.bearer_token = 'token'
+        self.refresh_token = 'refresh'
+        self.bearer_expires = (
+            datetime.datetime.now() + datetime.timedelta(seconds=expires_in)
+        )
+
+    def get_bearer_token(self):
+        self.refreshed = True
+        if not self.refresh_works:
+            raise Exception('Refresh failed')
+        self.bearer_token = 'new token'
+        self.bearer_expires = (
+            datetime.datetime.now() + datetime.timedelta(hours=2)
+        )
+        return self.bearer_token
+
+
+class TestTokenCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = TokenCache(
+            os.path.join(self.tmp_dir, 'config', 'token-cache.json'),
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def saved_client(self, expires_in=7200):
+        client = FakeClient()
+        client.log_in(expires_in)
+        self.cache.save(client)
+        return client
+
+    def test_restore(self):
+        self.saved_client()
+        self.assertEqual(
+            stat.S_IMODE(os.stat(self.cache.path).st_mode),
+            0o600,
+        )
+
+        client = FakeClient()
+        self.assertTrue(self.cache.restore(client))
+        self.assertTrue(client.logged_in)
+        self.assertEqual(client.bearer_token, 'token')
+        self.assertEqual(client.logged_in_user_id, 42)
+        self.assertFalse(client.refreshed)
+
+        self.assertFalse(self.cache.restore(FakeClient(username='other')))
+
+    def test_refreshes_expiring_token(self):
+        self.saved_client(expires_in=60)
+        client = FakeClient()
+        self.assertTrue(self.cache.restore(client))
+        self.assertTrue(client.refreshed)
+        self.assertEqual(client.bearer_token, 'new token')
+
+    def test_failed_refresh_logs_in_again(self):
+        self.saved_client(expires_in=60)
+        client = FakeClient(refresh_works=False)
+        self.assertFalse(self.cache.restore(client))
+        self.assertFalse(client.logged_in)
+        self.assertIsNone(client.bearer_token)
+
+    def test_clear(self):
+        self.saved_client()
+        self.cache.clear()
+        self.assertFalse(self.cache.restore(FakeClient()))
+        self.cache.clear()
+
+
+class TestConnect(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.tmp_dir, '.panoptes'))
+        with open(
+            os.path.join(self.tmp_dir, '.panoptes', 'config.yml'),
+            'w',
+        ) as config_f:
+            config_f.write('username: configured\npassword: secret\n')
+
+    def tearDown(self):
+        Panoptes._local.panoptes_client = None
+        shutil.rmtree(self.tmp_dir)
+
+    def test_ignores_environment_credentials(self):
+        with mock.patch.object(
+            Panoptes,
+            'get_csrf_token',
+            side_effect=AssertionError('Logged in'),
+        ):
+            result = CliRunner().invoke(cli, ['info'], env={
+                'HOME': self.tmp_dir,
+                'PANOPTES_USERNAME': 'someone-else',
+                'PANOPTES_PASSWORD': 'other',
+            })
+        self.assertEqual(result.exit_code, 0, result.output)
+
+        client = Panoptes.client()
+        self.assertFalse(client.logged_in)
+        self.assertEqual(client.username, 'configured')
+        self.assertEqual(client.password, 'secret')
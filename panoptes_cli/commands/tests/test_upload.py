@@ -0,0 +1,460 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from unittest import mock
+
+import requests
+
+from click.testing import CliRunner
+
+from panoptes_cli.commands import subject_set as subject_set_commands
+from panoptes_cli.media_cache import MediaCache, media_hash
+from panoptes_cli.scripts.panoptes import cli
+from panoptes_cli.upload import (
+    MEDIA_QUEUE_PER_WORKER,
+    UploadEngine,
+    UploadTracker,
+    take_media_files,
+)
+from panoptes_client import Subject
+
+# The smallest file libmagic recognises as an image
+GIF_DATA = b'GIF89a\x01\x00\x01\x00\x00\x00\x00;'
+
+
+def fake_save(saved, lock, block=None):
+    """
+    Returns a replacement for Subject.save which gives each subject the next
+    ID and an upload URL for each of its local files, as the API would.
+    """
+
+    def save(subject, client=None):
+        if block is not None:
+            block.wait()
+        with lock:
+            subject_id = str(len(saved) + 1)
+            saved.append(subject_id)
+        subject.set_raw({
+            'id': subject_id,
+            'metadata': subject.metadata,
+            'locations': [
+                location if isinstance(location, dict) else {
+                    location: 'https://uploads/{}/{}'.format(subject_id, i),
+                }
+                for i, location in enumerate(subject.locations)
+            ],
+        })
+
+    return save
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('Timed out')
+        time.sleep(0.01)
+
+
+class TestUploadEngine(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.files = []
+        for i in range(10):
+            path = os.path.join(self.tmp_dir, '{}.gif'.format(i))
+            with open(path, 'wb') as f:
+                f.write(GIF_DATA)
+            self.files.append(path)
+        self.saved = []
+        self.lock = threading.Lock()
+        patcher = mock.patch.object(
+            Subject,
+            'save',
+            autospec=True,
+            side_effect=fake_save(self.saved, self.lock),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def engine(self, put, **kwargs):
+        engine = UploadEngine(mock.MagicMock(), '7', **kwargs)
+        engine._media_session.put = mock.MagicMock(side_effect=put)
+        return engine
+
+    def test_future_completion(self):
+        with self.engine(lambda url, **kwargs: mock.MagicMock()) as engine:
+            futures = [
+                engine.submit((i, ([path], {'name': str(i)})))
+                for i, path in enumerate(self.files)
+            ]
+            subject_ids = [future.result(timeout=5) for future in futures]
+            put = engine._media_session.put
+
+        self.assertEqual(sorted(subject_ids, key=int), self.saved)
+        self.assertEqual(put.call_count, 10)
+        self.assertEqual(
+            sorted(call.args[0] for call in put.call_args_list),
+            sorted('https://uploads/{}/0'.format(i) for i in subject_ids),
+        )
+        self.assertTrue(all(
+            call.kwargs['data'] == GIF_DATA for call in put.call_args_list
+        ))
+
+    def test_remote_media(self):
+        with self.engine(lambda url, **kwargs: None) as engine:
+            future = engine.submit(
+                (0, ([{'image/png': 'https://example.com/0.png'}], {})),
+            )
+            self.assertEqual(future.result(timeout=5), '1')
+            engine._media_session.put.assert_not_called()
+
+    def test_skip_existing(self):
+        media_cache = MediaCache(
+            os.path.join(self.tmp_dir, 'media-cache.db'),
+            'https://www.zooniverse.org',
+        )
+        self.addCleanup(media_cache.close)
+        subject_hash = media_hash(['image/gif'], [GIF_DATA])
+        media_cache.add('7', subject_hash, '90')
+
+        def put(url, **kwargs):
+            return mock.MagicMock()
+
+        with mock.patch(
+            'panoptes_cli.upload.subject_exists',
+            return_value=True,
+        ), self.engine(
+            put,
+            media_cache=media_cache,
+            skip_existing=True,
+        ) as engine:
+            subject_id = engine.submit((0, ([self.files[0]], {}))).result()
+        self.assertEqual(subject_id, '90')
+        self.assertEqual(self.saved, [])
+
+        # A cached subject which has since been deleted is uploaded again
+        with mock.patch(
+            'panoptes_cli.upload.subject_exists',
+            return_value=False,
+        ), self.engine(
+            put,
+            media_cache=media_cache,
+            skip_existing=True,
+        ) as engine:
+            subject_id = engine.submit((0, ([self.files[0]], {}))).result()
+        self.assertEqual(subject_id, '1')
+        self.assertEqual(media_cache.find('7', subject_hash), '1')
+
+    def test_media_failure(self):
+        def put(url, **kwargs):
+            if url.startswith('https://uploads/2/'):
+                raise requests.exceptions.ConnectionError('Unreachable')
+            return mock.MagicMock()
+
+        tracker = UploadTracker()
+        with mock.patch('panoptes_cli.upload.time.sleep'), self.engine(
+            put,
+            concurrency=1,
+        ) as engine:
+            for i, path in enumerate(self.files[:3]):
+                subject_row = (i, ([path], {}))
+                tracker.add(engine.submit(subject_row), subject_row)
+
+            finished = []
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                for subject_id, subject_row in tracker.wait(0):
+                    finished.append(subject_id)
+
+        # The failed row is kept, so it can be retried
+        self.assertEqual(len(tracker), 3 - len(finished))
+        self.assertNotIn('2', finished)
+        self.assertEqual(
+            sorted(subject_id for subject_id, _ in tracker.drain()),
+            sorted({'1', '3'} - set(finished)),
+        )
+        self.assertEqual(len(tracker), 1)
+
+    def test_media_slots(self):
+        release = threading.Event()
+        in_flight = []
+        max_in_flight = []
+
+        def put(url, **kwargs):
+            release.wait()
+            return mock.MagicMock()
+
+        with self.engine(put, concurrency=5, media_concurrency=1) as engine:
+            submit = engine._media_exec.submit
+
+            def counting_submit(*args):
+                with self.lock:
+                    in_flight.append(args)
+                    max_in_flight.append(len(in_flight))
+                future = submit(*args)
+                future.add_done_callback(lambda _: in_flight.pop())
+                return future
+
+            engine._media_exec.submit = counting_submit
+            try:
+                futures = [
+                    engine.submit((i, ([path], {})))
+                    for i, path in enumerate(self.files)
+                ]
+
+                # Once the slots are full, each creation worker stops after
+                # creating one more subject, until media uploads catch up
+                wait_for(lambda: len(self.saved) == MEDIA_QUEUE_PER_WORKER + 5)
+                time.sleep(0.1)
+                self.assertEqual(len(in_flight), MEDIA_QUEUE_PER_WORKER)
+                self.assertEqual(len(self.saved), MEDIA_QUEUE_PER_WORKER + 5)
+                self.assertFalse(any(future.done() for future in futures))
+            finally:
+                release.set()
+            for future in futures:
+                future.result(timeout=5)
+
+        self.assertEqual(max(max_in_flight), MEDIA_QUEUE_PER_WORKER)
+        self.assertEqual(engine._media_session.put.call_count, 10)
+
+
+class TestTakeMediaFiles(unittest.TestCase):
+    def test_local_and_remote(self):
+        subject = Subject()
+        subject.add_location({'image/png': 'https://example.com/0.png'})
+        subject.add_location(mock.MagicMock(read=lambda: GIF_DATA))
+        self.assertEqual(take_media_files(subject), [None, GIF_DATA])
+        self.assertEqual(subject._media_files, [None, None])
+
+    def test_fallback(self):
+        subject = Subject()
+        subject.add_location(mock.MagicMock(read=lambda: GIF_DATA))
+        del subject._media_files
+        self.assertIsNone(take_media_files(subject))
+
+
+class TestUploadSubjects(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.manifest = os.path.join(self.tmp_dir, 'manifest.csv')
+        with open(self.manifest, 'w') as manifest:
+            manifest.write('file,name\n')
+            for i in range(10):
+                with open(
+                    os.path.join(self.tmp_dir, '{}.gif'.format(i)),
+                    'wb',
+                ) as f:
+                    f.write(GIF_DATA)
+                manifest.write('{}.gif,{}\n'.format(i, i))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_backpressure(self):
+        saved = []
+        submitted = []
+        lock = threading.Lock()
+        release = threading.Event()
+        subject_set = mock.MagicMock(
+            id='5',
+            raw={'links': {'project': '7'}},
+            metadata={},
+        )
+        submit = UploadEngine.submit
+
+        def counting_submit(engine, subject_row):
+            submitted.append(subject_row)
+            return submit(engine, subject_row)
+
+        result = []
+
+        def upload():
+            result.append(CliRunner().invoke(
+                cli,
+                [
+                    '--no-cache',
+                    'subject-set',
+                    'upload-subjects',
+                    '-c', '1',
+                    '-j', os.path.join(self.tmp_dir, 'upload.journal'),
+                    '5',
+                    self.manifest,
+                ],
+                obj=mock.MagicMock(),
+                env={'HOME': self.tmp_dir},
+            ))
+
+        with mock.patch.object(
+            Subject,
+            'save',
+            autospec=True,
+            side_effect=fake_save(saved, lock, block=release),
+        ), mock.patch.object(
+            UploadEngine,
+            'submit',
+            autospec=True,
+            side_effect=counting_submit,
+        ), mock.patch.object(
+            subject_set_commands,
+            'PENDING_SUBJECTS_PER_WORKER',
+            2,
+        ), mock.patch(
+            'panoptes_cli.commands.subject_set.SubjectSet.find',
+            return_value=subject_set,
+        ), mock.patch(
+            'panoptes_cli.commands.subject_set.Panoptes.client',
+            return_value=mock.MagicMock(),
+        ), mock.patch(
+            'panoptes_cli.upload.requests.Session',
+        ):
+            thread = threading.Thread(target=upload)
+            thread.start()
+            try:
+                # With one worker, no more than two subjects are left
+                # pending before the manifest stops being read
+                wait_for(lambda: len(submitted) == 3)
+                time.sleep(0.1)
+                self.assertEqual(len(submitted), 3)
+            finally:
+                release.set()
+                thread.join()
+
+        self.assertEqual(result[0].exit_code, 0, result[0].output)
+        self.assertEqual(len(submitted), 10)
+        self.assertEqual(len(saved), 10)
+        linked = sum(
+            (
+                call.kwargs['json']['subjects']
+                for call in subject_set.http_post.call_args_list
+            ),
+            [],
+        )
+        self.assertEqual(sorted(linked, key=int), saved)
+        self.assertFalse(
+            os.path.exists(os.path.join(self.tmp_dir, 'upload.journal')),
+        )
+
+    def test_skip_existing_links_reused_subjects(self):
+        os.mkdir(os.path.join(self.tmp_dir, '.panoptes'))
+        media_cache = MediaCache(
+            os.path.join(self.tmp_dir, '.panoptes', 'media-cache.db'),
+            'https://www.zooniverse.org',
+        )
+        media_cache.add(
+            '7',
+            media_hash(['image/gif'], [GIF_DATA]),
+            '90',
+        )
+        media_cache.close()
+        saved = []
+        subject_set = mock.MagicMock(
+            id='5',
+            raw={'links': {'project': '7'}},
+            metadata={},
+        )
+        with mock.patch.object(
+            Subject,
+            'save',
+            autospec=True,
+            side_effect=fake_save(saved, threading.Lock()),
+        ), mock.patch(
+            'panoptes_cli.upload.subject_exists',
+            return_value=True,
+        ), mock.patch(
+            'panoptes_cli.commands.subject_set.SubjectSet.find',
+            return_value=subject_set,
+        ), mock.patch(
+            'panoptes_cli.commands.subject_set.Panoptes.client',
+            return_value=mock.MagicMock(),
+        ), mock.patch(
+            'panoptes_cli.upload.requests.Session',
+        ):
+            # The subject could have been removed from the set after the
+            # first upload, so it's linked again the second time
+            for _ in range(2):
+                subject_set.http_post.reset_mock()
+                result = CliRunner().invoke(
+                    cli,
+                    [
+                        '--no-cache',
+                        'subject-set',
+                        'upload-subjects',
+                        '-S',
+                        '-j', os.path.join(self.tmp_dir, 'upload.journal'),
+                        '5',
+                        self.manifest,
+                    ],
+                    obj=mock.MagicMock(),
+                    env={'HOME': self.tmp_dir},
+                )
+                self.assertEqual(result.exit_code, 0, result.output)
+                linked = sum(
+                    (
+                        call.kwargs['json']['subjects']
+                        for call in subject_set.http_post.call_args_list
+                    ),
+                    [],
+                )
+                # Every row has the same media, so they all reuse it
+                self.assertEqual(set(linked), {'90'})
+        self.assertEqual(saved, [])
+
+    def test_resume_detects_file_columns(self):
+        # The second manifest has its files in a different column, and the
+        # first upload stops part way through the first one
+        os.remove(os.path.join(self.tmp_dir, '5.gif'))
+        other_manifest = os.path.join(self.tmp_dir, 'other.csv')
+        with open(other_manifest, 'w') as manifest:
+            manifest.write('name,file\n10,0.gif\n11,1.gif\n')
+        journal_file = os.path.join(self.tmp_dir, 'upload.journal')
+        saved = []
+        subject_set = mock.MagicMock(
+            id='5',
+            raw={'links': {'project': '7'}},
+            metadata={},
+        )
+
+        def upload(*args):
+            return CliRunner().invoke(
+                cli,
+                ['--no-cache', 'subject-set', 'upload-subjects'] + list(args),
+                obj=mock.MagicMock(),
+                env={'HOME': self.tmp_dir},
+            )
+
+        with mock.patch.object(
+            Subject,
+            'save',
+            autospec=True,
+            side_effect=fake_save(saved, threading.Lock()),
+        ), mock.patch(
+            'panoptes_cli.commands.subject_set.SubjectSet.find',
+            return_value=subject_set,
+        ), mock.patch(
+            'panoptes_cli.commands.subject_set.Panoptes.client',
+            return_value=mock.MagicMock(),
+        ), mock.patch(
+            'panoptes_cli.upload.requests.Session',
+        ):
+            result = upload(
+                '-j', journal_file,
+                '5',
+                self.manifest,
+                other_manifest,
+            )
+            self.assertIn('Upload failed', result.output)
+            self.assertEqual(len(saved), 5)
+
+            with open(os.path.join(self.tmp_dir, '5.gif'), 'wb') as f:
+                f.write(GIF_DATA)
+            result = upload('5', journal_file)
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(len(saved), 12)
+        self.assertFalse(os.path.exists(journal_file))
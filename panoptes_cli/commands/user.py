@@ -1,7 +1,7 @@
-import yaml
-
 import click
 
+from panoptes_cli.deletion import delete_options, delete_resources
+from panoptes_cli.output import echo_raw
 from panoptes_cli.scripts.panoptes import cli
 from panoptes_client import Panoptes, User
 
@@ -60,30 +60,26 @@ def info(user_id, email, login):
         if getattr(user, 'login', '') != login:
             click.echo('User not found', err=True)
             return -1
-    click.echo(yaml.dump(user.raw))
+    echo_raw(user.raw)
 
 
 @user.command()
-@click.option(
-    '--force',
-    '-f',
-    is_flag=True,
-    help='Delete without asking for confirmation.',
-)
-@click.argument('user-ids', required=True, nargs=-1, type=int)
-def delete(force, user_ids):
+@delete_options
+@click.argument('user-ids', nargs=-1, type=int)
+def delete(force, id_file, concurrency, report_file, user_ids):
     """
     Deletes a user. Only works if you're an admin.
     """
 
-    for user_id in user_ids:
-        user = User.find(user_id)
-        if not force:
-            click.confirm('Delete user {} ({})?'.format(
-                user_id,
-                user.login,
-            ), abort=True)
-        user.delete()
+    return delete_resources(
+        User,
+        user_ids,
+        id_file,
+        force,
+        concurrency,
+        report_file,
+        describe_with='login',
+    )
 
 
 @user.command()
@@ -1,7 +1,14 @@
-import yaml
-
 import click
 
+from panoptes_cli.deletion import delete_options, delete_resources
+from panoptes_cli.download import (
+    DOWNLOAD_BUFFER_SIZE,
+    DOWNLOAD_CONNECTIONS,
+    download_export,
+)
+from panoptes_cli.export_filter import ExportFilterError, filter_options
+from panoptes_cli.output import echo_raw, get_emitter
+from panoptes_cli.resource_cache import cached_find, invalidate_cached
 from panoptes_cli.scripts.panoptes import cli
 from panoptes_client import Workflow
 from panoptes_client.panoptes import PanoptesAPIException
@@ -31,8 +38,13 @@ def ls(workflow_id, project_id, quiet):
     """Lists workflow IDs and names."""
 
     if workflow_id and not project_id:
-        workflow = Workflow.find(workflow_id)
-        if quiet:
+        workflow = cached_find(Workflow, workflow_id)
+        emitter = get_emitter()
+        if emitter:
+            emitter.emit(
+                {'id': workflow.id} if quiet else workflow_record(workflow)
+            )
+        elif quiet:
             click.echo(workflow.id)
         else:
             echo_workflow(workflow)
@@ -45,7 +57,12 @@ def ls(workflow_id, project_id, quiet):
         args['workflow_id'] = workflow_id
 
     workflows = Workflow.where(**args)
-    if quiet:
+    emitter = get_emitter()
+    if emitter:
+        emitter.emit_all(
+            {'id': w.id} if quiet else workflow_record(w) for w in workflows
+        )
+    elif quiet:
         click.echo(" ".join([w.id for w in workflows]))
     else:
         for workflow in workflows:
@@ -55,8 +72,8 @@ def ls(workflow_id, project_id, quiet):
 @workflow.command()
 @click.argument('workflow-id', required=True)
 def info(workflow_id):
-    workflow = Workflow.find(workflow_id)
-    click.echo(yaml.dump(workflow.raw))
+    workflow = cached_find(Workflow, workflow_id)
+    echo_raw(workflow.raw)
 
 
 @workflow.command(name='retire-subjects')
@@ -84,6 +101,7 @@ def retire_subjects(workflow_id, subject_ids, reason):
 
     workflow = Workflow.find(workflow_id)
     workflow.retire_subjects(subject_ids, reason)
+    invalidate_cached(workflow)
 
 
 @workflow.command(name='unretire-subjects')
@@ -98,6 +116,7 @@ def unretire_subjects(workflow_id, subject_ids):
 
     workflow = Workflow.find(workflow_id)
     workflow.unretire_subjects(subject_ids)
+    invalidate_cached(workflow)
 
 
 @workflow.command(name='unretire-subject-sets')
@@ -112,6 +131,7 @@ def unretire_subject_sets(workflow_id, subject_set_ids):
 
     workflow = Workflow.find(workflow_id)
     workflow.unretire_subjects_by_subject_set(subject_set_ids)
+    invalidate_cached(workflow)
 
 
 @workflow.command(name='add-subject-sets')
@@ -122,6 +142,7 @@ def add_subject_sets(workflow_id, subject_set_ids):
 
     workflow = Workflow.find(workflow_id)
     workflow.add_subject_sets(subject_set_ids)
+    invalidate_cached(workflow)
 
 
 
@@ -133,6 +154,7 @@ def remove_subject_sets(workflow_id, subject_set_ids):
 
     workflow = Workflow.find(workflow_id)
     workflow.remove_subject_sets(subject_set_ids)
+    invalidate_cached(workflow)
 
 
 @workflow.command()
@@ -143,6 +165,7 @@ def activate(workflow_id):
     workflow = Workflow.find(workflow_id)
     workflow.active = True
     workflow.save()
+    invalidate_cached(workflow)
 
 
 @workflow.command()
@@ -153,11 +176,16 @@ def deactivate(workflow_id):
     workflow = Workflow.find(workflow_id)
     workflow.active = False
     workflow.save()
+    invalidate_cached(workflow)
 
 
 @workflow.command(name="download-classifications")
 @click.argument('workflow-id', required=True, type=int)
-@click.argument('output-file', required=True, type=click.File('wb'))
+@click.argument(
+    'output-file',
+    required=True,
+    type=click.Path(dir_okay=False, allow_dash=True),
+)
 @click.option(
     '--generate',
     '-g',
@@ -174,60 +202,90 @@ def deactivate(workflow_id):
     required=False,
     type=int,
 )
+@click.option(
+    '--connections',
+    '-c',
+    help=(
+        "Number of connections to download the export over. Defaults to "
+        "{}."
+    ).format(DOWNLOAD_CONNECTIONS),
+    type=click.IntRange(min=1),
+    default=DOWNLOAD_CONNECTIONS,
+)
+@click.option(
+    '--buffer-size',
+    '-b',
+    help=(
+        "Size of the buffer used by each connection, in KiB. Defaults to {}."
+    ).format(DOWNLOAD_BUFFER_SIZE // 1024),
+    type=click.IntRange(min=1),
+    default=DOWNLOAD_BUFFER_SIZE // 1024,
+)
+@filter_options
 def download_classifications(
     workflow_id,
     output_file,
     generate,
-    generate_timeout
+    generate_timeout,
+    connections,
+    buffer_size,
+    export_filter,
 ):
     """
     Downloads a workflow-specific classifications export for the given workflow.
 
     OUTPUT_FILE will be overwritten if it already exists. Set OUTPUT_FILE to -
     to output to stdout.
-    """
 
-    workflow = Workflow.find(workflow_id)
+    Exports are downloaded over several connections at once. If a download is
+    interrupted, run the same command again to resume it.
 
-    if generate:
-        click.echo("Generating new export...", err=True)
+    Use the filter options to only save some of the rows and columns of a CSV
+    export. The export is then filtered as it downloads, over a single
+    connection:
 
-    export = workflow.get_export(
-        'classifications',
-        generate=generate,
-        wait_timeout=generate_timeout
-    )
+    \b
+    $ panoptes workflow download-classifications \\
+        --workflow-version 12 18706 out.csv
+    """
 
-    with click.progressbar(
-        export.iter_content(chunk_size=1024),
-        label='Downloading',
-        length=(int(export.headers.get('content-length')) / 1024 + 1),
-        file=click.get_text_stream('stderr'),
-    ) as chunks:
-        for chunk in chunks:
-            output_file.write(chunk)
+    workflow = cached_find(Workflow, workflow_id)
+    try:
+        download_export(
+            workflow,
+            'classifications',
+            output_file,
+            generate=generate,
+            generate_timeout=generate_timeout,
+            connections=connections,
+            buffer_size=buffer_size * 1024,
+            export_filter=export_filter,
+        )
+    except ExportFilterError as e:
+        click.echo('Error: {}'.format(e), err=True)
+        return -1
 
 
 @workflow.command()
-@click.option(
-    '--force',
-    '-f',
-    is_flag=True,
-    help='Delete without asking for confirmation.',
-)
-@click.argument('workflow-ids', required=True, nargs=-1, type=int)
-def delete(force, workflow_ids):
-    for workflow_id in workflow_ids:
-        workflow = Workflow.find(workflow_id)
-        if not force:
-            click.confirm(
-                'Delete workflow {} ({})?'.format(
-                    workflow_id,
-                    workflow.display_name,
-                ),
-                abort=True,
-            )
-        workflow.delete()
+@delete_options
+@click.argument('workflow-ids', nargs=-1, type=int)
+def delete(force, id_file, concurrency, report_file, workflow_ids):
+    """
+    Deletes workflows.
+
+    Deletes are made --concurrency at a time. Unless --force is given, each
+    workflow is shown and must be confirmed first.
+    """
+
+    return delete_resources(
+        Workflow,
+        workflow_ids,
+        id_file,
+        force,
+        concurrency,
+        report_file,
+        describe_with='display_name',
+    )
 
 
 @workflow.command()
@@ -289,3 +347,7 @@ def echo_workflow(workflow):
             workflow.display_name
         )
     )
+
+
+def workflow_record(workflow):
+    return {'id': workflow.id, 'display_name': workflow.display_name}
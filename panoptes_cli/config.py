@@ -0,0 +1,51 @@
+import os
+
+CONFIG_FILE = 'config.yml'
+# Requests per second, and how many can be made at once
+RATE_LIMIT = 20
+REQUEST_CONCURRENCY = 16
+# Seconds a connection can be idle before TCP keep-alive probes are sent, so
+# pooled connections aren't silently dropped by firewalls and NAT
+KEEP_ALIVE = 60
+DEFAULT_CONFIG = {
+    'endpoint': 'https://www.zooniverse.org',
+    'username': '',
+    'password': '',
+    'rate_limit': RATE_LIMIT,
+    'request_concurrency': REQUEST_CONCURRENCY,
+    'pool_size': 0,
+    'pool_block': False,
+    'keep_alive': KEEP_ALIVE,
+}
+
+
+def config_dir():
+    return os.path.expanduser('~/.panoptes/')
+
+
+def load_config(config_file):
+    """
+    Returns the default configuration, updated with the settings in
+    **config_file** if it exists.
+    """
+
+    config = dict(DEFAULT_CONFIG)
+    config.update(read_config_file(config_file))
+    return config
+
+
+def read_config_file(config_file):
+    """
+    Returns just the settings in **config_file**, or an empty dict if it
+    doesn't exist.
+    """
+
+    # Imported here so that forwarding a command to `panoptes serve` doesn't
+    # wait for it
+    import yaml
+
+    try:
+        with open(config_file) as conf_f:
+            return yaml.full_load(conf_f) or {}
+    except IOError:
+        return {}
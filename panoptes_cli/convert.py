@@ -0,0 +1,257 @@
+import csv
+import io
+import itertools
+import json
+
+CONVERT_BATCH_ROWS = 10000
+CONVERT_FORMATS = ('parquet', 'arrow')
+INTEGER_COLUMNS = (
+    'classification_id',
+    'user_id',
+    'workflow_id',
+    'subject_data.subject_id',
+)
+BOOLEAN_COLUMNS = ('subject_data.retired',)
+# Formats of timestamps to parse, after trimming to the given length
+TIMESTAMP_COLUMNS = {
+    'created_at': ('%Y-%m-%d %H:%M:%S', 19),
+    'metadata.started_at': ('%Y-%m-%dT%H:%M:%S', 19),
+    'metadata.finished_at': ('%Y-%m-%dT%H:%M:%S', 19),
+}
+METADATA_FIELDS = (
+    'started_at',
+    'finished_at',
+    'user_language',
+    'utc_offset',
+    'user_agent',
+)
+ANNOTATION_COLUMNS = ('classification_id', 'task', 'task_label', 'value')
+
+
+class ConvertError(Exception):
+    pass
+
+
+def parse_json_batch(values):
+    """
+    Parses a list of JSON strings in one go, by joining them into a single
+    array. Empty strings become None. If the batch can't be parsed as a
+    whole, each value is parsed separately and any invalid ones become None.
+    """
+
+    try:
+        parsed = json.loads(
+            '[{}]'.format(','.join(value or 'null' for value in values))
+        )
+        # A value which isn't a single JSON value (e.g. "1,2") still parses
+        # as part of the array, but shifts everything after it
+        if len(parsed) == len(values):
+            return parsed
+    except ValueError:
+        pass
+
+    parsed = []
+    for value in values:
+        try:
+            parsed.append(json.loads(value) if value else None)
+        except ValueError:
+            parsed.append(None)
+    return parsed
+
+
+def parse_batch(header, rows):
+    """
+    Turns a batch of CSV rows from a classifications export into columns.
+
+    Returns a tuple of two dicts mapping column names to lists of values:
+    one for the classifications, and one with a row for each annotation.
+    The JSON columns are kept as they are, and the most useful parts of
+    them are also split out into columns of their own (e.g.
+    ``metadata.started_at`` and ``subject_data.subject_id``).
+    """
+
+    columns = {}
+    annotations = dict((column, []) for column in ANNOTATION_COLUMNS)
+    by_name = dict(
+        (column, [row[i] for row in rows]) for i, column in enumerate(header)
+    )
+
+    for column, values in by_name.items():
+        if column in INTEGER_COLUMNS:
+            columns[column] = [
+                int(value) if value else None for value in values
+            ]
+        else:
+            columns[column] = values
+
+    if 'metadata' in by_name:
+        metadata = parse_json_batch(by_name['metadata'])
+        for field in METADATA_FIELDS:
+            columns['metadata.' + field] = [
+                str(m[field])
+                if isinstance(m, dict) and m.get(field) is not None else None
+                for m in metadata
+            ]
+
+    if 'subject_data' in by_name:
+        subject_ids = []
+        retired = []
+        for subject_data in parse_json_batch(by_name['subject_data']):
+            if not isinstance(subject_data, dict) or not subject_data:
+                subject_ids.append(None)
+                retired.append(None)
+                continue
+            subject_id, data = next(iter(subject_data.items()))
+            subject_ids.append(int(subject_id))
+            retired.append(
+                bool(data.get('retired')) if isinstance(data, dict) else None
+            )
+        columns['subject_data.subject_id'] = subject_ids
+        columns['subject_data.retired'] = retired
+
+    if 'annotations' in by_name:
+        classification_ids = columns.get(
+            'classification_id',
+            [None] * len(rows),
+        )
+        for classification_id, tasks in zip(
+            classification_ids,
+            parse_json_batch(by_name['annotations']),
+        ):
+            if not isinstance(tasks, list):
+                continue
+            for task in tasks:
+                if not isinstance(task, dict):
+                    continue
+                annotations['classification_id'].append(classification_id)
+                annotations['task'].append(task.get('task'))
+                annotations['task_label'].append(task.get('task_label'))
+                annotations['value'].append(json.dumps(task.get('value')))
+
+    return columns, annotations
+
+
+def to_table(columns):
+    """Builds a :py:class:`pyarrow.Table` from a dict of column lists."""
+
+    pyarrow = import_pyarrow()
+    arrays = []
+    for column, values in columns.items():
+        if column in INTEGER_COLUMNS:
+            arrays.append(pyarrow.array(values, pyarrow.int64()))
+        elif column in BOOLEAN_COLUMNS:
+            arrays.append(pyarrow.array(values, pyarrow.bool_()))
+        elif column in TIMESTAMP_COLUMNS:
+            timestamp_format, length = TIMESTAMP_COLUMNS[column]
+            strings = pyarrow.compute.utf8_slice_codeunits(
+                pyarrow.array(values, pyarrow.string()),
+                0,
+                length,
+            )
+            arrays.append(pyarrow.compute.strptime(
+                strings,
+                format=timestamp_format,
+                unit='s',
+                error_is_null=True,
+            ))
+        else:
+            arrays.append(pyarrow.array(values, pyarrow.string()))
+    return pyarrow.Table.from_arrays(arrays, names=list(columns))
+
+
+class TableWriter(object):
+    """
+    Writes a sequence of tables with the same schema to a Parquet or Arrow
+    IPC file, opening the file when the first table arrives.
+    """
+
+    def __init__(self, path, output_format):
+        self.path = path
+        self.output_format = output_format
+        self._writer = None
+
+    def write(self, table):
+        pyarrow = import_pyarrow()
+        if self._writer is None:
+            if self.output_format == 'parquet':
+                self._writer = pyarrow.parquet.ParquetWriter(
+                    self.path,
+                    table.schema,
+                )
+            else:
+                self._writer = pyarrow.ipc.new_file(self.path, table.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def convert_export(
+    source,
+    output_path,
+    output_format='parquet',
+    annotations_path=None,
+    batch_rows=CONVERT_BATCH_ROWS,
+):
+    """
+    Converts a classifications export, read from the binary file object
+    **source**, into a columnar file at **output_path**, **batch_rows** rows
+    at a time. If **annotations_path** is given, a second file is written
+    there with a row for each annotation. Returns the number of
+    classifications converted.
+    """
+
+    import_pyarrow()
+    reader = csv.reader(
+        io.TextIOWrapper(source, encoding='utf-8', newline=''),
+    )
+    try:
+        header = next(reader)
+    except StopIteration:
+        raise ConvertError('The export is empty.')
+
+    writer = TableWriter(output_path, output_format)
+    annotations_writer = None
+    if annotations_path:
+        annotations_writer = TableWriter(annotations_path, output_format)
+
+    converted = 0
+    try:
+        while True:
+            rows = list(itertools.islice(reader, batch_rows))
+            if not rows and converted:
+                break
+            columns, annotations = parse_batch(header, rows)
+            writer.write(to_table(columns))
+            if annotations_writer:
+                annotations_writer.write(to_table(annotations))
+            converted += len(rows)
+            if not rows:
+                # Still write the schema for an export with no rows
+                break
+    finally:
+        writer.close()
+        if annotations_writer:
+            annotations_writer.close()
+    return converted
+
+
+def import_pyarrow():
+    """
+    Returns the pyarrow module, with the submodules used here imported.
+    It's optional, and slow to import, so it's only imported when needed.
+    Raises :py:class:`ConvertError` if it isn't installed.
+    """
+
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ConvertError(
+            'Converting exports requires pyarrow. Install it with:\n\n'
+            '$ pip install panoptescli[convert]'
+        )
+    return pyarrow
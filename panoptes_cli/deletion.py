@@ -0,0 +1,203 @@
+import csv
+
+import click
+
+from panoptes_cli.listing import ordered_map, read_ids
+from panoptes_cli.resource_cache import get_resource_cache
+
+DELETE_CONCURRENCY = 8
+DELETED = 'deleted'
+FAILED = 'failed'
+
+
+def delete_many(object_class, items, concurrency=DELETE_CONCURRENCY):
+    """
+    Deletes many resources of **object_class**, with a pool of
+    **concurrency** threads. Each of **items** is either an ID or an
+    instance which has already been fetched (e.g. to confirm deleting it),
+    which is deleted with the ETag it was fetched with rather than fetching
+    that again.
+
+    Yields an ``(id, error)`` tuple for each item, in order, where ``error``
+    is the exception if it couldn't be deleted and None otherwise.
+    """
+
+    def delete(item):
+        if isinstance(item, object_class):
+            resource_id = item.id
+        else:
+            resource_id = str(item)
+        try:
+            if isinstance(item, object_class):
+                object_class.http_delete(
+                    resource_id,
+                    etag=item.etag,
+                    retry=True,
+                )
+            else:
+                delete_by_id(object_class, resource_id)
+        except Exception as e:
+            return resource_id, e
+        return resource_id, None
+
+    return ordered_map(delete, items, concurrency)
+
+
+def delete_by_id(object_class, resource_id):
+    """
+    Deletes a resource given only its ID. Deleting needs the resource's ETag,
+    just as :py:meth:`PanoptesObject.delete` sends it, so that's fetched
+    first, but without building an object from the response.
+
+    Raises :py:class:`PanoptesAPIException` if it can't be found.
+    """
+
+    _, etag = object_class.http_get(resource_id)
+    object_class.http_delete(resource_id, etag=etag, retry=True)
+
+
+def delete_options(command):
+    """
+    Adds the options used by :py:func:`delete_resources` to a delete
+    command.
+    """
+
+    options = [
+        click.option(
+            '--force',
+            '-f',
+            is_flag=True,
+            help='Delete without asking for confirmation.',
+        ),
+        click.option(
+            '--id-file',
+            help=(
+                "Also delete the IDs in the given file, one per line. Use - "
+                "to read them from stdin (which needs --force)."
+            ),
+            type=click.File('r'),
+        ),
+        click.option(
+            '--concurrency',
+            '-c',
+            help=(
+                "Number of deletes to make at once. Defaults to {}."
+            ).format(DELETE_CONCURRENCY),
+            type=click.IntRange(min=1),
+            default=DELETE_CONCURRENCY,
+        ),
+        click.option(
+            '--report-file',
+            '-r',
+            help=(
+                "Write a CSV file with whether each ID was deleted, and why "
+                "not."
+            ),
+            type=click.File('w'),
+        ),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+def delete_resources(
+    object_class,
+    ids,
+    id_file,
+    force,
+    concurrency,
+    report_file,
+    describe_with=None,
+):
+    """
+    Deletes the resources with the given **ids** and those in **id_file**,
+    for a command with :py:func:`delete_options`.
+
+    Unless **force** is set, each resource must be confirmed first. With
+    **describe_with**, each one is fetched and that attribute is shown in
+    the confirmation. Deletes run in the background as confirmations are
+    given. Failures are reported as they happen, followed by a summary.
+
+    Raises :py:class:`click.UsageError` if there are no IDs or **id_file**.
+    Returns -1 if anything couldn't be deleted.
+    """
+
+    noun = object_class._api_slug[:-1].replace('_', ' ')
+    if not ids and not id_file:
+        raise click.UsageError(
+            'Give at least one {} ID, or --id-file.'.format(noun)
+        )
+    if id_file and id_file.name == '<stdin>' and not force:
+        click.echo(
+            'Error: Give --force when reading IDs from stdin, since it '
+            'can\'t also be used to confirm each delete.',
+            err=True,
+        )
+        return -1
+
+    items = read_ids(ids, id_file)
+    if not force:
+        items = confirmed(noun, object_class, items, describe_with)
+
+    report = None
+    if report_file:
+        report = csv.writer(report_file)
+        report.writerow(['id', 'status', 'error'])
+    cache = get_resource_cache()
+    if cache is not None and object_class._api_slug not in cache.ttls:
+        cache = None
+
+    counts = {DELETED: 0, FAILED: 0}
+    for resource_id, error in delete_many(object_class, items, concurrency):
+        status = DELETED if error is None else FAILED
+        counts[status] += 1
+        if error is None:
+            if cache is not None:
+                cache.invalidate(object_class._api_slug, resource_id)
+        else:
+            click.echo(
+                'Error: Could not delete {} {}: {}'.format(
+                    noun,
+                    resource_id,
+                    error,
+                ),
+                err=True,
+            )
+        if report:
+            report.writerow([resource_id, status, error or ''])
+
+    click.echo(
+        'Deleted {}, failed {}.'.format(counts[DELETED], counts[FAILED]),
+        err=True,
+    )
+    if counts[FAILED]:
+        return -1
+
+
+def confirmed(noun, object_class, ids, describe_with=None):
+    """
+    Asks for confirmation of each of **ids**, aborting if it isn't given,
+    and yields the ID (or with **describe_with**, the fetched resource, so
+    it can be deleted without fetching it again).
+    """
+
+    for resource_id in ids:
+        if describe_with is None:
+            click.confirm(
+                'Delete {} {}?'.format(noun, resource_id),
+                abort=True,
+            )
+            yield resource_id
+            continue
+
+        resource = object_class.find(resource_id)
+        click.confirm(
+            'Delete {} {} ({})?'.format(
+                noun,
+                resource_id,
+                getattr(resource, describe_with),
+            ),
+            abort=True,
+        )
+        yield resource
@@ -0,0 +1,532 @@
+import contextlib
+import gzip
+import io
+import json
+import os
+import re
+import shutil
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+import requests
+import urllib3
+
+from panoptes_cli.export_filter import decompressed
+from panoptes_client.exportable import TALK_EXPORT_TYPES
+
+DOWNLOAD_CONNECTIONS = 4
+DOWNLOAD_CHUNK_SIZE = 16 * 1024 * 1024
+DOWNLOAD_BUFFER_SIZE = 1024 * 1024
+DOWNLOAD_RETRY_LIMIT = 5
+DOWNLOAD_TIMEOUT = 60
+RETRY_BACKOFF_INTERVAL = 2
+PARTIAL_EXTENSION = '.part'
+STATE_EXTENSION = '.part-state'
+
+CONTENT_RANGE_RE = re.compile(r'bytes \d+-\d+/(\d+)')
+# Sent with a 416 response when a range is requested from an empty file
+EMPTY_CONTENT_RANGE_RE = re.compile(r'bytes \*/0$')
+
+# Reading the raw response bypasses Requests, so errors can come from urllib3
+RETRY_EXCEPTIONS = (
+    requests.exceptions.RequestException,
+    urllib3.exceptions.HTTPError,
+)
+
+
+class DownloadError(Exception):
+    pass
+
+
+class Downloader(object):
+    """
+    Downloads a file over HTTP using several connections at once.
+
+    If the server supports range requests, the file is split into chunks of
+    **chunk_size** bytes which are fetched by **connections** threads and
+    written straight into place in a partial file (``OUTPUT.part``). The
+    chunks which have been finished are recorded next to it, so if the
+    download is interrupted, running it again picks up where it left off as
+    long as the file on the server hasn't changed. Dropped connections are
+    retried from the last byte received.
+
+    Servers which don't support ranges are downloaded over a single
+    connection. :py:meth:`open` also reads over a single connection, for
+    processing the file as it arrives.
+
+    If the server sends the file with ``Content-Encoding: gzip``, the
+    compressed bytes are downloaded (so ranges still line up) and decoded
+    when they're written to the output.
+
+    Each connection reads the response body straight into its own reusable
+    buffer of **buffer_size** bytes and writes it out from there, so large
+    buffers keep the number of Python-level steps per gigabyte small.
+
+    **on_progress** is called with the number of bytes received each time
+    some data is written.
+
+    Example::
+
+        downloader = Downloader(url, connections=8)
+        downloader.to_path('classifications.csv')
+    """
+
+    def __init__(
+        self,
+        url,
+        connections=DOWNLOAD_CONNECTIONS,
+        chunk_size=DOWNLOAD_CHUNK_SIZE,
+        buffer_size=DOWNLOAD_BUFFER_SIZE,
+        on_progress=None,
+    ):
+        self.url = url
+        self.connections = connections
+        self.chunk_size = chunk_size
+        self.buffer_size = buffer_size
+        self.on_progress = on_progress
+        self.size = None
+        self.validator = None
+        self.content_encoding = None
+        self.ranged = False
+        self._probed = False
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def probe(self):
+        """
+        Finds out the size of the file and whether the server supports range
+        requests.
+        """
+
+        if self._probed:
+            return
+        response = self._get({'Range': 'bytes=0-0'})
+        try:
+            content_range = CONTENT_RANGE_RE.match(
+                response.headers.get('content-range', '')
+            )
+            if response.status_code == 416:
+                # Only returned by _get() for an empty file
+                self.size = 0
+            elif response.status_code == 206 and content_range:
+                self.ranged = True
+                self.size = int(content_range.group(1))
+            elif response.headers.get('content-length'):
+                self.size = int(response.headers['content-length'])
+            self.validator = (
+                response.headers.get('etag')
+                or response.headers.get('last-modified')
+            )
+            self.content_encoding = response.headers.get('content-encoding')
+        finally:
+            response.close()
+        self._probed = True
+
+    def to_path(self, path):
+        """
+        Downloads the file to **path**, via a partial file which is renamed
+        once the download is complete.
+        """
+
+        self.probe()
+        partial_path = path + PARTIAL_EXTENSION
+        state_path = path + STATE_EXTENSION
+
+        if self.size == 0:
+            open(path, 'wb').close()
+            return
+
+        if not self.ranged:
+            with open(partial_path, 'wb') as partial_file:
+                self.to_file(partial_file)
+            os.replace(partial_path, path)
+            return
+
+        state = {
+            'size': self.size,
+            'validator': self.validator,
+            'chunk_size': self.chunk_size,
+            'done': [],
+        }
+        saved_state = self._load_state(state_path, partial_path)
+        if saved_state and all(
+            saved_state.get(key) == state[key]
+            for key in ('size', 'validator', 'chunk_size')
+        ):
+            state = saved_state
+        else:
+            with open(partial_path, 'wb') as partial_file:
+                partial_file.truncate(self.size)
+
+        chunk_count = (self.size + self.chunk_size - 1) // self.chunk_size
+        done = set(state['done'])
+        self._progress(sum(
+            self._chunk_range(index)[1] - self._chunk_range(index)[0] + 1
+            for index in done
+        ))
+
+        def fetch(index):
+            self._fetch_chunk(partial_path, index)
+            with self._lock:
+                state['done'].append(index)
+                self._save_state(state_path, state)
+
+        with ThreadPoolExecutor(max_workers=self.connections) as executor:
+            futures = [
+                executor.submit(fetch, index)
+                for index in range(chunk_count)
+                if index not in done
+            ]
+            for future in futures:
+                future.result()
+
+        if self.content_encoding == 'gzip':
+            # The state is kept until the file has been decoded, so if
+            # that's interrupted it's tried again without downloading.
+            decoded_path = partial_path + '.decoded'
+            with open(partial_path, 'rb') as partial_file:
+                with open(decoded_path, 'wb') as decoded_file:
+                    for _ in self._copy(
+                        self._decoded(partial_file),
+                        decoded_file,
+                    ):
+                        pass
+            os.replace(decoded_path, path)
+            os.remove(partial_path)
+        else:
+            os.replace(partial_path, path)
+        os.remove(state_path)
+
+    def to_file(self, output_file):
+        """
+        Downloads the file over a single connection, writing it to the open
+        binary **output_file** in order.
+        """
+
+        if self.size == 0:
+            return
+        with self.open() as stream:
+            for _ in self._copy(self._decoded(stream), output_file):
+                pass
+
+    def open(self):
+        """
+        Returns a :py:class:`DownloadStream` for reading the file in order
+        over a single connection. The raw bytes are returned, even if the
+        server sent them with a ``Content-Encoding``.
+        """
+
+        self.probe()
+        return DownloadStream(self)
+
+    def _decoded(self, stream):
+        """
+        Returns a binary file object for reading the content of the raw
+        **stream**, with the server's ``Content-Encoding`` undone.
+        """
+
+        if self.content_encoding != 'gzip':
+            return stream
+        return gzip.GzipFile(
+            fileobj=io.BufferedReader(stream, self.buffer_size),
+            mode='rb',
+        )
+
+    def _chunk_range(self, index):
+        start = index * self.chunk_size
+        end = min(start + self.chunk_size, self.size) - 1
+        return start, end
+
+    def _fetch_chunk(self, partial_path, index):
+        position, end = self._chunk_range(index)
+        attempt = 1
+        with open(partial_path, 'r+b') as partial_file:
+            while position <= end:
+                try:
+                    with self._open(position, end) as response:
+                        partial_file.seek(position)
+                        for count in self._copy(response.raw, partial_file):
+                            position += count
+                            self._progress(count)
+                    if position <= end:
+                        raise requests.exceptions.ConnectionError(
+                            'Connection closed early.'
+                        )
+                except RETRY_EXCEPTIONS:
+                    if attempt >= DOWNLOAD_RETRY_LIMIT:
+                        raise
+                    attempt += 1
+                    time.sleep(RETRY_BACKOFF_INTERVAL)
+
+    def _copy(self, source, output_file):
+        """
+        Copies the content of **source** (which must have a ``readinto()``
+        method) to **output_file**, yielding the number of bytes written each
+        time round.
+        """
+
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None or len(buffer) != self.buffer_size:
+            buffer = self._local.buffer = bytearray(self.buffer_size)
+        view = memoryview(buffer)
+        while True:
+            count = source.readinto(buffer)
+            if not count:
+                return
+            output_file.write(view[:count])
+            yield count
+
+    def _open(self, start=0, end=None):
+        """
+        Starts a request for the file from byte **start** up to and including
+        byte **end**.
+        """
+
+        headers = {}
+        if start or end is not None:
+            headers['Range'] = 'bytes={}-{}'.format(
+                start,
+                '' if end is None else end,
+            )
+        response = self._get(headers)
+        if 'Range' in headers and response.status_code != 206:
+            response.close()
+            raise DownloadError(
+                'The file changed while it was being downloaded.'
+            )
+        return response
+
+    def _get(self, headers):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        if self.validator and 'Range' in headers:
+            headers['If-Range'] = self.validator
+        # Ranges refer to the stored bytes, so don't let the server compress
+        # them on the fly.
+        headers['Accept-Encoding'] = 'identity'
+        response = session.get(
+            self.url,
+            headers=headers,
+            stream=True,
+            timeout=DOWNLOAD_TIMEOUT,
+        )
+        if response.status_code == 416 and EMPTY_CONTENT_RANGE_RE.match(
+            response.headers.get('content-range', '')
+        ):
+            # There's nothing to download, which is fine if the file was
+            # empty all along (_open() catches it changing).
+            return response
+        response.raise_for_status()
+        return response
+
+    def _progress(self, byte_count):
+        if self.on_progress and byte_count:
+            with self._lock:
+                self.on_progress(byte_count)
+
+    def _load_state(self, state_path, partial_path):
+        if not os.path.isfile(partial_path):
+            return None
+        try:
+            with open(state_path) as state_file:
+                return json.load(state_file)
+        except (IOError, ValueError):
+            return None
+
+    def _save_state(self, state_path, state):
+        with open(state_path + '.tmp', 'w') as state_file:
+            json.dump(state, state_file)
+        os.replace(state_path + '.tmp', state_path)
+
+
+class DownloadStream(io.RawIOBase):
+    """
+    A readable stream of a :py:class:`Downloader`'s file. If the connection
+    drops and the server supports range requests, it reconnects and carries
+    on from the last byte read.
+    """
+
+    def __init__(self, downloader):
+        super(DownloadStream, self).__init__()
+        self.downloader = downloader
+        self.position = 0
+        self._response = None
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        attempt = 1
+        while True:
+            try:
+                if self._response is None:
+                    self._response = self.downloader._open(self.position)
+                count = self._response.raw.readinto(buffer)
+                break
+            except RETRY_EXCEPTIONS:
+                self._close_response()
+                if (
+                    not self.downloader.ranged
+                    or attempt >= DOWNLOAD_RETRY_LIMIT
+                ):
+                    raise
+                attempt += 1
+                time.sleep(RETRY_BACKOFF_INTERVAL)
+        self.position += count
+        self.downloader._progress(count)
+        return count
+
+    def close(self):
+        self._close_response()
+        super(DownloadStream, self).close()
+
+    def _close_response(self):
+        if self._response is not None:
+            self._response.close()
+            self._response = None
+
+
+def get_export_url(exportable, export_type, generate=False, wait_timeout=None):
+    """
+    Returns the URL of the latest export of the given type, as
+    :py:meth:`Exportable.get_export` would download it.
+    """
+
+    if generate:
+        exportable.generate_export(export_type)
+        export = exportable.wait_export(export_type, wait_timeout)
+    else:
+        export = exportable.describe_export(export_type)
+
+    if export_type in TALK_EXPORT_TYPES:
+        return export['data_requests'][0]['url']
+    return export['media'][0]['src']
+
+
+def download_export(
+    exportable,
+    export_type,
+    output_file,
+    generate=False,
+    generate_timeout=None,
+    connections=DOWNLOAD_CONNECTIONS,
+    buffer_size=DOWNLOAD_BUFFER_SIZE,
+    export_filter=None,
+):
+    """
+    Downloads an export to **output_file** (a path, or ``-`` for stdout),
+    showing a progress bar.
+
+    If an :py:class:`ExportFilter` is given, the export is downloaded over a
+    single connection and decompressed and filtered as it arrives, so only
+    the result is written out. Downloads like this can't be resumed.
+    """
+
+    if generate:
+        click.echo("Generating new export...", err=True)
+
+    url = get_export_url(
+        exportable,
+        export_type,
+        generate=generate,
+        wait_timeout=generate_timeout,
+    )
+    downloader = Downloader(
+        url,
+        connections=connections,
+        buffer_size=buffer_size,
+    )
+    downloader.probe()
+    streaming = bool(export_filter)
+
+    if not streaming and os.path.isfile(output_file + STATE_EXTENSION):
+        click.echo('Resuming download of {}'.format(output_file), err=True)
+
+    with show_progress(downloader):
+        if streaming:
+            stream_export(downloader, output_file, export_filter)
+        elif output_file == '-':
+            downloader.to_file(click.get_binary_stream('stdout'))
+        else:
+            downloader.to_path(output_file)
+
+
+def stream_export(downloader, output_file, export_filter=None):
+    """
+    Downloads an export to **output_file** (a path, or ``-`` for stdout) over
+    a single connection, decompressing it and applying **export_filter** (if
+    given) on the way.
+    """
+
+    with downloader.open() as stream:
+        source = decompressed(stream, downloader.buffer_size)
+        if export_filter and output_file == '-':
+            export_filter.copy(source, click.get_text_stream('stdout'))
+        elif export_filter:
+            with open(
+                output_file,
+                'w',
+                encoding='utf-8',
+                newline='',
+            ) as text_file:
+                export_filter.copy(source, text_file)
+        else:
+            with click.open_file(output_file, 'wb') as binary_file:
+                shutil.copyfileobj(source, binary_file, downloader.buffer_size)
+
+
+@contextlib.contextmanager
+def show_progress(downloader):
+    """
+    Shows a progress bar for **downloader** (which must have been probed)
+    while the block runs.
+    """
+
+    with download_progressbar(downloader.size) as bar:
+        received = [0]
+
+        def update(byte_count):
+            received[0] += byte_count
+            # Shown by item_show_func. update() only takes the current item
+            # itself from Click 8.0.
+            bar.current_item = received[0]
+            bar.update(byte_count)
+
+        downloader.on_progress = update
+        yield bar
+
+
+def download_progressbar(size):
+    """
+    Returns a progress bar for downloading **size** bytes, showing how much
+    has been received so far. If the size isn't known (e.g. because the
+    server didn't send a ``Content-Length``), **size** can be None and the bar
+    just shows activity.
+    """
+
+    if size is None:
+        # An endless iterable with no length, which is never iterated
+        return click.progressbar(
+            iter(int, 1),
+            label='Downloading',
+            item_show_func=format_size,
+            file=click.get_text_stream('stderr'),
+        )
+    return click.progressbar(
+        length=size,
+        label='Downloading',
+        item_show_func=format_size,
+        file=click.get_text_stream('stderr'),
+    )
+
+
+def format_size(byte_count):
+    if byte_count is None:
+        return None
+    # Imported here as it's slow to import, and only needed for progress
+    import humanize
+    return humanize.naturalsize(byte_count)
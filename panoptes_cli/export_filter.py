@@ -0,0 +1,222 @@
+import csv
+import functools
+import gzip
+import io
+
+import click
+
+GZIP_MAGIC = b'\x1f\x8b'
+CREATED_AT_FORMAT = '%Y-%m-%d %H:%M:%S'
+CREATED_AT_LENGTH = len('YYYY-MM-DD HH:MM:SS')
+
+
+class ExportFilterError(Exception):
+    pass
+
+
+def decompressed(stream, buffer_size=io.DEFAULT_BUFFER_SIZE):
+    """
+    Returns a binary file object for reading **stream**, which transparently
+    decompresses it if it's gzipped.
+    """
+
+    buffered = io.BufferedReader(stream, buffer_size)
+    if buffered.peek(len(GZIP_MAGIC)).startswith(GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=buffered, mode='rb')
+    return buffered
+
+
+class ExportFilter(object):
+    """
+    Filters the rows and columns of a CSV export as it's read.
+
+    - **columns** is a list of the columns to keep, in order. All the
+      columns are kept if it's empty.
+    - **workflow_versions** only keeps rows with one of the given workflow
+      versions. A version without a minor part (e.g. ``"12"``) matches all
+      of its minor versions.
+    - **created_after** and **created_before** are :py:class:`datetime`
+      objects which only keep rows created in that range (inclusive of
+      **created_after** and exclusive of **created_before**).
+    - **subject_ids** only keeps rows for at least one of the given subjects.
+
+    Row filters need the relevant column (``workflow_version``,
+    ``created_at`` or ``subject_ids``) to be in the export, but not in
+    **columns**.
+
+    Example::
+
+        export_filter = ExportFilter(workflow_versions=['12'])
+        writer.writerows(export_filter.filter(csv.reader(export)))
+    """
+
+    def __init__(
+        self,
+        columns=(),
+        workflow_versions=(),
+        created_after=None,
+        created_before=None,
+        subject_ids=(),
+    ):
+        self.columns = list(columns)
+        self.workflow_versions = set(map(str, workflow_versions))
+        # created_at is a fixed-width timestamp, so it can be compared as a
+        # string without parsing every row.
+        self.created_after = (
+            created_after.strftime(CREATED_AT_FORMAT)
+            if created_after else None
+        )
+        self.created_before = (
+            created_before.strftime(CREATED_AT_FORMAT)
+            if created_before else None
+        )
+        self.subject_ids = set(map(str, subject_ids))
+
+    def __bool__(self):
+        return bool(
+            self.columns
+            or self.workflow_versions
+            or self.created_after
+            or self.created_before
+            or self.subject_ids
+        )
+
+    def filter(self, rows):
+        """
+        Yields the header and each matching row from **rows** (an iterable
+        of lists, starting with the header, as produced by
+        :py:func:`csv.reader`).
+        """
+
+        rows = iter(rows)
+        try:
+            header = next(rows)
+        except StopIteration:
+            return
+
+        def column_index(column):
+            try:
+                return header.index(column)
+            except ValueError:
+                raise ExportFilterError(
+                    'The export does not have a "{}" column.'.format(column)
+                )
+
+        keep = [column_index(column) for column in self.columns]
+        if self.workflow_versions:
+            version_index = column_index('workflow_version')
+        if self.created_after or self.created_before:
+            created_at_index = column_index('created_at')
+        if self.subject_ids:
+            subject_ids_index = column_index('subject_ids')
+
+        yield [header[i] for i in keep] if keep else header
+        for row in rows:
+            if self.workflow_versions:
+                version = row[version_index]
+                if (
+                    version not in self.workflow_versions
+                    and version.split('.')[0] not in self.workflow_versions
+                ):
+                    continue
+            if self.created_after or self.created_before:
+                created_at = row[created_at_index][:CREATED_AT_LENGTH]
+                if self.created_after and created_at < self.created_after:
+                    continue
+                if self.created_before and created_at >= self.created_before:
+                    continue
+            if self.subject_ids and self.subject_ids.isdisjoint(
+                row[subject_ids_index].split(';')
+            ):
+                continue
+            yield [row[i] for i in keep] if keep else row
+
+    def copy(self, source, output_file):
+        """
+        Reads a CSV export from the binary file object **source** and writes
+        the filtered CSV to the text file object **output_file**.
+        """
+
+        reader = csv.reader(
+            io.TextIOWrapper(source, encoding='utf-8', newline=''),
+        )
+        writer = csv.writer(output_file, lineterminator='\n')
+        writer.writerows(self.filter(reader))
+
+
+def filter_options(command):
+    """
+    Adds options for building an :py:class:`ExportFilter` to a download
+    command. The command receives them as an **export_filter** argument.
+    """
+
+    @functools.wraps(command)
+    def wrapper(*args, **kwargs):
+        subject_ids = list(kwargs.pop('subject_ids'))
+        subject_id_file = kwargs.pop('subject_id_file')
+        if subject_id_file:
+            subject_ids.extend(
+                line.strip() for line in subject_id_file if line.strip()
+            )
+        kwargs['export_filter'] = ExportFilter(
+            columns=kwargs.pop('columns'),
+            workflow_versions=kwargs.pop('workflow_versions'),
+            created_after=kwargs.pop('created_after'),
+            created_before=kwargs.pop('created_before'),
+            subject_ids=subject_ids,
+        )
+        return command(*args, **kwargs)
+
+    options = [
+        click.option(
+            '--column',
+            'columns',
+            help=(
+                "Only include the given column in the output. Can be used "
+                "more than once."
+            ),
+            multiple=True,
+        ),
+        click.option(
+            '--workflow-version',
+            'workflow_versions',
+            help=(
+                "Only include rows for the given workflow version (e.g. "
+                "12.34, or 12 for every 12.x version). Can be used more than "
+                "once."
+            ),
+            multiple=True,
+        ),
+        click.option(
+            '--created-after',
+            help=(
+                "Only include rows created at or after the given time (UTC)."
+            ),
+            type=click.DateTime(),
+        ),
+        click.option(
+            '--created-before',
+            help="Only include rows created before the given time (UTC).",
+            type=click.DateTime(),
+        ),
+        click.option(
+            '--subject-id',
+            'subject_ids',
+            help=(
+                "Only include rows for the given subject. Can be used more "
+                "than once."
+            ),
+            multiple=True,
+        ),
+        click.option(
+            '--subject-id-file',
+            help=(
+                "Only include rows for the subjects listed in the given file, "
+                "one ID per line."
+            ),
+            type=click.File('r'),
+        ),
+    ]
+    for option in reversed(options):
+        wrapper = option(wrapper)
+    return wrapper
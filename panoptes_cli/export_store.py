@@ -0,0 +1,187 @@
+import datetime
+import itertools
+import sqlite3
+
+STORE_BATCH_SIZE = 1000
+INDEXED_COLUMNS = (
+    'user_id',
+    'workflow_id',
+    'workflow_version',
+    'created_at',
+    'subject_ids',
+)
+
+
+class ExportStoreError(Exception):
+    pass
+
+
+def quote(identifier):
+    return '"{}"'.format(identifier.replace('"', '""'))
+
+
+class ClassificationStore(object):
+    """
+    A local SQLite copy of one or more classification exports, which can be
+    brought up to date from a newer export without storing everything again.
+
+    Classifications are kept in a ``classifications`` table with a column
+    for each column of the export, keyed by ``classification_id`` so nothing
+    is stored twice. The most common lookup columns are indexed. For each
+    **source** (e.g. ``"workflow 18706"``) the store remembers the highest
+    classification ID from its last complete sync, and :py:meth:`sync` skips
+    everything up to that ID without looking at it any further.
+
+    Example::
+
+        store = ClassificationStore('classifications.db')
+        added = store.sync('workflow 18706', csv.reader(export))
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS sync_state ('
+            'source TEXT PRIMARY KEY, '
+            'high_water_mark INTEGER NOT NULL, '
+            'synced_at TEXT NOT NULL)'
+        )
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS classifications ('
+            'classification_id INTEGER PRIMARY KEY)'
+        )
+
+    def high_water_mark(self, source):
+        """
+        Returns the highest classification ID synced from **source**, or
+        None if it hasn't been synced before.
+        """
+
+        row = self._db.execute(
+            'SELECT high_water_mark FROM sync_state WHERE source = ?',
+            (source,),
+        ).fetchone()
+        return row[0] if row else None
+
+    def sync(self, source, rows, on_bad_row=None):
+        """
+        Adds the classifications from **rows** (an iterable of lists starting
+        with the header, as produced by :py:func:`csv.reader`) which are newer
+        than the last sync from **source**. Returns the number added.
+
+        Rows are committed in batches as they're read, but the highest
+        classification ID is only recorded once every row has been read,
+        since exports aren't necessarily in order. If a sync is interrupted,
+        the next one reads the same rows again.
+
+        Rows with too few or too many columns are padded with nulls or
+        truncated, and rows without a classification ID are skipped.
+        **on_bad_row** is called with the row number (counting the header as
+        row 1) and the row for each of these.
+        """
+
+        rows = iter(rows)
+        try:
+            header = next(rows)
+        except StopIteration:
+            return 0
+        try:
+            id_index = header.index('classification_id')
+        except ValueError:
+            raise ExportStoreError(
+                'The export does not have a "classification_id" column.'
+            )
+        self._add_columns(header)
+
+        high_water_mark = self.high_water_mark(source) or 0
+        seen = [high_water_mark]
+        insert = (
+            'INSERT OR IGNORE INTO classifications ({}) VALUES ({})'.format(
+                ', '.join(map(quote, header)),
+                ', '.join('?' * len(header)),
+            )
+        )
+
+        def new_rows():
+            for row_number, row in enumerate(rows, start=2):
+                if not row:
+                    continue
+                try:
+                    classification_id = int(row[id_index])
+                except (IndexError, ValueError):
+                    classification_id = None
+                if (
+                    classification_id is not None
+                    and classification_id <= high_water_mark
+                ):
+                    continue
+                if classification_id is None or len(row) != len(header):
+                    if on_bad_row:
+                        on_bad_row(row_number, row)
+                    if classification_id is None:
+                        continue
+                seen[0] = max(seen[0], classification_id)
+                row = row[:len(header)]
+                yield row + [None] * (len(header) - len(row))
+
+        added = 0
+        new_rows = new_rows()
+        while True:
+            batch = list(itertools.islice(new_rows, STORE_BATCH_SIZE))
+            if not batch:
+                break
+            self._db.execute('BEGIN')
+            try:
+                cursor = self._db.executemany(insert, batch)
+                added += cursor.rowcount
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+
+        self._set_high_water_mark(source, seen[0])
+        return added
+
+    def count(self):
+        return self._db.execute(
+            'SELECT COUNT(*) FROM classifications'
+        ).fetchone()[0]
+
+    def close(self):
+        self._db.close()
+
+    def _add_columns(self, header):
+        existing = set(
+            row[1] for row in self._db.execute(
+                'PRAGMA table_info(classifications)'
+            )
+        )
+        for column in header:
+            if column in existing:
+                continue
+            self._db.execute(
+                'ALTER TABLE classifications ADD COLUMN {}'.format(
+                    quote(column)
+                )
+            )
+            if column in INDEXED_COLUMNS:
+                self._db.execute(
+                    'CREATE INDEX IF NOT EXISTS {} ON classifications '
+                    '({})'.format(
+                        quote('classifications_' + column),
+                        quote(column),
+                    )
+                )
+
+    def _set_high_water_mark(self, source, high_water_mark):
+        self._db.execute(
+            'INSERT OR REPLACE INTO sync_state '
+            '(source, high_water_mark, synced_at) VALUES (?, ?, ?)',
+            (
+                source,
+                high_water_mark,
+                datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            ),
+        )
@@ -0,0 +1,105 @@
+import json
+import os
+import socket
+import sys
+
+from panoptes_cli.config import config_dir
+
+SERVE_SOCKET = 'serve.sock'
+# Global options which don't affect the daemon's client, so commands using
+# them can still be forwarded, and whether each one takes a value
+FORWARDED_OPTIONS = {
+    '--format': True,
+    '--no-cache': False,
+}
+# Commands which change or replace the daemon itself
+LOCAL_COMMANDS = ('configure', 'serve')
+
+
+def main():
+    """
+    The ``panoptes`` command. If ``panoptes serve`` is running, the command
+    is run by it, which is much faster than starting from scratch.
+    Otherwise it's run in this process as usual.
+
+    This module only imports what it needs to forward the command, so that
+    doing so is quick.
+    """
+
+    exit_code = forward(sys.argv[1:])
+    if exit_code is not None:
+        sys.exit(exit_code)
+
+    from panoptes_cli.scripts.panoptes import cli
+    cli()
+
+
+def forward(args, socket_path=None):
+    """
+    Runs the command given by **args** in ``panoptes serve``, with this
+    process's stdin, stdout, stderr and working directory, and returns its
+    exit code. Returns None if it wasn't forwarded, either because the
+    daemon isn't running or because the command has to run locally.
+    """
+
+    if not forwardable(args):
+        return None
+    if socket_path is None:
+        socket_path = os.path.join(config_dir(), SERVE_SOCKET)
+    if not os.path.exists(socket_path):
+        return None
+
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(socket_path)
+    except OSError:
+        conn.close()
+        return None
+
+    request = {
+        'args': list(args),
+        'cwd': os.getcwd(),
+        'terminal_size': terminal_size(),
+    }
+    with conn:
+        try:
+            # The daemon reads and writes our streams directly, so output
+            # isn't copied through the socket and prompts still work
+            socket.send_fds(conn, [b'\0'], [0, 1, 2])
+            conn.sendall(json.dumps(request).encode('utf-8') + b'\n')
+            response = conn.makefile('rb').readline()
+        except OSError:
+            response = b''
+    if not response:
+        sys.stderr.write('Error: Lost connection to panoptes serve.\n')
+        return 1
+    return json.loads(response.decode('utf-8'))['exit_code']
+
+
+def forwardable(args, local_commands=LOCAL_COMMANDS):
+    """
+    Returns True if the command given by **args** can be run by
+    ``panoptes serve``, i.e. it only uses global options which are safe to
+    forward, and isn't one of **local_commands**.
+    """
+
+    args = iter(args)
+    for arg in args:
+        if not arg.startswith('-'):
+            return arg not in local_commands
+        option = arg.split('=', 1)[0]
+        if option not in FORWARDED_OPTIONS:
+            return False
+        if FORWARDED_OPTIONS[option] and '=' not in arg:
+            next(args, None)
+    # Just global options, e.g. --help
+    return False
+
+
+def terminal_size():
+    for fd in (1, 2):
+        try:
+            return list(os.get_terminal_size(fd))
+        except OSError:
+            pass
+    return None
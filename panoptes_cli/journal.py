@@ -0,0 +1,227 @@
+import contextlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+
+JOURNAL_EXTENSION = '.journal'
+JOURNAL_PAGE_SIZE = 1000
+
+
+class UploadJournal(object):
+    """
+    Records the progress of a subject upload in an SQLite database as it
+    happens, so an upload can be resumed even if the process is killed.
+
+    Each manifest row is written to the journal when it's read, updated with
+    the new subject ID when the subject is created, and deleted once the
+    subject is linked to the subject set. What's left in the journal is
+    exactly the work which still needs doing, so resuming costs time
+    proportional to that rather than to the size of the original upload.
+
+    The upload options (and the position reached in the manifests) are kept
+    alongside the rows, in **state**.
+
+    Every change is committed straight away. The database uses write-ahead
+    logging, so commits are cheap and survive the process being killed.
+    Methods may be called from any thread.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            path,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS state ('
+            'key TEXT PRIMARY KEY, '
+            'value TEXT NOT NULL)'
+        )
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS subjects ('
+            'row_number INTEGER PRIMARY KEY, '
+            'subject_data TEXT NOT NULL, '
+            'subject_id TEXT)'
+        )
+        self._db.execute(
+            'CREATE INDEX IF NOT EXISTS subjects_subject_id '
+            'ON subjects (subject_id)'
+        )
+        self.state = dict(
+            (key, json.loads(value))
+            for key, value in self._db.execute('SELECT key, value FROM state')
+        )
+
+    @classmethod
+    def create(cls, path, state):
+        """
+        Creates a new journal at **path** with the given upload **state**.
+        Raises :py:class:`FileExistsError` if there's already a file there.
+        """
+
+        if os.path.exists(path):
+            raise FileExistsError(path)
+        journal = cls(path)
+        journal.update_state(**state)
+        return journal
+
+    @classmethod
+    def open(cls, path):
+        """Opens an existing journal at **path**."""
+
+        if not os.path.isfile(path):
+            raise FileNotFoundError(path)
+        return cls(path)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._db.execute('BEGIN')
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+
+    def update_state(self, **state):
+        with self._transaction():
+            self._db.executemany(
+                'INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)',
+                [(key, json.dumps(value)) for key, value in state.items()],
+            )
+        self.state.update(state)
+
+    def add_rows(self, rows):
+        """
+        Adds ``(row_number, (files, metadata), subject_id)`` tuples to the
+        journal. Rows with a subject ID of ``None`` are waiting to upload, the
+        others are waiting to link.
+        """
+
+        with self._transaction():
+            self._db.executemany(
+                'INSERT OR REPLACE INTO subjects '
+                '(row_number, subject_data, subject_id) VALUES (?, ?, ?)',
+                [
+                    (
+                        row_number,
+                        json.dumps(subject_data),
+                        None if subject_id is None else str(subject_id),
+                    )
+                    for row_number, subject_data, subject_id in rows
+                ],
+            )
+
+    def row_read(self, subject_row, next_row):
+        """Records that a row was read from the manifests."""
+
+        row_number, subject_data = subject_row
+        with self._transaction():
+            self._db.execute(
+                'INSERT OR REPLACE INTO subjects '
+                '(row_number, subject_data) VALUES (?, ?)',
+                (row_number, json.dumps(subject_data)),
+            )
+            self._db.execute(
+                'INSERT OR REPLACE INTO state (key, value) '
+                'VALUES (\'next_row\', ?)',
+                (json.dumps(next_row),),
+            )
+        self.state['next_row'] = next_row
+
+    def created(self, row_number, subject_id):
+        """Records that the subject for a row was created."""
+
+        with self._lock:
+            self._db.execute(
+                'UPDATE subjects SET subject_id = ? WHERE row_number = ?',
+                (str(subject_id), row_number),
+            )
+
+    def linked(self, subject_ids):
+        """Records that the given subjects were linked to the subject set."""
+
+        with self._transaction():
+            self._db.executemany(
+                'DELETE FROM subjects WHERE subject_id = ?',
+                [(str(subject_id),) for subject_id in subject_ids],
+            )
+
+    def not_created(self, subject_ids):
+        """
+        Moves the rows for the given subjects back to waiting to upload, e.g.
+        because the subjects turned out not to exist.
+        """
+
+        with self._transaction():
+            self._db.executemany(
+                'UPDATE subjects SET subject_id = NULL WHERE subject_id = ?',
+                [(str(subject_id),) for subject_id in subject_ids],
+            )
+
+    def waiting_to_upload(self, before=None):
+        """
+        Yields ``(row_number, (files, metadata))`` for each row which hasn't
+        been created yet, in order, reading a page at a time. Only rows
+        numbered lower than **before** are included, if it's given.
+        """
+
+        if before is None:
+            before = sys.maxsize
+        last_row = -1
+        while True:
+            with self._lock:
+                page = self._db.execute(
+                    'SELECT row_number, subject_data FROM subjects '
+                    'WHERE subject_id IS NULL AND row_number > ? '
+                    'AND row_number < ? '
+                    'ORDER BY row_number LIMIT ?',
+                    (last_row, before, JOURNAL_PAGE_SIZE),
+                ).fetchall()
+            if not page:
+                return
+            for row_number, subject_data in page:
+                files, metadata = json.loads(subject_data)
+                yield row_number, (files, metadata)
+            last_row = page[-1][0]
+
+    def waiting_to_link(self):
+        """
+        Returns a list of the IDs of subjects which have been created but not
+        linked.
+        """
+
+        with self._lock:
+            return [
+                subject_id for subject_id, in self._db.execute(
+                    'SELECT subject_id FROM subjects '
+                    'WHERE subject_id IS NOT NULL'
+                )
+            ]
+
+    def remaining(self):
+        """Returns the number of rows which haven't been linked yet."""
+
+        with self._lock:
+            return self._db.execute(
+                'SELECT COUNT(*) FROM subjects'
+            ).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def remove(self):
+        """Closes the journal and deletes its files."""
+
+        self.close()
+        for path in (self.path, self.path + '-wal', self.path + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,77 @@
+import importlib
+
+import click
+
+from click.utils import make_default_short_help
+
+
+class LazyGroup(click.Group):
+    """
+    A :py:class:`click.Group` whose subcommands are defined in other modules,
+    which are only imported when the subcommand is used.
+
+    **lazy_commands** maps each subcommand's name to a tuple of the module
+    which defines it and its short help, so that the group's help can be
+    shown without importing anything. Importing the module must add the
+    subcommand to the group.
+
+    The subcommand's arguments are kept in ``ctx.subcommand_args``, so the
+    group's callback can tell (with :py:func:`help_requested`) whether any
+    work is going to be done.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.lazy_commands = kwargs.pop('lazy_commands', {})
+        super(LazyGroup, self).__init__(*args, **kwargs)
+
+    def list_commands(self, ctx):
+        return sorted(
+            set(super(LazyGroup, self).list_commands(ctx))
+            | set(self.lazy_commands)
+        )
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name not in self.commands and cmd_name in self.lazy_commands:
+            importlib.import_module(self.lazy_commands[cmd_name][0])
+        return super(LazyGroup, self).get_command(ctx, cmd_name)
+
+    def resolve_command(self, ctx, args):
+        cmd_name, command, args = super(LazyGroup, self).resolve_command(
+            ctx,
+            args,
+        )
+        # Click doesn't otherwise let the group's callback see these
+        ctx.subcommand_args = args
+        return cmd_name, command, args
+
+    def format_commands(self, ctx, formatter):
+        names = self.list_commands(ctx)
+        if not names:
+            return
+        limit = formatter.width - 6 - max(len(name) for name in names)
+
+        rows = []
+        for name in names:
+            if name in self.commands:
+                command = self.commands[name]
+                if command.hidden:
+                    continue
+                rows.append((name, command.get_short_help_str(limit)))
+            else:
+                short_help = self.lazy_commands[name][1]
+                rows.append((name, make_default_short_help(short_help, limit)))
+
+        with formatter.section('Commands'):
+            formatter.write_dl(rows)
+
+
+def help_requested(ctx):
+    """
+    Returns True if a :py:class:`LazyGroup`'s subcommand (or any of its
+    subcommands) is only going to show its help.
+    """
+
+    return any(
+        arg in ctx.help_option_names
+        for arg in getattr(ctx, 'subcommand_args', ())
+    )
@@ -0,0 +1,213 @@
+import queue
+import threading
+import time
+
+from panoptes_client import Subject
+from panoptes_client.panoptes import PanoptesAPIException
+from panoptes_client.utils import split
+
+LINK_CONCURRENCY = 2
+MIN_LINK_BATCH_SIZE = 1
+INITIAL_LINK_BATCH_SIZE = 25
+MAX_LINK_BATCH_SIZE = 500
+# Subject IDs to unlink go in the URL, so keep those batches shorter
+MAX_UNLINK_BATCH_SIZE = 100
+TARGET_BATCH_SECONDS = 2.0
+# How long to wait for a batch to fill up before sending it anyway
+BATCH_LINGER_SECONDS = 0.5
+LOOKUP_PAGE_SIZE = 100
+
+_STOP = object()
+
+
+class SubjectLinker(object):
+    """
+    Links subjects to (or, with **remove**, unlinks them from) a subject set
+    in batches, using background threads so linking happens while the caller
+    carries on with other work.
+
+    The batch size adapts to how the API responds: it doubles while batches
+    finish well within ``TARGET_BATCH_SECONDS`` and halves when they're slow
+    or fail. A failed batch is retried in halves until the failing subjects
+    are isolated, and those subjects are collected in **failed** rather than
+    stopping the whole run.
+
+    **on_linked** is called with each list of subject IDs once they have been
+    linked. It's called from the background threads.
+
+    Example::
+
+        with SubjectLinker(subject_set, Panoptes.client()) as linker:
+            for subject_id in subject_ids:
+                linker.submit([subject_id])
+        if linker.failed:
+            ...
+    """
+
+    def __init__(
+        self,
+        subject_set,
+        client,
+        remove=False,
+        concurrency=LINK_CONCURRENCY,
+        on_linked=None,
+    ):
+        self.subject_set = subject_set
+        self.client = client
+        self.remove = remove
+        self.on_linked = on_linked
+        if remove:
+            self.max_batch_size = MAX_UNLINK_BATCH_SIZE
+        else:
+            self.max_batch_size = MAX_LINK_BATCH_SIZE
+        self.batch_size = min(INITIAL_LINK_BATCH_SIZE, self.max_batch_size)
+        self.linked_count = 0
+        self.failed = []
+
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._closed = False
+        self._workers = [
+            threading.Thread(target=self._run, daemon=True)
+            for _ in range(concurrency)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit(self, subject_ids):
+        """Queues the given subject IDs to be linked."""
+
+        for subject_id in subject_ids:
+            self._queue.put(str(subject_id))
+
+    def close(self):
+        """
+        Waits until every queued subject has been linked (or has failed) and
+        stops the background threads. Safe to call more than once.
+        """
+
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._workers:
+            self._queue.put(_STOP)
+        for worker in self._workers:
+            worker.join()
+
+    def _next_batch(self):
+        subject_id = self._queue.get()
+        if subject_id is _STOP:
+            return None
+
+        batch = [subject_id]
+        deadline = time.monotonic() + BATCH_LINGER_SECONDS
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                subject_id = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if subject_id is _STOP:
+                # Let the next worker (or this one) see the stop marker after
+                # this batch has been sent.
+                self._queue.put(_STOP)
+                break
+            batch.append(subject_id)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            with self.client:
+                self._link(batch)
+
+    def _link(self, batch):
+        start = time.monotonic()
+        try:
+            self._send(batch)
+        except Exception:
+            self._resize(None)
+            if len(batch) == 1:
+                with self._lock:
+                    self.failed.extend(batch)
+                return
+            middle = len(batch) // 2
+            self._link(batch[:middle])
+            self._link(batch[middle:])
+            return
+
+        self._resize(time.monotonic() - start)
+        with self._lock:
+            self.linked_count += len(batch)
+        if self.on_linked:
+            self.on_linked(batch)
+
+    def _send(self, batch):
+        try:
+            if self.remove:
+                self.subject_set.http_delete(
+                    '{}/links/subjects/{}'.format(
+                        self.subject_set.id,
+                        ','.join(batch),
+                    ),
+                    retry=True,
+                )
+            else:
+                self.subject_set.http_post(
+                    '{}/links/subjects'.format(self.subject_set.id),
+                    json={'subjects': batch},
+                    retry=True,
+                )
+        except PanoptesAPIException:
+            # Most likely some of the subjects were already (or not) linked.
+            # The client's own methods check each subject first, which is
+            # slower but skips those.
+            links = self.subject_set.links.subjects
+            if self.remove:
+                links.remove(batch)
+            else:
+                links.add(batch)
+
+    def _resize(self, elapsed):
+        with self._lock:
+            if elapsed is None or elapsed > TARGET_BATCH_SECONDS:
+                self.batch_size = max(
+                    MIN_LINK_BATCH_SIZE,
+                    self.batch_size // 2,
+                )
+            elif elapsed < TARGET_BATCH_SECONDS / 2:
+                self.batch_size = min(
+                    self.max_batch_size,
+                    self.batch_size * 2,
+                )
+
+
+def find_linked_subjects(subject_set_id, subject_ids):
+    """
+    Looks up the given subjects a page at a time. Returns a tuple of two
+    sets: the IDs of the subjects which exist, and the IDs of those which are
+    already linked to the given subject set.
+    """
+
+    subject_set_id = str(subject_set_id)
+    existing = set()
+    linked = set()
+    for page in split(list(map(str, subject_ids)), LOOKUP_PAGE_SIZE):
+        for subject in Subject.where(id=','.join(page), page_size=len(page)):
+            if subject.id not in page:
+                continue
+            existing.add(subject.id)
+            subject_sets = subject.raw.get('links', {}).get('subject_sets')
+            if subject_set_id in map(str, subject_sets or []):
+                linked.add(subject.id)
+    return existing, linked
@@ -0,0 +1,156 @@
+import collections
+import itertools
+
+from concurrent.futures import ThreadPoolExecutor
+
+from panoptes_client import Panoptes
+from panoptes_client.panoptes import ResultPaginator
+
+from panoptes_cli.scheduler import fit_to_concurrency
+
+LIST_CONCURRENCY = 4
+LIST_PAGE_SIZE = 100
+# Number of pages (or chunks of IDs) to fetch ahead of the one being
+# output, per thread
+PAGES_AHEAD_PER_WORKER = 2
+
+
+def list_pages(
+    object_class,
+    page_size=LIST_PAGE_SIZE,
+    concurrency=LIST_CONCURRENCY,
+    **params
+):
+    """
+    Yields lists of **object_class** instances matching the given query
+    **params**, a page at a time and in order.
+
+    The first page says how many pages there are, so the rest are fetched by
+    a pool of **concurrency** threads rather than by following each page's
+    link to the next. Only a few pages are fetched ahead of the one being
+    yielded, so memory use doesn't depend on the number of results.
+
+    Example::
+
+        for page in list_pages(Subject, subject_set_id=1234):
+            for subject in page:
+                print(subject.id)
+    """
+
+    params = dict(
+        (key, value) for key, value in params.items() if value is not None
+    )
+    params['page_size'] = page_size
+
+    def fetch(page):
+        paginator = ResultPaginator(
+            object_class,
+            *object_class.http_get('', params=dict(params, page=page))
+        )
+        objects = [
+            object_class(raw, etag=paginator.etag)
+            for raw in paginator.object_list
+        ]
+        return objects, paginator.page_count
+
+    objects, page_count = fetch(1)
+    yield objects
+    if page_count <= 1:
+        return
+
+    for objects in ordered_map(
+        lambda page: fetch(page)[0],
+        range(2, page_count + 1),
+        concurrency,
+    ):
+        yield objects
+
+
+def find_many(
+    object_class,
+    ids,
+    chunk_size=LIST_PAGE_SIZE,
+    concurrency=LIST_CONCURRENCY,
+):
+    """
+    Yields a ``(id, object)`` tuple for each of the given **ids**, in the
+    same order, where ``object`` is an **object_class** instance or None if
+    it wasn't found.
+
+    Rather than finding each object separately, **ids** are looked up
+    **chunk_size** at a time, by a pool of **concurrency** threads. **ids**
+    can be any iterable, and is only read a few chunks ahead of the objects
+    being yielded.
+
+    Example::
+
+        for subject_id, subject in find_many(Subject, [1, 2, 3]):
+            print(subject_id, subject.locations if subject else None)
+    """
+
+    def fetch(chunk):
+        paginator = ResultPaginator(
+            object_class,
+            *object_class.http_get('', params={
+                'id': ','.join(chunk),
+                'page_size': len(chunk),
+            })
+        )
+        found = dict(
+            (raw['id'], object_class(raw, etag=paginator.etag))
+            for raw in paginator.object_list
+        )
+        return [(object_id, found.get(object_id)) for object_id in chunk]
+
+    ids = (str(object_id) for object_id in ids)
+    chunks = iter(lambda: list(itertools.islice(ids, chunk_size)), [])
+    for results in ordered_map(fetch, chunks, concurrency):
+        for result in results:
+            yield result
+
+
+def ordered_map(function, items, concurrency=LIST_CONCURRENCY):
+    """
+    Like :py:func:`map`, but calls **function** in a pool of **concurrency**
+    threads, each using the current Panoptes client. Results are yielded in
+    order, and only a few items are taken from **items** ahead of the result
+    being yielded.
+    """
+
+    client = Panoptes.client()
+    fit_to_concurrency(concurrency, client)
+
+    def call_in_thread(item):
+        with client:
+            return function(item)
+
+    items = iter(items)
+    done = object()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        in_flight = collections.deque(
+            executor.submit(call_in_thread, item)
+            for item in itertools.islice(
+                items,
+                concurrency * PAGES_AHEAD_PER_WORKER,
+            )
+        )
+        while in_flight:
+            result = in_flight.popleft().result()
+            item = next(items, done)
+            if item is not done:
+                in_flight.append(executor.submit(call_in_thread, item))
+            yield result
+
+
+def read_ids(ids, id_file):
+    """
+    Yields the given **ids**, followed by the ID on each non-blank line of
+    **id_file** (if given).
+    """
+
+    for object_id in ids:
+        yield object_id
+    if id_file:
+        for line in id_file:
+            if line.strip():
+                yield line.strip()
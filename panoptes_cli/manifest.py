@@ -0,0 +1,288 @@
+import csv
+import functools
+import itertools
+import os
+import stat
+
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+
+MAX_UPLOAD_FILE_SIZE = 1024 * 1024
+STAT_THREADS = 16
+STAT_CACHE_SIZE = 100000
+# Number of rows to read ahead so their files can be checked in parallel
+READ_AHEAD_ROWS = 256
+# Number of rows used to detect which columns contain filenames
+DETECTION_SAMPLE_ROWS = 10
+
+
+class ManifestError(Exception):
+    """
+    Raised when a manifest (or a row within it) can't be turned into a
+    subject.
+    """
+
+    pass
+
+
+def get_index_fields(headers):
+    index_fields = [
+        header.lstrip('%') for header in headers if header.startswith('%')
+    ]
+    return ",".join(str(field) for field in index_fields)
+
+
+def stat_file(file_path):
+    """
+    Returns the size of the given file, or None if it doesn't exist or isn't
+    a regular file.
+    """
+
+    try:
+        file_stat = os.stat(file_path)
+    except (OSError, ValueError):
+        return None
+    if not stat.S_ISREG(file_stat.st_mode):
+        return None
+    return file_stat.st_size
+
+
+def file_error(file_path, file_size):
+    """
+    Returns an error message if a file of the given size (as returned by
+    :py:func:`stat_file`) can't be uploaded, or None if it's OK.
+    """
+
+    if file_size is None:
+        return 'File "{}" could not be found.'.format(file_path)
+    elif file_size == 0:
+        return 'File "{}" is empty.'.format(file_path)
+    elif file_size > MAX_UPLOAD_FILE_SIZE:
+        # Imported here as it's slow to import, and rarely needed
+        import humanize
+        return 'File "{}" is {}, larger than the maximum {}.'.format(
+            file_path,
+            humanize.naturalsize(file_size),
+            humanize.naturalsize(MAX_UPLOAD_FILE_SIZE),
+        )
+    return None
+
+
+class ManifestReader(object):
+    """
+    Lazily reads subjects from one or more CSV manifests.
+
+    Iterating yields ``(row_number, (files, metadata))`` tuples, one row at a
+    time, so memory use doesn't depend on the size of the manifests. Row
+    numbers count every data row across all the manifests (starting at 0),
+    including rows which are skipped because they have no media, so they can
+    be used to pick up where a previous upload left off:
+
+        reader = ManifestReader(['manifest.csv'], start=1000)
+
+    **position** is the number of the next row to be read. It is only
+    advanced once a row has been handed out (or deliberately skipped), so if
+    iteration stops with a :py:class:`ManifestError` it points at the row
+    which caused the error.
+
+    **on_index_fields** is called with the comma-separated list of indexed
+    fields (headings starting with ``%``) for each manifest which has any.
+
+    If no **file_column** is given, the columns containing local filenames
+    are detected separately for each manifest, from its first few rows.
+    Rows are read a little ahead of where iteration has got to so that their
+    files can be checked by a pool of threads, which helps a lot when the
+    files are on a network file system. Each file is only checked once, and
+    **stats** counts the files found and any problems with them (see
+    :py:meth:`summary`).
+    """
+
+    def __init__(
+        self,
+        manifest_files,
+        file_column=(),
+        remote_location=(),
+        mime_type=(),
+        allow_missing=False,
+        start=0,
+        on_index_fields=None,
+        stat_threads=STAT_THREADS,
+    ):
+        self.manifest_files = manifest_files
+        self.file_column = list(file_column or [])
+        self._detect_columns = not self.file_column
+        self.remote_location = remote_location
+        self.mime_type = mime_type
+        self.allow_missing = allow_missing
+        self.start = start
+        self.position = start
+        self.on_index_fields = on_index_fields
+        self.stat_threads = stat_threads
+        self.stats = {
+            'files': 0,
+            'bytes': 0,
+            'missing': 0,
+            'empty': 0,
+            'too_large': 0,
+        }
+        self._stat = functools.lru_cache(maxsize=STAT_CACHE_SIZE)(stat_file)
+
+    def __iter__(self):
+        with ThreadPoolExecutor(max_workers=self.stat_threads) as stat_exec:
+            for subject_row in self._read(stat_exec):
+                yield subject_row
+
+    def summary(self):
+        """Returns a short description of the files which were checked."""
+
+        import humanize
+
+        summary = 'Checked {} files ({}).'.format(
+            self.stats['files'],
+            humanize.naturalsize(self.stats['bytes']),
+        )
+        problems = [
+            '{} {}'.format(self.stats[key], description)
+            for key, description in (
+                ('missing', 'missing'),
+                ('empty', 'empty'),
+                ('too_large', 'too large'),
+            )
+            if self.stats[key]
+        ]
+        if problems:
+            summary += ' Skipped {}.'.format(', '.join(problems))
+        return summary
+
+    def _read(self, stat_exec):
+        row_number = 0
+        for manifest_file in self.manifest_files:
+            file_root = os.path.dirname(manifest_file)
+            file_rows = 0
+            detect_columns = self._detect_columns
+            with open(manifest_file) as manifest_f:
+                r = csv.reader(manifest_f, skipinitialspace=True)
+                try:
+                    headers = next(r)
+                except StopIteration:
+                    headers = []
+                index_fields = get_index_fields(headers)
+                if index_fields and self.on_index_fields:
+                    self.on_index_fields(index_fields)
+                # remove leading % from subject metadata headings
+                cleaned_headers = [header.lstrip('%') for header in headers]
+
+                while True:
+                    rows = list(itertools.islice(r, READ_AHEAD_ROWS))
+                    if not rows:
+                        break
+                    skip = max(0, min(len(rows), self.start - row_number))
+                    file_rows += len(rows)
+                    row_number += skip
+                    rows = rows[skip:]
+                    if not rows:
+                        continue
+
+                    if detect_columns:
+                        detect_columns = False
+                        self._detect_file_columns(
+                            stat_exec,
+                            file_root,
+                            rows[:DETECTION_SAMPLE_ROWS],
+                        )
+                    self._prefetch(stat_exec, [
+                        self._file_path(file_root, row, field_number)
+                        for row in rows
+                        for field_number in self.file_column
+                    ])
+
+                    chunk_start = file_rows - len(rows)
+                    for chunk_index, row in enumerate(rows, start=1):
+                        files = self._files(file_root, row)
+                        if len(files) == 0:
+                            click.echo(
+                                'Could not find any files in row:',
+                                err=True,
+                            )
+                            click.echo(','.join(row), err=True)
+                            if not self.allow_missing:
+                                raise ManifestError(
+                                    'No media found in row {} of {}.'.format(
+                                        chunk_start + chunk_index,
+                                        manifest_file,
+                                    )
+                                )
+                            row_number += 1
+                            self.position = row_number
+                            continue
+
+                        metadata = dict(zip(cleaned_headers, row))
+                        subject_row = (row_number, (files, metadata))
+                        row_number += 1
+                        self.position = row_number
+                        yield subject_row
+
+            if file_rows == 0:
+                raise ManifestError(
+                    'File {} did not contain any rows.'.format(manifest_file)
+                )
+
+    def _prefetch(self, stat_exec, file_paths):
+        """Checks the given files in parallel, filling the cache."""
+
+        for _ in stat_exec.map(self._stat, set(file_paths)):
+            pass
+
+    def _detect_file_columns(self, stat_exec, file_root, rows):
+        candidates = [
+            (field_number, os.path.join(file_root, col))
+            for row in rows
+            for field_number, col in enumerate(row, start=1)
+            if col
+        ]
+        self._prefetch(stat_exec, [path for _, path in candidates])
+        self.file_column = sorted(set(
+            field_number for field_number, file_path in candidates
+            if self._stat(file_path) is not None
+        ))
+
+    def _file_path(self, file_root, row, field_number):
+        try:
+            return os.path.join(file_root, row[field_number - 1])
+        except IndexError:
+            return file_root
+
+    def _files(self, file_root, row):
+        files = []
+        for field_number in self.file_column:
+            file_path = self._file_path(file_root, row, field_number)
+            self._add_file(files, file_path)
+
+        for field_number, _mime_type in zip(
+            self.remote_location,
+            self.mime_type,
+        ):
+            files.append({_mime_type: row[field_number - 1]})
+        return files
+
+    def _add_file(self, files, file_path):
+        file_size = self._stat(file_path)
+        error = file_error(file_path, file_size)
+        if not error:
+            files.append(file_path)
+            self.stats['files'] += 1
+            self.stats['bytes'] += file_size
+            return
+
+        if file_size is None:
+            self.stats['missing'] += 1
+        elif file_size == 0:
+            self.stats['empty'] += 1
+        else:
+            self.stats['too_large'] += 1
+
+        if self.allow_missing:
+            click.echo('Error: {}'.format(error), err=True)
+        else:
+            raise ManifestError(error)
@@ -0,0 +1,117 @@
+import contextlib
+import hashlib
+import json
+import sqlite3
+import threading
+
+MEDIA_CACHE_FILE = 'media-cache.db'
+
+
+def media_hash(locations, media_files):
+    """
+    Returns a hash identifying a subject's media, from its list of locations
+    and the content of any local files (as stored by
+    :py:meth:`Subject.add_location`).
+    """
+
+    subject_hash = hashlib.sha256()
+    for location, media_data in zip(locations, media_files):
+        if media_data is not None:
+            part = hashlib.sha256(media_data).hexdigest()
+        else:
+            part = json.dumps(location, sort_keys=True)
+        subject_hash.update(part.encode('utf-8'))
+        subject_hash.update(b'\n')
+    return subject_hash.hexdigest()
+
+
+class MediaCache(object):
+    """
+    Remembers which subjects were created from which media, so re-running an
+    upload with an overlapping manifest can reuse existing subjects instead
+    of uploading the same media again.
+
+    Subjects are keyed by project and by :py:func:`media_hash`. Everything is
+    scoped to the API **endpoint**, since IDs from different endpoints are
+    unrelated. It's stored in an SQLite database (normally
+    ``~/.panoptes/media-cache.db``) and may be used from several threads at
+    once.
+    """
+
+    def __init__(self, path, endpoint):
+        self.path = path
+        self.endpoint = endpoint
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            path,
+            isolation_level=None,
+            check_same_thread=False,
+            timeout=30,
+        )
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS media ('
+            'endpoint TEXT NOT NULL, '
+            'project_id TEXT NOT NULL, '
+            'media_hash TEXT NOT NULL, '
+            'subject_id TEXT NOT NULL, '
+            'PRIMARY KEY (endpoint, project_id, media_hash))'
+        )
+
+    def find(self, project_id, subject_media_hash):
+        """
+        Returns the ID of the subject previously created in the given project
+        with the same media, or None.
+        """
+
+        with self._lock:
+            row = self._db.execute(
+                'SELECT subject_id FROM media '
+                'WHERE endpoint = ? AND project_id = ? AND media_hash = ?',
+                (self.endpoint, str(project_id), subject_media_hash),
+            ).fetchone()
+        return row[0] if row else None
+
+    def add(self, project_id, subject_media_hash, subject_id):
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO media '
+                '(endpoint, project_id, media_hash, subject_id) '
+                'VALUES (?, ?, ?, ?)',
+                (
+                    self.endpoint,
+                    str(project_id),
+                    subject_media_hash,
+                    str(subject_id),
+                ),
+            )
+
+    def remove(self, subject_ids):
+        """
+        Forgets the given subjects, e.g. because they have been deleted, so
+        their media is uploaded again next time.
+        """
+
+        with self._transaction():
+            self._db.executemany(
+                'DELETE FROM media WHERE endpoint = ? AND subject_id = ?',
+                (
+                    (self.endpoint, str(subject_id))
+                    for subject_id in subject_ids
+                ),
+            )
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._db.execute('BEGIN')
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
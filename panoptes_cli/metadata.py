@@ -0,0 +1,186 @@
+import collections
+import itertools
+import time
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+
+from panoptes_cli.listing import (
+    LIST_CONCURRENCY,
+    LIST_PAGE_SIZE,
+    PAGES_AHEAD_PER_WORKER,
+    find_many,
+)
+from panoptes_cli.scheduler import fit_to_concurrency
+from panoptes_client import Panoptes, Subject
+from panoptes_client.panoptes import PanoptesAPIException
+from panoptes_client.subject import RETRY_BACKOFF_INTERVAL, UPLOAD_RETRY_LIMIT
+
+SAVE_CONCURRENCY = 5
+SAVES_AHEAD_PER_WORKER = 4
+
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+MISSING = 'missing'
+FAILED = 'failed'
+
+
+class MetadataUpdater(object):
+    """
+    Updates the metadata of many subjects from rows of a CSV file (dicts with
+    a ``subject_id`` key, as produced by :py:class:`csv.DictReader`).
+
+    Subjects are fetched **chunk_size** at a time with multi-ID requests,
+    ahead of the rows being processed. Each subject's new metadata is merged
+    into (or with **replace**, replaces) its existing metadata, and subjects
+    whose metadata would be unchanged aren't saved at all. The rest are
+    saved by a pool of **concurrency** threads, retrying on connection
+    errors. Rows for the same subject are applied one after another.
+
+    Example::
+
+        updater = MetadataUpdater(concurrency=10)
+        for row, status, error in updater.update(csv.DictReader(f)):
+            if status == FAILED:
+                print(row['subject_id'], error)
+    """
+
+    def __init__(
+        self,
+        replace=False,
+        concurrency=SAVE_CONCURRENCY,
+        chunk_size=LIST_PAGE_SIZE,
+        lookup_concurrency=LIST_CONCURRENCY,
+    ):
+        self.replace = replace
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.lookup_concurrency = lookup_concurrency
+
+    def update(self, rows):
+        """
+        Yields a ``(row, status, error)`` tuple for each of **rows**, in
+        order. ``status`` is one of ``UPDATED``, ``UNCHANGED``, ``MISSING``
+        or ``FAILED``, and ``error`` is the exception for failed rows.
+
+        **rows** is read as it goes, so it can be as long as you like.
+        """
+
+        client = Panoptes.client()
+        fit_to_concurrency(
+            self.concurrency + self.lookup_concurrency,
+            client,
+        )
+        rows, lookup_rows = itertools.tee(rows)
+        subjects = find_many(
+            Subject,
+            (row['subject_id'] for row in lookup_rows),
+            chunk_size=self.chunk_size,
+            concurrency=self.lookup_concurrency,
+        )
+        window = self.concurrency * SAVES_AHEAD_PER_WORKER
+        # Subjects are fetched this many rows ahead, so a subject in a row
+        # may have been fetched before an earlier row for it was saved
+        history_size = window + self.chunk_size * (
+            self.lookup_concurrency * PAGES_AHEAD_PER_WORKER + 1
+        )
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            in_flight = collections.deque()
+            # Subject ID -> the last save of it in the last history_size rows
+            saving = {}
+            history = collections.deque()
+            for row, (subject_id, subject) in zip(rows, subjects):
+                if subject is None:
+                    future = resolved((row, MISSING, None))
+                elif subject_id in saving:
+                    # Apply the row once the earlier save has finished, to a
+                    # fresh copy of the subject
+                    future = executor.submit(
+                        self._save_after,
+                        saving[subject_id],
+                        client,
+                        row,
+                        subject,
+                    )
+                    saving[subject_id] = future
+                else:
+                    metadata = self.merged_metadata(subject, row)
+                    if metadata == subject.metadata:
+                        future = resolved((row, UNCHANGED, None))
+                    else:
+                        subject.metadata = metadata
+                        future = executor.submit(
+                            self._save,
+                            client,
+                            row,
+                            subject,
+                        )
+                        saving[subject_id] = future
+
+                in_flight.append(future)
+                history.append((subject_id, future))
+                if len(history) > history_size:
+                    old_id, old_future = history.popleft()
+                    if saving.get(old_id) is old_future:
+                        del saving[old_id]
+                while len(in_flight) > window:
+                    yield in_flight.popleft().result()
+            while in_flight:
+                yield in_flight.popleft().result()
+
+    def merged_metadata(self, subject, row):
+        metadata = dict(
+            (key, value) for key, value in row.items() if key != 'subject_id'
+        )
+        if self.replace:
+            return metadata
+        return dict(subject.metadata, **metadata)
+
+    def _save_after(self, previous, client, row, subject):
+        """
+        Waits for the **previous** save of the same subject, then applies
+        **row** to the subject as it now is.
+        """
+
+        previous.result()
+        return self._reload_and_save(client, row, subject)
+
+    def _reload_and_save(self, client, row, subject):
+        try:
+            with client:
+                subject.reload()
+        except Exception as e:
+            return row, FAILED, e
+        metadata = self.merged_metadata(subject, row)
+        if metadata == subject.metadata:
+            return row, UNCHANGED, None
+        subject.metadata = metadata
+        return self._save(client, row, subject, reloaded=True)
+
+    def _save(self, client, row, subject, reloaded=False):
+        attempt = 1
+        while True:
+            try:
+                subject.save(client=client)
+                return row, UPDATED, None
+            except requests.exceptions.RequestException as e:
+                if attempt >= UPLOAD_RETRY_LIMIT:
+                    return row, FAILED, e
+                attempt += 1
+                time.sleep(RETRY_BACKOFF_INTERVAL)
+            except PanoptesAPIException as e:
+                if reloaded:
+                    return row, FAILED, e
+                # Most likely the subject was changed since it was fetched,
+                # so its ETag is stale. Try once more with a fresh copy.
+                return self._reload_and_save(client, row, subject)
+            except Exception as e:
+                return row, FAILED, e
+
+
+def resolved(result):
+    future = Future()
+    future.set_result(result)
+    return future
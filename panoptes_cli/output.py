@@ -0,0 +1,100 @@
+import csv
+import io
+import json
+
+import click
+
+OUTPUT_FORMATS = ('text', 'jsonl', 'csv', 'tsv')
+CSV_DELIMITERS = {
+    'csv': ',',
+    'tsv': '\t',
+}
+
+
+class Emitter(object):
+    """
+    Writes records (dicts) to stdout one at a time, in the given
+    **output_format**, so nothing needs to be held in memory.
+
+    - ``jsonl`` writes each record as a line of JSON.
+    - ``csv`` and ``tsv`` write a header row followed by a row for each
+      record. The columns are **columns** if given, or the keys of the first
+      record otherwise. Values which aren't strings (including lists and
+      dicts) are written as JSON, and None is written as an empty cell.
+
+    Example::
+
+        emitter = Emitter('csv', columns=['id', 'display_name'])
+        for project in Project.where():
+            emitter.emit({'id': project.id, 'display_name': ...})
+    """
+
+    def __init__(self, output_format, columns=None):
+        self.output_format = output_format
+        self.columns = list(columns) if columns else None
+        self._buffer = io.StringIO()
+        self._writer = None
+
+    def emit(self, record):
+        if self.output_format == 'jsonl':
+            click.echo(json.dumps(record))
+            return
+
+        if self._writer is None:
+            self._writer = csv.DictWriter(
+                self._buffer,
+                fieldnames=self.columns or list(record),
+                delimiter=CSV_DELIMITERS[self.output_format],
+                lineterminator='\n',
+                extrasaction='ignore',
+            )
+            self._writer.writeheader()
+        self._writer.writerow(
+            dict((key, cell(value)) for key, value in record.items())
+        )
+        click.echo(self._buffer.getvalue(), nl=False)
+        self._buffer.seek(0)
+        self._buffer.truncate()
+
+    def emit_all(self, records):
+        for record in records:
+            self.emit(record)
+
+
+def get_emitter(columns=None):
+    """
+    Returns an :py:class:`Emitter` for the output format chosen with the
+    global ``--format`` option, or None if it's the default text format.
+    """
+
+    ctx = click.get_current_context(silent=True)
+    output_format = 'text'
+    if ctx:
+        output_format = getattr(ctx.find_root(), 'output_format', 'text')
+    if output_format == 'text':
+        return None
+    return Emitter(output_format, columns)
+
+
+def echo_raw(raw):
+    """
+    Prints a single object's raw API representation, as YAML in the default
+    text format.
+    """
+
+    emitter = get_emitter()
+    if emitter:
+        emitter.emit(raw)
+    else:
+        # Imported here since the other formats don't need it, and this
+        # module is imported by every command
+        import yaml
+        click.echo(yaml.dump(raw))
+
+
+def cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value
+    return json.dumps(value)
@@ -0,0 +1,254 @@
+import collections
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import click
+
+from panoptes_client.panoptes import PanoptesAPIException
+
+RESOURCE_CACHE_FILE = os.path.join('cache', 'resources.db')
+# Seconds before a cached resource is checked with the API again. Anything
+# else (e.g. subjects) isn't cached at all.
+RESOURCE_TTLS = {
+    'projects': 3600,
+    'workflows': 600,
+    'subject_sets': 300,
+}
+# Bytes of JSON to keep before the least recently used resources are dropped
+RESOURCE_CACHE_SIZE = 16 * 1024 * 1024
+
+CacheEntry = collections.namedtuple('CacheEntry', 'raw etag fresh')
+
+
+class ResourceCache(object):
+    """
+    Keeps copies of projects, workflows and subject sets fetched from the
+    API, so that commands which only read them don't have to fetch them
+    every time.
+
+    A cached resource is used as it is for a while after it was fetched (see
+    ``RESOURCE_TTLS``), after which it's revalidated with a conditional
+    request, which only fetches it again if it's changed. When the cache is
+    bigger than **max_size** bytes, the least recently used resources are
+    dropped.
+
+    Everything is scoped to **scope** (the endpoint, username and whether
+    admin mode is on), since different users can see different things. It's
+    stored in an SQLite database (normally
+    ``~/.panoptes/cache/resources.db``) and may be used from several threads
+    at once.
+    """
+
+    def __init__(
+        self,
+        path,
+        scope,
+        max_size=RESOURCE_CACHE_SIZE,
+        ttls=RESOURCE_TTLS,
+    ):
+        self.path = path
+        self.scope = scope
+        self.max_size = max_size
+        self.ttls = ttls
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            path,
+            isolation_level=None,
+            check_same_thread=False,
+            timeout=30,
+        )
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS resources ('
+            'scope TEXT NOT NULL, '
+            'kind TEXT NOT NULL, '
+            'id TEXT NOT NULL, '
+            'raw TEXT NOT NULL, '
+            'etag TEXT, '
+            'fetched_at REAL NOT NULL, '
+            'accessed_at REAL NOT NULL, '
+            'size INTEGER NOT NULL, '
+            'PRIMARY KEY (scope, kind, id))'
+        )
+        self._db.execute(
+            'CREATE INDEX IF NOT EXISTS resources_accessed_at '
+            'ON resources (accessed_at)'
+        )
+
+    def get(self, kind, resource_id):
+        """
+        Returns a ``CacheEntry`` for the given resource, or None if it isn't
+        cached. ``fresh`` is False if it's due to be revalidated.
+        """
+
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                'SELECT raw, etag, fetched_at FROM resources '
+                'WHERE scope = ? AND kind = ? AND id = ?',
+                (self.scope, kind, str(resource_id)),
+            ).fetchone()
+            if not row:
+                return None
+            self._db.execute(
+                'UPDATE resources SET accessed_at = ? '
+                'WHERE scope = ? AND kind = ? AND id = ?',
+                (now, self.scope, kind, str(resource_id)),
+            )
+        raw, etag, fetched_at = row
+        return CacheEntry(
+            json.loads(raw),
+            etag,
+            now - fetched_at < self.ttls.get(kind, 0),
+        )
+
+    def put(self, kind, resource_id, raw, etag):
+        raw = json.dumps(raw)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO resources '
+                '(scope, kind, id, raw, etag, fetched_at, accessed_at, size) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    self.scope,
+                    kind,
+                    str(resource_id),
+                    raw,
+                    etag,
+                    now,
+                    now,
+                    len(raw),
+                ),
+            )
+            self._evict()
+
+    def revalidated(self, kind, resource_id):
+        """Records that the API says the cached resource hasn't changed."""
+
+        with self._lock:
+            self._db.execute(
+                'UPDATE resources SET fetched_at = ? '
+                'WHERE scope = ? AND kind = ? AND id = ?',
+                (time.time(), self.scope, kind, str(resource_id)),
+            )
+
+    def invalidate(self, kind, resource_id):
+        with self._lock:
+            self._db.execute(
+                'DELETE FROM resources '
+                'WHERE scope = ? AND kind = ? AND id = ?',
+                (self.scope, kind, str(resource_id)),
+            )
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _evict(self):
+        total_size = self._db.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM resources'
+        ).fetchone()[0]
+        if total_size <= self.max_size:
+            return
+
+        evicted = []
+        for rowid, size in self._db.execute(
+            'SELECT rowid, size FROM resources ORDER BY accessed_at, rowid'
+        ):
+            if total_size <= self.max_size:
+                break
+            evicted.append((rowid,))
+            total_size -= size
+        self._db.executemany('DELETE FROM resources WHERE rowid = ?', evicted)
+
+
+def get_resource_cache():
+    """
+    Returns the current command's :py:class:`ResourceCache`, opening it the
+    first time, or None if the global ``--no-cache`` option was given or
+    the cache can't be opened.
+    """
+
+    ctx = click.get_current_context(silent=True)
+    if not ctx:
+        return None
+    root = ctx.find_root()
+    if getattr(root, 'no_cache', True):
+        return None
+
+    cache = getattr(root, 'resource_cache', None)
+    if cache is None:
+        path = os.path.join(root.config_dir, RESOURCE_CACHE_FILE)
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            scope = '{} {}'.format(
+                root.config['endpoint'],
+                root.config['username'],
+            )
+            # Admins see more in admin mode
+            if getattr(root, 'admin', False):
+                scope += ' admin'
+            cache = ResourceCache(path, scope)
+        except (OSError, sqlite3.Error):
+            root.no_cache = True
+            return None
+        root.resource_cache = cache
+        root.call_on_close(cache.close)
+    return cache
+
+
+def cached_find(object_class, resource_id):
+    """
+    Like ``object_class.find(resource_id)``, but uses the resource cache.
+
+    The object's etag may be out of date, so the object shouldn't be saved
+    or deleted. Anything which changes a resource should fetch it with
+    ``object_class.find`` and then call :py:func:`invalidate_cached`.
+    """
+
+    cache = get_resource_cache()
+    kind = object_class._api_slug
+    if cache is None or kind not in cache.ttls or not resource_id:
+        return object_class.find(resource_id)
+
+    entry = cache.get(kind, resource_id)
+    if entry and entry.fresh:
+        return object_class(entry.raw, etag=entry.etag)
+
+    headers = {}
+    if entry and entry.etag:
+        headers['If-None-Match'] = entry.etag
+    response, etag = object_class.http_get(
+        '',
+        params={'id': resource_id},
+        headers=headers,
+    )
+    # 304 Not Modified, which has no body
+    if response is None and entry:
+        cache.revalidated(kind, resource_id)
+        return object_class(entry.raw, etag=entry.etag)
+
+    resources = response.get(kind) if response else None
+    if not resources:
+        cache.invalidate(kind, resource_id)
+        raise PanoptesAPIException(
+            "Could not find {} with id='{}'".format(
+                object_class.__name__,
+                resource_id,
+            )
+        )
+    cache.put(kind, resource_id, resources[0], etag)
+    return object_class(resources[0], etag=etag)
+
+
+def invalidate_cached(obj):
+    """Drops a resource which has been changed or deleted from the cache."""
+
+    cache = get_resource_cache()
+    if cache is not None:
+        cache.invalidate(obj._api_slug, obj.id)
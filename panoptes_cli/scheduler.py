@@ -0,0 +1,211 @@
+import email.utils
+import random
+import threading
+import time
+
+from panoptes_client import Panoptes
+
+from panoptes_cli.config import KEEP_ALIVE, RATE_LIMIT, REQUEST_CONCURRENCY
+from panoptes_cli.session import PooledAdapter
+
+# How many requests can be made at once after a quiet spell
+RATE_BURST = 20
+REQUEST_RETRY_LIMIT = 5
+BACKOFF_BASE = 1
+BACKOFF_MAX = 60
+# Safe to retry whatever the method, since the request wasn't processed
+RETRY_ANY_STATUSES = (429, 503)
+RETRY_IDEMPOTENT_STATUSES = (500, 502, 504)
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+
+class TokenBucket(object):
+    """
+    A thread-safe token bucket, which lets through **rate** requests per
+    second on average, and up to **capacity** at once after a quiet spell.
+    A **rate** of 0 means unlimited.
+
+    :py:meth:`pause` holds back every thread, e.g. while the server has asked
+    for requests to stop.
+    """
+
+    def __init__(self, rate=RATE_LIMIT, capacity=RATE_BURST):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._not_before = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a request can be made."""
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._not_before - now
+                if wait <= 0 and not self.rate:
+                    return
+                if wait <= 0:
+                    self._tokens = min(
+                        self.capacity,
+                        self._tokens + (now - self._updated) * self.rate,
+                    )
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._not_before = max(
+                self._not_before,
+                time.monotonic() + seconds,
+            )
+
+
+class SchedulingAdapter(PooledAdapter):
+    """
+    A :py:class:`PooledAdapter` which schedules every request made through
+    it:
+
+    - Requests are rate limited by a shared :py:class:`TokenBucket`.
+    - At most **concurrency** requests are in progress at once.
+    - Responses with status 429 or 503 are retried, as are 500, 502 and 504
+      for idempotent methods, up to **retry_limit** times. The wait is the
+      server's ``Retry-After`` if it gave one, or an exponential backoff
+      with jitter otherwise. A 429 pauses all requests, not just the one
+      which got it.
+
+    Unless **pool_maxsize** is given, the connection pool holds
+    **concurrency** connections to start with, and grows with the number of
+    threads using it (see :py:meth:`fit`).
+
+    Example::
+
+        session.mount('https://', SchedulingAdapter(rate=10, concurrency=8))
+    """
+
+    def __init__(
+        self,
+        rate=RATE_LIMIT,
+        concurrency=REQUEST_CONCURRENCY,
+        retry_limit=REQUEST_RETRY_LIMIT,
+        **kwargs
+    ):
+        self.bucket = TokenBucket(rate, max(RATE_BURST, concurrency))
+        self.retry_limit = retry_limit
+        self.concurrency = concurrency
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self.auto_pool_size = 'pool_maxsize' not in kwargs
+        kwargs.setdefault('pool_maxsize', concurrency)
+        super(SchedulingAdapter, self).__init__(**kwargs)
+
+    def fit(self, concurrency):
+        """
+        Makes sure (unless the pool size was given) that the pool has a
+        connection for each of **concurrency** threads, since a streamed
+        response keeps its connection after the request has been sent.
+        The number of requests made at once is still limited to
+        **concurrency** given to the constructor, so any more just wait.
+        """
+
+        if self.auto_pool_size and concurrency > self.pool_size:
+            self.resize(concurrency)
+
+    def send(self, request, **kwargs):
+        attempt = 1
+        while True:
+            self.bucket.acquire()
+            with self._slots:
+                response = super(SchedulingAdapter, self).send(
+                    request,
+                    **kwargs
+                )
+            if (
+                attempt >= self.retry_limit
+                or not self.should_retry(request, response)
+            ):
+                return response
+
+            delay = retry_after(response)
+            if delay is None:
+                delay = backoff(attempt)
+            if response.status_code == 429:
+                self.bucket.pause(delay)
+            response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def should_retry(self, request, response):
+        if response.status_code in RETRY_ANY_STATUSES:
+            return True
+        return (
+            response.status_code in RETRY_IDEMPOTENT_STATUSES
+            and request.method in IDEMPOTENT_METHODS
+        )
+
+
+def schedule_session(session, config):
+    """
+    Mounts a :py:class:`SchedulingAdapter` on a :py:class:`requests.Session`
+    for all URLs, set up from the given CLI **config** dict.
+    """
+
+    kwargs = {
+        'rate': config.get('rate_limit', RATE_LIMIT),
+        'concurrency': config.get('request_concurrency', REQUEST_CONCURRENCY),
+        'keep_alive': config.get('keep_alive', KEEP_ALIVE),
+        'pool_block': config.get('pool_block', False),
+    }
+    if config.get('pool_size'):
+        kwargs['pool_maxsize'] = config['pool_size']
+    adapter = SchedulingAdapter(**kwargs)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return adapter
+
+
+def fit_to_concurrency(concurrency, client=None):
+    """
+    Gives **client** (or the current Panoptes client) a connection for each
+    of **concurrency** threads, without raising the limit on the number of
+    requests made at once. Anything which makes requests from several
+    threads calls this with its number of threads.
+    """
+
+    if not client:
+        client = Panoptes.client()
+    for adapter in set(client.session.adapters.values()):
+        if isinstance(adapter, SchedulingAdapter):
+            adapter.fit(concurrency)
+
+
+def retry_after(response):
+    """
+    Returns the number of seconds to wait given by a response's
+    ``Retry-After`` header, or None if it doesn't have a valid one.
+    """
+
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_time = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_time is None:
+        return None
+    return max(retry_time.timestamp() - time.time(), 0)
+
+
+def backoff(attempt):
+    """Exponential backoff with full jitter, for the given attempt number."""
+
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
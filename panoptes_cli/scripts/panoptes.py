@@ -1,11 +1,68 @@
 import click
 import os
-import yaml
-from panoptes_client import Panoptes
+
+from panoptes_cli.config import (
+    CONFIG_FILE,
+    KEEP_ALIVE,
+    RATE_LIMIT,
+    REQUEST_CONCURRENCY,
+    config_dir,
+    load_config,
+)
+from panoptes_cli.lazy import LazyGroup, help_requested
+from panoptes_cli.output import OUTPUT_FORMATS
+
+# Each command's module is only imported when it's used, to keep startup fast
+COMMANDS = {
+    'batch': (
+        'panoptes_cli.commands.batch',
+        "Runs a file of commands in one process.",
+    ),
+    'configure': (
+        'panoptes_cli.commands.configure',
+        "Sets default values for configuration options.",
+    ),
+    'export': (
+        'panoptes_cli.commands.export',
+        "Contains commands for working with data exports.",
+    ),
+    'inaturalist': (
+        'panoptes_cli.commands.inaturalist',
+        "Contains commands related to iNaturalist integration",
+    ),
+    'info': (
+        'panoptes_cli.commands.info',
+        "Displays version and environment information for debugging.",
+    ),
+    'project': (
+        'panoptes_cli.commands.project',
+        "Contains commands for managing projects.",
+    ),
+    'serve': (
+        'panoptes_cli.commands.serve',
+        "Runs other panoptes commands, so they start faster.",
+    ),
+    'subject': (
+        'panoptes_cli.commands.subject',
+        "Contains commands for managing subjects.",
+    ),
+    'subject-set': (
+        'panoptes_cli.commands.subject_set',
+        "Contains commands for managing subject sets.",
+    ),
+    'user': (
+        'panoptes_cli.commands.user',
+        "Contains commands for retrieving information about users.",
+    ),
+    'workflow': (
+        'panoptes_cli.commands.workflow',
+        "Contains commands for managing workflows.",
+    ),
+}
 
 
 @click.version_option(prog_name='Panoptes CLI')
-@click.group()
+@click.group(cls=LazyGroup, lazy_commands=COMMANDS)
 @click.option(
     '--endpoint',
     '-e',
@@ -21,38 +78,116 @@ from panoptes_client import Panoptes
     ),
     is_flag=True,
 )
+@click.option(
+    '--format',
+    'output_format',
+    help=(
+        "Output format for ls and info commands. jsonl, csv and tsv are "
+        "written a record at a time, for processing by other programs. "
+        "Defaults to text."
+    ),
+    type=click.Choice(OUTPUT_FORMATS),
+    default='text',
+)
+@click.option(
+    '--rate-limit',
+    help=(
+        "Maximum number of API requests per second, or 0 for no limit. "
+        "Defaults to {}.".format(RATE_LIMIT)
+    ),
+    type=click.FloatRange(min=0),
+)
+@click.option(
+    '--request-concurrency',
+    help=(
+        "Maximum number of API requests to make at once. Defaults to "
+        "{}.".format(REQUEST_CONCURRENCY)
+    ),
+    type=click.IntRange(min=1),
+)
+@click.option(
+    '--pool-size',
+    help=(
+        "Number of connections to keep open to the API. Defaults to the "
+        "number of requests which can be made at once."
+    ),
+    type=click.IntRange(min=1),
+)
+@click.option(
+    '--keep-alive',
+    help=(
+        "Seconds before checking that an idle connection is still alive, or "
+        "0 to never check. Defaults to {}.".format(KEEP_ALIVE)
+    ),
+    type=click.IntRange(min=0),
+)
+@click.option(
+    '--no-cache',
+    help=(
+        "Always fetches projects, workflows and subject sets from the API, "
+        "instead of using copies cached in ~/.panoptes/cache/."
+    ),
+    is_flag=True,
+)
 @click.pass_context
-def cli(ctx, endpoint, admin):
-    ctx.config_dir = os.path.expanduser('~/.panoptes/')
-    ctx.config_file = os.path.join(ctx.config_dir, 'config.yml')
-    ctx.config = {
-        'endpoint': 'https://www.zooniverse.org',
-        'username': '',
-        'password': '',
-    }
-
-    try:
-        with open(ctx.config_file) as conf_f:
-            ctx.config.update(yaml.full_load(conf_f))
-    except IOError:
-        pass
+def cli(
+    ctx,
+    endpoint,
+    admin,
+    output_format,
+    rate_limit,
+    request_concurrency,
+    pool_size,
+    keep_alive,
+    no_cache,
+):
+    ctx.output_format = output_format
+    ctx.no_cache = no_cache
+    ctx.admin = admin
+    ctx.config_dir = config_dir()
+    ctx.config_file = os.path.join(ctx.config_dir, CONFIG_FILE)
+    ctx.config = load_config(ctx.config_file)
 
     if endpoint:
         ctx.config['endpoint'] = endpoint
+    if rate_limit is not None:
+        ctx.config['rate_limit'] = rate_limit
+    if request_concurrency:
+        ctx.config['request_concurrency'] = request_concurrency
+    if pool_size:
+        ctx.config['pool_size'] = pool_size
+    if keep_alive is not None:
+        ctx.config['keep_alive'] = keep_alive
 
-    if ctx.invoked_subcommand != 'configure':
-        Panoptes.connect(
-            endpoint=ctx.config['endpoint'],
-            username=ctx.config['username'],
-            password=ctx.config['password'],
-            admin=admin,
-        )
+    if ctx.invoked_subcommand == 'configure' or help_requested(ctx):
+        return
+    if ctx.obj is not None:
+        # Run by `panoptes serve` or `panoptes batch`, whose client is
+        # already connected
+        ctx.admin = ctx.obj.admin
+        return
+
+    # Imported here so that showing help doesn't wait for them
+    from panoptes_client import Panoptes
+    from panoptes_cli.scheduler import schedule_session
+    from panoptes_cli.token_cache import TOKEN_CACHE_FILE, TokenCache
 
-from panoptes_cli.commands.configure import *
-from panoptes_cli.commands.info import *
-from panoptes_cli.commands.project import *
-from panoptes_cli.commands.subject import *
-from panoptes_cli.commands.subject_set import *
-from panoptes_cli.commands.user import *
-from panoptes_cli.commands.workflow import *
-from panoptes_cli.commands.inaturalist import *
+    # The client logs in when it first needs to, which it won't if there's
+    # a cached token. It's given empty credentials to start with, since
+    # otherwise it logs in straight away, as PANOPTES_USERNAME if that's set.
+    client = Panoptes.connect(
+        endpoint=ctx.config['endpoint'],
+        username='',
+        password='',
+        admin=admin,
+    )
+    client.username = ctx.config['username']
+    client.password = ctx.config['password']
+    schedule_session(client.session, ctx.config)
+
+    if client.username and client.password:
+        token_cache = TokenCache(
+            os.path.join(ctx.config_dir, TOKEN_CACHE_FILE),
+        )
+        token_cache.restore(client)
+        ctx.call_on_close(lambda: token_cache.save(client))
@@ -0,0 +1,240 @@
+import _thread
+import json
+import os
+import socket
+import sys
+import threading
+import traceback
+
+LISTEN_BACKLOG = 64
+# Seconds to wait for a connected process to send its command
+REQUEST_TIMEOUT = 10
+
+
+class ServeError(Exception):
+    pass
+
+
+class CommandServer(object):
+    """
+    Runs commands forwarded by :py:func:`panoptes_cli.forward.forward` over
+    a Unix socket at **path**, in this process, so that they don't have to
+    import everything and connect to the API first.
+
+    Each command is run by calling ``command.main()`` (normally on the
+    ``panoptes`` group) with **obj** as the context object. It uses the
+    forwarding process's stdin, stdout, stderr, working directory and
+    terminal size, so commands are run one at a time. If the forwarding
+    process goes away (e.g. because of Ctrl-C), its command is interrupted.
+
+    With **idle_timeout**, :py:meth:`serve_forever` returns after that many
+    seconds without a command. It also returns after the current command if
+    ``stopping`` is set (e.g. by a signal handler).
+
+    Example::
+
+        server = CommandServer(path, cli, Panoptes.client())
+        server.listen()
+        server.serve_forever()
+    """
+
+    def __init__(self, path, command, obj=None, idle_timeout=0):
+        self.path = path
+        self.command = command
+        self.obj = obj
+        self.idle_timeout = idle_timeout
+        self.stopping = False
+        self._listener = None
+
+    def listen(self):
+        """
+        Creates the socket, which only the current user can connect to.
+        Raises :py:class:`ServeError` if another server is already using it.
+        """
+
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except OSError:
+                # Left behind by a server which didn't stop cleanly
+                os.remove(self.path)
+            else:
+                raise ServeError(
+                    'Already serving commands on {}.'.format(self.path)
+                )
+            finally:
+                probe.close()
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)
+        try:
+            listener.bind(self.path)
+        finally:
+            os.umask(old_umask)
+        listener.listen(LISTEN_BACKLOG)
+        listener.settimeout(self.idle_timeout or None)
+        self._listener = listener
+
+    def serve_forever(self):
+        if self._listener is None:
+            self.listen()
+        try:
+            while not self.stopping:
+                try:
+                    conn, _ = self._listener.accept()
+                except socket.timeout:
+                    return
+                with conn:
+                    self.handle(conn)
+        finally:
+            self.close()
+
+    def close(self):
+        if self._listener is None:
+            return
+        self._listener.close()
+        self._listener = None
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def handle(self, conn):
+        conn.settimeout(REQUEST_TIMEOUT)
+        fds = []
+        try:
+            _, fds, _, _ = socket.recv_fds(conn, 1, 3)
+            request = json.loads(conn.makefile('rb').readline())
+        except (OSError, ValueError):
+            request = None
+        if not request or len(fds) != 3:
+            for fd in fds:
+                os.close(fd)
+            return
+        conn.settimeout(None)
+
+        watcher = DisconnectWatcher(conn)
+        try:
+            with watcher:
+                exit_code = self.run(request, fds)
+        except KeyboardInterrupt:
+            if not watcher.interrupted:
+                raise
+            exit_code = 1
+
+        try:
+            conn.sendall(
+                json.dumps({'exit_code': exit_code}).encode('utf-8') + b'\n'
+            )
+        except OSError:
+            pass
+
+    def run(self, request, fds):
+        """
+        Runs a command with the given stdin, stdout and stderr file
+        descriptors, which are closed afterwards. Returns its exit code.
+        """
+
+        streams = (
+            open(fds[0], 'r'),
+            open(fds[1], 'w'),
+            open(fds[2], 'w', buffering=1),
+        )
+        saved_streams = (sys.stdin, sys.stdout, sys.stderr)
+        saved_cwd = os.getcwd()
+        saved_env = dict(
+            (name, os.environ.get(name)) for name in ('COLUMNS', 'LINES')
+        )
+        try:
+            sys.stdin, sys.stdout, sys.stderr = streams
+            set_terminal_size(request.get('terminal_size'))
+            try:
+                os.chdir(request['cwd'])
+            except OSError as e:
+                sys.stderr.write('Error: {}\n'.format(e))
+                return 1
+            return self.call(request['args'])
+        finally:
+            sys.stdin, sys.stdout, sys.stderr = saved_streams
+            os.chdir(saved_cwd)
+            for name, value in saved_env.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+            for stream in streams:
+                try:
+                    stream.close()
+                except OSError:
+                    pass
+
+    def call(self, args):
+        try:
+            self.command.main(args=args, prog_name='panoptes', obj=self.obj)
+        except SystemExit as e:
+            return exit_status(e.code)
+        except BrokenPipeError:
+            return 1
+        except Exception:
+            traceback.print_exc()
+            return 1
+        return 0
+
+
+class DisconnectWatcher(object):
+    """
+    Interrupts the main thread (as Ctrl-C would) if **conn** is closed by
+    the other end while in use as a context manager.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.interrupted = False
+        self._running = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+
+    def __enter__(self):
+        self._running = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        with self._lock:
+            self._running = False
+        try:
+            # Wakes up the watching thread, so it doesn't outlive the command
+            self.conn.shutdown(socket.SHUT_RD)
+        except OSError:
+            pass
+
+    def _watch(self):
+        try:
+            self.conn.recv(1)
+        except OSError:
+            pass
+        with self._lock:
+            if self._running:
+                self.interrupted = True
+                _thread.interrupt_main()
+
+
+def set_terminal_size(size):
+    # Click and shutil.get_terminal_size() check these before the terminal
+    if size:
+        os.environ['COLUMNS'], os.environ['LINES'] = map(str, size)
+    else:
+        os.environ.pop('COLUMNS', None)
+        os.environ.pop('LINES', None)
+
+
+def exit_status(code):
+    """Returns the exit status for a :py:class:`SystemExit` code."""
+
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    sys.stderr.write('{}\n'.format(code))
+    return 1
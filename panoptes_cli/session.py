@@ -0,0 +1,91 @@
+import socket
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
+
+from panoptes_cli.config import KEEP_ALIVE
+
+KEEP_ALIVE_INTERVAL = 15
+KEEP_ALIVE_PROBES = 4
+# Number of hosts to keep connection pools for
+POOL_CONNECTIONS = 4
+# Retries for failures to connect and, for idempotent methods, to read the
+# response (e.g. from a pooled connection which the server has closed)
+CONNECT_RETRIES = 3
+CONNECT_BACKOFF = 0.5
+
+
+class PooledAdapter(HTTPAdapter):
+    """
+    A :py:class:`requests.adapters.HTTPAdapter` which keeps up to
+    **pool_maxsize** connections open to each host, uses TCP keep-alive on
+    them (after **keep_alive** seconds idle, or not at all if it's 0), and
+    retries requests which fail to connect.
+
+    With **pool_block**, threads wait for a free connection when the pool is
+    in use, rather than opening extra connections which are then thrown
+    away.
+    """
+
+    def __init__(
+        self,
+        keep_alive=KEEP_ALIVE,
+        pool_connections=POOL_CONNECTIONS,
+        max_retries=None,
+        **kwargs
+    ):
+        self.keep_alive = keep_alive
+        if max_retries is None:
+            max_retries = Retry(
+                total=CONNECT_RETRIES,
+                backoff_factor=CONNECT_BACKOFF,
+            )
+        super(PooledAdapter, self).__init__(
+            pool_connections=pool_connections,
+            max_retries=max_retries,
+            **kwargs
+        )
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = keep_alive_options(self.keep_alive)
+        super(PooledAdapter, self).init_poolmanager(*args, **kwargs)
+
+    @property
+    def pool_size(self):
+        return self._pool_maxsize
+
+    def resize(self, pool_size):
+        """
+        Replaces the connection pools with ones holding **pool_size**
+        connections. Connections which are in use are left to finish.
+        """
+
+        self.init_poolmanager(
+            self._pool_connections,
+            pool_size,
+            block=self._pool_block,
+        )
+
+
+def keep_alive_options(keep_alive):
+    """
+    Returns the socket options for connections with TCP keep-alive after
+    **keep_alive** seconds, as far as the platform supports them.
+    """
+
+    options = list(HTTPConnection.default_socket_options)
+    if not keep_alive:
+        return options
+
+    options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+    for name, value in (
+        # TCP_KEEPALIVE is macOS's name for TCP_KEEPIDLE
+        ('TCP_KEEPIDLE', keep_alive),
+        ('TCP_KEEPALIVE', keep_alive),
+        ('TCP_KEEPINTVL', KEEP_ALIVE_INTERVAL),
+        ('TCP_KEEPCNT', KEEP_ALIVE_PROBES),
+    ):
+        if hasattr(socket, name):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return options
@@ -0,0 +1,122 @@
+import datetime
+import json
+import os
+import tempfile
+
+TOKEN_CACHE_FILE = 'token-cache.json'
+# Cached tokens which expire sooner than this are refreshed straight away,
+# rather than part way through a command
+TOKEN_EXPIRY_MARGIN = datetime.timedelta(minutes=5)
+
+
+class TokenCache(object):
+    """
+    Keeps the Panoptes client's OAuth tokens in a file which only the
+    current user can read, so that each run of the CLI doesn't have to log
+    in again. Tokens are kept for each endpoint and username.
+
+    Example::
+
+        cache = TokenCache(os.path.join(config_dir, TOKEN_CACHE_FILE))
+        if not cache.restore(client):
+            ...
+        cache.save(client)
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def restore(self, client):
+        """
+        Gives **client** (a :py:class:`Panoptes` instance with its endpoint
+        and username set, which hasn't logged in yet) the cached tokens for
+        its endpoint and username. Returns True if there were any which
+        haven't expired.
+
+        A token which is about to expire is refreshed. If that fails, the
+        client is left to log in as usual.
+        """
+
+        entry = self._read().get(self._key(client))
+        if not entry:
+            return False
+
+        client.bearer_token = entry['access_token']
+        client.refresh_token = entry.get('refresh_token')
+        client.bearer_expires = datetime.datetime.fromtimestamp(
+            entry['expires']
+        )
+        client.logged_in = True
+        client.logged_in_user_id = entry.get('user_id')
+
+        if (
+            datetime.datetime.now() + TOKEN_EXPIRY_MARGIN
+            < client.bearer_expires
+        ):
+            return True
+
+        # Make the client get a new token, using the refresh token if there
+        # is one, or logging in again if that doesn't work.
+        client.bearer_expires = datetime.datetime.now()
+        if client.refresh_token:
+            try:
+                client.get_bearer_token()
+                return True
+            except Exception:
+                pass
+        client.bearer_token = None
+        client.refresh_token = None
+        client.logged_in = False
+        return False
+
+    def save(self, client):
+        """
+        Saves **client**'s current tokens, if it has any and they've changed.
+        """
+
+        if not client.logged_in or not client.bearer_token:
+            return
+        key = self._key(client)
+        tokens = self._read()
+        entry = {
+            'access_token': client.bearer_token,
+            'refresh_token': getattr(client, 'refresh_token', None),
+            'expires': client.bearer_expires.timestamp(),
+            'user_id': client.logged_in_user_id,
+        }
+        if tokens.get(key) == entry:
+            return
+        tokens[key] = entry
+        self._write(tokens)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _key(self, client):
+        return '{} {}'.format(client.endpoint, client.username)
+
+    def _read(self):
+        try:
+            with open(self.path) as cache_f:
+                tokens = json.load(cache_f)
+        except (IOError, ValueError):
+            return {}
+        return tokens if isinstance(tokens, dict) else {}
+
+    def _write(self, tokens):
+        cache_dir = os.path.dirname(self.path)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir, mode=0o700)
+        # mkstemp creates the file readable only by the current user, and
+        # replacing the old file means it's never partly written
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix='.tokens-')
+        try:
+            with os.fdopen(fd, 'w') as tmp_f:
+                json.dump(tokens, tmp_f)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
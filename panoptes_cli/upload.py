@@ -0,0 +1,278 @@
+import queue
+import sqlite3
+import threading
+import time
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+
+from panoptes_cli.media_cache import media_hash
+from panoptes_cli.session import PooledAdapter
+from panoptes_client import Subject
+from panoptes_client.subject import RETRY_BACKOFF_INTERVAL, UPLOAD_RETRY_LIMIT
+
+DEFAULT_CONCURRENCY = 5
+MEDIA_QUEUE_PER_WORKER = 4
+
+
+class UploadEngine(object):
+    """
+    Creates subjects and uploads their media using two separate pools of
+    worker threads: one which builds subjects and creates them through the
+    API, and one which PUTs media to the signed URLs returned by the API.
+
+    Each pool can be sized independently, so a slow API doesn't leave the
+    uplink idle and vice versa. The media queue is bounded, so if media
+    uploads fall behind, creation workers wait for space rather than reading
+    more files into memory.
+
+    If a :py:class:`MediaCache` is given, each new subject is recorded in it.
+    With **skip_existing**, rows whose media is already in the cache for this
+    project aren't uploaded again; their futures resolve straight away to
+    the existing subject's ID.
+
+    Use as a context manager so both pools are shut down when finished::
+
+        with UploadEngine(client, project_id, concurrency=10) as engine:
+            future = engine.submit((0, (['image.png'], {'name': 'one'})))
+            subject_id = future.result()
+    """
+
+    def __init__(
+        self,
+        client,
+        project_id,
+        concurrency=DEFAULT_CONCURRENCY,
+        media_concurrency=None,
+        media_cache=None,
+        skip_existing=False,
+    ):
+        self.client = client
+        self.project_id = project_id
+        self.media_cache = media_cache
+        self.skip_existing = skip_existing
+        if not media_concurrency:
+            media_concurrency = concurrency * 2
+        self._create_exec = ThreadPoolExecutor(max_workers=concurrency)
+        self._media_exec = ThreadPoolExecutor(max_workers=media_concurrency)
+        self._media_slots = threading.BoundedSemaphore(
+            media_concurrency * MEDIA_QUEUE_PER_WORKER
+        )
+        # Shared by the media pool so connections to the storage host are
+        # kept open between uploads, rather than made anew for each file
+        self._media_session = requests.Session()
+        media_adapter = PooledAdapter(pool_maxsize=media_concurrency)
+        self._media_session.mount('https://', media_adapter)
+        self._media_session.mount('http://', media_adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def shutdown(self):
+        self._create_exec.shutdown()
+        self._media_exec.shutdown()
+        self._media_session.close()
+
+    def submit(self, subject_row):
+        """
+        Queues a manifest row to be uploaded. Returns a
+        :py:class:`concurrent.futures.Future` which resolves to the new
+        subject's ID once it has been created and all of its media has been
+        uploaded.
+        """
+
+        future = Future()
+        self._create_exec.submit(self._create, subject_row, future)
+        return future
+
+    def _create(self, subject_row, future):
+        if not future.set_running_or_notify_cancel():
+            return
+
+        try:
+            row_number, (files, metadata) = subject_row
+            with self.client:
+                subject = Subject()
+                subject.links.project = self.project_id
+                for media_file in files:
+                    subject.add_location(media_file)
+                subject.metadata.update(metadata)
+
+                # Media is uploaded by the media pool rather than by
+                # Subject.save(), so hold on to it until we have the URLs.
+                media_files = take_media_files(subject)
+                subject_hash = None
+                if self.media_cache and media_files is not None:
+                    subject_hash = media_hash(subject.locations, media_files)
+                    if self.skip_existing:
+                        subject_id = self.media_cache.find(
+                            self.project_id,
+                            subject_hash,
+                        )
+                        if subject_id and subject_exists(subject_id):
+                            future.set_result(subject_id)
+                            return
+                        if subject_id:
+                            # Deleted since it was cached, so upload it again
+                            self.media_cache.remove([subject_id])
+                subject.save(client=self.client)
+        except Exception as e:
+            future.set_exception(e)
+            return
+
+        uploads = []
+        for location, media_data in zip(subject.locations, media_files or []):
+            if not media_data:
+                continue
+            for media_type, url in location.items():
+                uploads.append((url, media_data, media_type))
+
+        if not uploads:
+            self._finish(future, subject, subject_hash)
+            return
+
+        lock = threading.Lock()
+        remaining = [len(uploads)]
+
+        def upload_done(upload_future):
+            self._media_slots.release()
+            with lock:
+                remaining[0] -= 1
+                if future.done():
+                    return
+                if upload_future.exception() is not None:
+                    future.set_exception(upload_future.exception())
+                elif remaining[0] == 0:
+                    self._finish(future, subject, subject_hash)
+
+        for upload in uploads:
+            self._media_slots.acquire()
+            self._media_exec.submit(
+                self._upload_media,
+                subject,
+                *upload
+            ).add_done_callback(upload_done)
+
+    def _finish(self, future, subject, subject_hash):
+        if self.media_cache and subject_hash is not None:
+            try:
+                self.media_cache.add(self.project_id, subject_hash, subject.id)
+            except sqlite3.Error:
+                # The subject was created, which is what matters. It just
+                # won't be recognised by later uploads.
+                pass
+        future.set_result(subject.id)
+
+    def _upload_media(self, subject, url, media_data, media_type):
+        attempt = 1
+        while True:
+            try:
+                response = self._media_session.put(
+                    url,
+                    headers={
+                        'Content-Type': media_type,
+                        'x-ms-blob-type': 'BlockBlob',
+                    },
+                    data=media_data,
+                )
+                response.raise_for_status()
+                return response
+            except requests.exceptions.RequestException:
+                if attempt >= UPLOAD_RETRY_LIMIT:
+                    raise
+                attempt += 1
+                time.sleep(RETRY_BACKOFF_INTERVAL)
+
+
+class UploadTracker(object):
+    """
+    Keeps track of subjects which are being uploaded in the background, keyed
+    by their manifest row number.
+
+    Finished uploads are reported through a queue fed by each future's done
+    callback, so waiting for a slot to free up costs nothing while uploads are
+    in progress and handling each completion is O(1).
+    """
+
+    def __init__(self):
+        self._in_flight = {}
+        self._done = queue.Queue()
+
+    def __len__(self):
+        return len(self._in_flight)
+
+    def add(self, future, subject_row):
+        """
+        Tracks a future which resolves to the ID of the subject created from
+        **subject_row**.
+        """
+
+        row_number = subject_row[0]
+        self._in_flight[row_number] = (subject_row, future)
+        future.add_done_callback(lambda _: self._done.put(row_number))
+
+    def wait(self, limit):
+        """
+        Blocks until no more than **limit** subjects are still in flight.
+        Yields ``(subject_id, subject_row)`` for each subject which finished
+        uploading in the meantime. If an upload failed, its exception is
+        raised and the row stays in flight.
+        """
+
+        while len(self._in_flight) > limit:
+            row_number = self._done.get()
+            subject_row, future = self._in_flight[row_number]
+            subject_id = future.result()
+            del self._in_flight[row_number]
+            yield subject_id, subject_row
+
+    def drain(self):
+        """
+        Yields ``(subject_id, subject_row)`` for every subject which has
+        already finished uploading successfully, without blocking. Failed
+        uploads are left in flight.
+        """
+
+        while True:
+            try:
+                row_number = self._done.get_nowait()
+            except queue.Empty:
+                return
+            subject_row, future = self._in_flight[row_number]
+            if future.exception() is None:
+                del self._in_flight[row_number]
+                yield future.result(), subject_row
+
+
+def subject_exists(subject_id):
+    subject_id = str(subject_id)
+    return any(
+        subject.id == subject_id
+        for subject in Subject.where(id=subject_id, page_size=1)
+    )
+
+
+def take_media_files(subject):
+    """
+    Takes the content of the local files added to **subject** with
+    :py:meth:`Subject.add_location`, so that :py:meth:`Subject.save` doesn't
+    upload them itself. Returns a list with an entry (None for remote media)
+    for each of the subject's locations.
+
+    panoptes_client keeps these in a private attribute. If that isn't there,
+    returns None and leaves the subject alone, so ``save()`` still uploads
+    its media (without the media pool or the media cache).
+    """
+
+    media_files = getattr(subject, '_media_files', None)
+    if (
+        not isinstance(media_files, list)
+        or len(media_files) != len(subject.locations)
+    ):
+        return None
+    subject._media_files = [None] * len(media_files)
+    return media_files
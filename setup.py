@@ -17,14 +17,16 @@ setup(
     packages=find_packages(),
     include_package_data=True,
     install_requires=[
-        'Click>=6.7,<8.2',
+        'Click>=7.0,<8.2',
         'PyYAML>=5.1,<6.1',
         'panoptes-client>=1.7,<2.0',
         'humanize>=0.5.1,<4.8',
-        'pathvalidate>=0.29.0,<2.6',
     ],
+    extras_require={
+        'convert': ['pyarrow>=7'],
+    },
     entry_points='''
         [console_scripts]
-        panoptes=panoptes_cli.scripts.panoptes:cli
+        panoptes=panoptes_cli.forward:main
     ''',
 )